@@ -0,0 +1,115 @@
+"""Checks that slow database writes don't stall the event loop.
+
+A storage that sleeps on every write stands in for a slow disk. While a burst
+of votes is written, a ticker coroutine (standing in for the gateway
+heartbeat) and a stream of lookups (standing in for other commands) keep
+running. The report compares calling the database directly on the event loop
+against going through AsyncDatabase.
+
+Usage: python -m benchmarks.event_loop_latency [write delay in seconds]
+"""
+import asyncio
+import sys
+import time
+
+from tinydb.storages import MemoryStorage
+
+from bot.async_database import AsyncDatabase
+from bot.database import Database
+
+VOTES = 50
+TICK = 0.01
+
+
+class SlowStorage(MemoryStorage):
+    delay = 0.05
+
+    def write(self, data):
+        time.sleep(self.delay)
+        super().write(data)
+
+
+async def ticker(stop):
+    """Returns the longest gap between two ticks that should be TICK apart."""
+
+    worst = 0.0
+    last = time.perf_counter()
+
+    while not stop.is_set():
+        await asyncio.sleep(TICK)
+        now = time.perf_counter()
+        worst = max(worst, now - last - TICK)
+        last = now
+
+    return worst
+
+
+async def lookups(database, stop):
+    """Returns the slowest of a stream of VN lookups made during the burst."""
+
+    worst = 0.0
+
+    while not stop.is_set():
+        start = time.perf_counter()
+        if isinstance(database, AsyncDatabase):
+            await database.find_vn(name="benchmark")
+        else:
+            database.find_vn(name="benchmark")
+        worst = max(worst, time.perf_counter() - start)
+        await asyncio.sleep(TICK)
+
+    return worst
+
+
+async def burst(database, vn_id):
+    for member_id in range(VOTES):
+        if isinstance(database, AsyncDatabase):
+            await database.set_rating(member_id, vn_id, 1)
+        else:
+            database.set_rating(member_id, vn_id, 1)
+            await asyncio.sleep(0)
+
+
+async def run(database, vn_id):
+    stop = asyncio.Event()
+    tick = asyncio.ensure_future(ticker(stop))
+    lookup = asyncio.ensure_future(lookups(database, stop))
+
+    start = time.perf_counter()
+    await burst(database, vn_id)
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    return elapsed, await tick, await lookup
+
+
+def open_database():
+    database = Database(None, storage=SlowStorage)
+    vn_id = database.insert_vn({"name": "benchmark", "abbreviations": [], "message_id": None})
+    return database, vn_id
+
+
+async def main():
+    if len(sys.argv) > 1:
+        SlowStorage.delay = float(sys.argv[1])
+
+    print(f"{VOTES} votes with {SlowStorage.delay * 1000:.0f}ms per write\n")
+    print(f"{'mode':>8} {'burst':>9} {'worst tick delay':>17} {'worst lookup':>13}")
+
+    database, vn_id = open_database()
+    elapsed, tick, lookup = await run(database, vn_id)
+    print(f"{'direct':>8} {elapsed:>8.2f}s {tick * 1000:>15.1f}ms {lookup * 1000:>11.1f}ms")
+
+    database, vn_id = open_database()
+    async_database = AsyncDatabase(database)
+    elapsed, tick, lookup = await run(async_database, vn_id)
+    print(f"{'async':>8} {elapsed:>8.2f}s {tick * 1000:>15.1f}ms {lookup * 1000:>11.1f}ms")
+
+    for line in async_database.stats()[1:]:
+        print(line)
+
+    async_database.close()
+
+
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(main())
@@ -0,0 +1,260 @@
+"""In-process stand-ins for the parts of discord.py the bot uses.
+
+Every call that would hit the Discord API sleeps for the configured latency
+and is counted by route, so benchmarks can run the real cog code without a
+server. Only what the bot actually calls is implemented.
+"""
+import asyncio
+import datetime
+import itertools
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+import discord
+
+from bot.sessions import Sessions
+
+_ids = itertools.count(10 ** 17)
+
+
+def snowflake():
+    return next(_ids)
+
+
+def not_found():
+    return discord.NotFound(SimpleNamespace(status=404, reason="Not Found"), "Unknown Message")
+
+
+class FakeAPI:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+
+    async def call(self, route):
+        self.calls[route] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+
+class FakeUser:
+    def __init__(self, user_id=None, name="member"):
+        self.id = user_id or snowflake()
+        self.name = name
+
+    def __str__(self):
+        return f"{self.name}#{self.id % 10000:04}"
+
+
+class FakeReaction:
+    def __init__(self, message, emoji, me=False, users=()):
+        self.message = message
+        self.emoji = emoji
+        self.me = me
+        self.reacted = list(users)
+
+    @property
+    def count(self):
+        return len(self.reacted) + self.me
+
+    async def users(self):
+        for page in range(0, max(len(self.reacted), 1), 100):
+            await self.message.channel.api.call("GET /channels/{channel_id}/messages/{message_id}/reactions/{emoji}")
+            for user in self.reacted[page:page + 100]:
+                yield user
+
+
+class FakeMessage:
+    def __init__(self, channel, author, content=None, embed=None, message_id=None):
+        self.id = message_id or snowflake()
+        self.channel = channel
+        self.author = author
+        self.content = content
+        self.embeds = [embed] if embed else []
+        self.reactions = []
+        self.created_at = datetime.datetime.utcnow()
+
+    async def edit(self, *, content=None, embed=None):
+        await self.channel.api.call("PATCH /channels/{channel_id}/messages/{message_id}")
+        if content is not None:
+            self.content = content
+        if embed is not None:
+            self.embeds = [embed]
+
+    async def delete(self):
+        await self.channel.api.call("DELETE /channels/{channel_id}/messages/{message_id}")
+        if self.channel.messages.pop(self.id, None) is None:
+            raise not_found()
+
+    def reaction(self, emoji):
+        for reaction in self.reactions:
+            if reaction.emoji == emoji:
+                return reaction
+
+        reaction = FakeReaction(self, emoji)
+        self.reactions.append(reaction)
+        return reaction
+
+    async def add_reaction(self, emoji):
+        await self.channel.api.call("PUT /channels/{channel_id}/messages/{message_id}/reactions/{emoji}/@me")
+        self.reaction(emoji).me = True
+
+    async def remove_reaction(self, emoji, member):
+        await self.channel.api.call("DELETE /channels/{channel_id}/messages/{message_id}/reactions/{emoji}/{member_id}")
+        reaction = self.reaction(str(getattr(emoji, "name", emoji)))
+        if member in reaction.reacted:
+            reaction.reacted.remove(member)
+
+    async def clear_reactions(self):
+        await self.channel.api.call("DELETE /channels/{channel_id}/messages/{message_id}/reactions")
+        self.reactions.clear()
+
+    async def publish(self):
+        await self.channel.api.call("POST /channels/{channel_id}/messages/{message_id}/crosspost")
+
+
+class FakePartialMessage:
+    def __init__(self, channel, message_id):
+        self.channel = channel
+        self.id = message_id
+
+    def _message(self):
+        message = self.channel.messages.get(self.id)
+        if message is None:
+            raise not_found()
+        return message
+
+    async def edit(self, **kwargs):
+        await self._message().edit(**kwargs)
+
+    async def delete(self):
+        await self._message().delete()
+
+    async def remove_reaction(self, emoji, member):
+        await self._message().remove_reaction(emoji, member)
+
+
+class FakeChannel:
+    def __init__(self, api, bot_user, name="channel"):
+        self.id = snowflake()
+        self.api = api
+        self.bot_user = bot_user
+        self.name = name
+        self.messages = {}
+
+    def __str__(self):
+        return self.name
+
+    def add_message(self, embed=None, message_id=None):
+        """Puts a message in the channel without going through the API, for seeding."""
+
+        message = FakeMessage(self, self.bot_user, embed=embed, message_id=message_id)
+        self.messages[message.id] = message
+        return message
+
+    async def send(self, content=None, *, embed=None, file=None, allowed_mentions=None):
+        await self.api.call("POST /channels/{channel_id}/messages")
+        message = FakeMessage(self, self.bot_user, content=content, embed=embed)
+        self.messages[message.id] = message
+        return message
+
+    def get_partial_message(self, message_id):
+        return FakePartialMessage(self, message_id)
+
+    async def fetch_message(self, message_id):
+        await self.api.call("GET /channels/{channel_id}/messages/{message_id}")
+        message = self.messages.get(message_id)
+        if message is None:
+            raise not_found()
+        return message
+
+    async def history(self, limit=None):
+        messages = sorted(self.messages.values(), key=lambda message: message.id, reverse=True)[:limit]
+
+        for page in range(0, len(messages), 100):
+            await self.api.call("GET /channels/{channel_id}/messages")
+            for message in messages[page:page + 100]:
+                yield message
+
+    async def delete_messages(self, messages):
+        await self.api.call("POST /channels/{channel_id}/messages/bulk-delete")
+        for message in messages:
+            self.messages.pop(message.id, None)
+
+
+class FakeGuild:
+    def __init__(self, members=()):
+        self.id = snowflake()
+        self._members = {member.id: member for member in members}
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    def get_member(self, member_id):
+        return self._members.get(member_id)
+
+
+class FakeBot:
+    """Carries the settings and objects the VisualNovels cog reads from FVNBot."""
+
+    def __init__(self, *, api, database_path, metrics, backend="tinydb", database_format="json",
+                 rating_journal=False, flush_interval=None, flush_writes=None, rating_edit_delay=0.05):
+        self.api = api
+        self.loop = asyncio.get_event_loop()
+        self.started = time.perf_counter()
+        self.startup_phases = {}
+        self.user = FakeUser(name="FVN Bot")
+        self.guild = FakeGuild()
+        self.metrics = metrics
+        self.log = SimpleNamespace(info=lambda *args: None)
+
+        self.database_path = database_path
+        self.database_backend = backend
+        self.database_format = database_format
+        self.database_flush_interval = flush_interval
+        self.database_flush_writes = flush_writes
+        self.rating_journal = rating_journal
+        self.rating_journal_compact_size = 1024 * 1024
+        self.rating_edit_delay = rating_edit_delay
+        self.leaderboard_interval = 300.0
+        self.import_post_interval = 0.0
+
+        # Nobody answers the bot's questions during benchmarks, so no conversation is let to start.
+        self.sessions = Sessions(limit=0)
+
+        self.channels = {
+            name: FakeChannel(api, self.user, name)
+            for name in ("vn_list", "vn_undetermined", "vn_news", "top10", "logs", "bot_spam")
+        }
+
+    def record_startup(self, phase, seconds):
+        self.startup_phases[phase] = seconds
+
+    async def wait_until_ready(self):
+        # The benchmarks never become "ready", which keeps the leaderboard loop idle.
+        await asyncio.get_event_loop().create_future()
+
+
+class FakeContext:
+    def __init__(self, bot, author=None):
+        self.bot = bot
+        self.author = author or FakeUser()
+        self.channel = bot.channels["bot_spam"]
+        self.replies = []
+
+    async def reply(self, content=None, *, embed=None):
+        self.replies.append(content)
+        return await self.channel.send(content, embed=embed)
+
+    async def send(self, content=None, *, embed=None):
+        return await self.reply(content, embed=embed)
+
+
+def reaction_payload(channel, message_id, member, emoji):
+    return SimpleNamespace(
+        channel_id=channel.id,
+        message_id=message_id,
+        member=member,
+        emoji=SimpleNamespace(name=emoji),
+    )
@@ -0,0 +1,95 @@
+"""Measures the `votes` command for a member with thousands of votes.
+
+The old path searched the rating table and then looked every voted VN up in
+stock TinyDB, one `get` per vote. The new one reads the names from the
+in-memory index and lays the result out over size-checked pages. Both run on
+top of TinyDB's MemoryStorage.
+
+Usage: python -m benchmarks.member_votes [votes ...]
+"""
+import random
+import sys
+import time
+
+import tinydb
+from tinydb import Query
+from tinydb.storages import MemoryStorage
+
+from bot.database import Database
+from bot.helpers import TABLE_VISUAL_NOVEL, TABLE_RATING
+from bot.pages import build_pages
+
+DEFAULT_VOTES = [1_000, 2_000, 5_000]
+MEMBER_ID = 1
+RUNS = 5
+
+
+def synthetic_tables(votes):
+    return {
+        TABLE_VISUAL_NOVEL: {
+            str(doc_id): {"name": f"Visual Novel {doc_id}", "abbreviations": [f"vn{doc_id}"], "message_id": doc_id}
+            for doc_id in range(1, votes + 1)
+        },
+        TABLE_RATING: {
+            str(doc_id): {"member_id": MEMBER_ID, "vn_id": doc_id, "rating": random.choice((1, -1))}
+            for doc_id in range(1, votes + 1)
+        },
+    }
+
+
+def old_votes(db):
+    Rating = Query()
+    upvoted = []
+    downvoted = []
+
+    for document in db.table(TABLE_RATING).search(Rating.member_id == MEMBER_ID):
+        name = db.table(TABLE_VISUAL_NOVEL).get(doc_id=document["vn_id"])["name"]
+        if document["rating"] == 1:
+            upvoted.append(name)
+        else:
+            downvoted.append(name)
+
+    return upvoted, downvoted
+
+
+def new_votes(db):
+    votes = db.member_votes(MEMBER_ID)
+
+    upvoted = [name for name, rating in votes if rating == 1]
+    downvoted = [name for name, rating in votes if rating == -1]
+
+    return build_pages("Ratings by user", [("👍 Upvoted", upvoted), ("👎 Downvoted", downvoted)])
+
+
+def time_runs(function, db):
+    start = time.perf_counter()
+
+    for _ in range(RUNS):
+        result = function(db)
+
+    return (time.perf_counter() - start) / RUNS, result
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1:]] or DEFAULT_VOTES
+
+    print(f"{'votes':>8} {'old':>12} {'new':>12} {'pages':>6}")
+
+    for size in sizes:
+        tables = synthetic_tables(size)
+
+        stock = tinydb.TinyDB(storage=MemoryStorage)
+        stock.storage.write(tables)
+
+        db = Database(None, storage=MemoryStorage)
+        db.tinydb.storage.write(tables)
+        db.build_indexes()
+
+        old, _ = time_runs(old_votes, stock)
+        new, pages = time_runs(new_votes, db)
+
+        print(f"{size:>8} {old * 1000:>9.2f} ms {new * 1000:>9.2f} ms {len(pages):>6}")
+
+
+if __name__ == "__main__":
+    main()
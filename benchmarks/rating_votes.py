@@ -0,0 +1,81 @@
+"""Measures the cost of a single vote as the rating table grows.
+
+Both the old query based upsert and the indexed Database path are run on top
+of TinyDB's MemoryStorage, so the numbers show the lookup and update work done
+by the bot and not the time spent writing the JSON file.
+
+Usage: python -m benchmarks.rating_votes [size ...]
+"""
+import random
+import sys
+import time
+
+import tinydb
+from tinydb import Query
+from tinydb.storages import MemoryStorage
+
+from bot.database import Database
+from bot.helpers import TABLE_RATING
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+VN_COUNT = 1_000
+
+
+def synthetic_ratings(size):
+    members = max(size // VN_COUNT, 1)
+    return {
+        str(doc_id): {"member_id": doc_id // VN_COUNT, "vn_id": doc_id % VN_COUNT + 1, "rating": random.choice((1, -1))}
+        for doc_id in range(1, size + 1)
+    }, members
+
+
+def time_votes(vote, members, votes):
+    start = time.perf_counter()
+
+    for _ in range(votes):
+        vote(random.randrange(members * 2), random.randrange(1, VN_COUNT + 1), random.choice((1, -1)))
+
+    return (time.perf_counter() - start) / votes
+
+
+def bench_query(ratings, members, votes):
+    db = tinydb.TinyDB(storage=MemoryStorage)
+    db.storage.write({TABLE_RATING: dict(ratings)})
+    table = db.table(TABLE_RATING)
+    Rating = Query()
+
+    def vote(member_id, vn_id, rating):
+        query = (Rating.member_id == member_id) & (Rating.vn_id == vn_id)
+        table.get(query)
+        table.upsert({"member_id": member_id, "vn_id": vn_id, "rating": rating}, query)
+
+    return time_votes(vote, members, votes)
+
+
+def bench_indexed(ratings, members, votes):
+    db = Database(None, storage=MemoryStorage)
+    db.tinydb.storage.write({TABLE_RATING: dict(ratings)})
+    db.build_indexes()
+
+    # The first insert looks up the highest doc_id once, keep it out of the timing.
+    db.set_rating(-1, 1, 1)
+
+    return time_votes(db.set_rating, members, votes)
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1:]] or DEFAULT_SIZES
+
+    print(f"{'ratings':>10} {'query upsert':>14} {'indexed':>10}")
+
+    for size in sizes:
+        ratings, members = synthetic_ratings(size)
+
+        query = bench_query(ratings, members, votes=5)
+        indexed = bench_indexed(ratings, members, votes=10_000)
+
+        print(f"{size:>10} {query * 1000:>11.3f} ms {indexed * 1_000_000:>7.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""Replays events recorded with FVNBOT_RECORD_PATH against a copy of the database.
+
+The reactions, commands and leaves in the log are fed to the VisualNovels
+cog in the order they were recorded, on top of the fake Discord layer. They
+go at the recorded pace times `--speed`, or as fast as possible with
+`--speed 0`. Gaps longer than `--max-gap` seconds, like the bot being down,
+are cut short. Events are handed over one at a time, so a replay always
+ends in the same state.
+
+Afterwards, the votes of every VN are checked against what the recorded
+stream implies on top of the starting database. The script exits with an
+error if they don't match. Only `search` and `votes` are replayed among the
+commands, the others need input nobody recorded or change more than votes.
+
+Usage: python -m benchmarks.replay events.jsonl database.json [--speed 1] [--latency 0.05]
+           [--backend tinydb|sqlite] [--journal] [--flush-interval SECONDS] [--max-gap 5]
+           [--profile replay.prof]
+"""
+import argparse
+import asyncio
+import cProfile
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+from benchmarks.fake_discord import FakeAPI, FakeBot, FakeContext, FakeUser
+from bot.cogs.visual_novels import VisualNovels, VOTES
+from bot.metrics import Metrics
+from bot.recorder import CHANNELS, REACTION, COMMAND, LEAVE, read_events
+from bot.sessions import SessionError
+
+# Every file a database can be spread over, next to its main file.
+DATABASE_SUFFIXES = ("", ".snapshot", ".journal", "-wal")
+
+MENTION = re.compile(r"<@!?(\d+)>|(\d+)$")
+
+
+def copy_database(path, directory):
+    copy = os.path.join(directory, os.path.basename(path))
+
+    for suffix in DATABASE_SUFFIXES:
+        if os.path.exists(path + suffix):
+            shutil.copy(path + suffix, copy + suffix)
+
+    return copy
+
+
+def vote_totals(votes):
+    totals = {}
+
+    for (_, vn_id), rating in votes.items():
+        up, down = totals.get(vn_id, (0, 0))
+        totals[vn_id] = (up + (rating == 1), down + (rating == -1))
+
+    return totals
+
+
+class Replay:
+    def __init__(self, cog, bot, bot_id):
+        self.cog = cog
+        self.bot = bot
+        self.bot_id = bot_id
+
+        self.members = {}
+        self.vn_by_message = {}
+        self.expected = {}
+        self.counts = Counter()
+
+    async def prepare(self):
+        """Puts the list messages of the database in the fake channels and notes the starting votes."""
+
+        channels = {channel.id: channel for channel in self.bot.channels.values()}
+
+        for vn in await self.cog.db.all_vns():
+            if not vn.get("message_id"):
+                continue
+
+            channel = channels.get(vn.get("channel_id"))
+            if channel is None:
+                channel = self.bot.channels["vn_undetermined" if vn["undetermined"] else "vn_list"]
+
+            channel.add_message(message_id=vn["message_id"])
+            self.vn_by_message[(channel.id, vn["message_id"])] = vn.doc_id
+
+        for rating in await self.cog.db.all_ratings():
+            self.expected[(rating["member_id"], rating["vn_id"])] = rating["rating"]
+
+    def member(self, member_id):
+        if member_id == self.bot_id:
+            return self.bot.user
+
+        if member_id not in self.members:
+            self.members[member_id] = FakeUser(member_id)
+
+        return self.members[member_id]
+
+    async def reaction(self, channel_id, message_id, member_id, emoji):
+        payload = SimpleNamespace(
+            channel_id=channel_id,
+            message_id=message_id,
+            member=self.member(member_id),
+            emoji=SimpleNamespace(name=emoji),
+        )
+        await self.cog.on_raw_reaction_add(payload)
+
+        vn_id = self.vn_by_message.get((channel_id, message_id))
+
+        if member_id == self.bot_id or vn_id is None or emoji not in VOTES:
+            return
+
+        if VOTES[emoji] is None:
+            self.expected.pop((member_id, vn_id), None)
+        else:
+            self.expected[(member_id, vn_id)] = VOTES[emoji]
+
+    async def command(self, channel_id, author_id, command, arguments):
+        ctx = FakeContext(self.bot, author=self.member(author_id))
+
+        # Commands are called unbound, the cog isn't added to a bot.
+        if command == "search" and arguments:
+            try:
+                await self.cog.search.callback(self.cog, ctx, name=arguments)
+            except SessionError:
+                # The bot would ask which of the closest VNs was meant.
+                self.counts["unanswered questions"] += 1
+        elif command == "votes":
+            mention = MENTION.match(arguments)
+            member = self.member(int(mention.group(1) or mention.group(2))) if mention else None
+            await self.cog.votes.callback(self.cog, ctx, member)
+        else:
+            self.counts["skipped commands"] += 1
+
+    async def leave(self, member_id):
+        # Votes of the member still queued would otherwise land after their removal.
+        await self.cog.reactions.join()
+        await self.cog.remove_leavers([member_id])
+
+        for key in [key for key in self.expected if key[0] == member_id]:
+            del self.expected[key]
+
+    async def run(self, events, speed, max_gap):
+        handlers = {REACTION: self.reaction, COMMAND: self.command, LEAVE: self.leave}
+
+        start = time.perf_counter()
+        offset = 0.0
+        previous = None
+
+        for recorded_at, kind, *event in events:
+            if kind not in handlers:
+                continue
+
+            if previous is not None:
+                offset += min(recorded_at - previous, max_gap)
+            previous = recorded_at
+
+            if speed:
+                delay = start + offset / speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            await handlers[kind](*event)
+            self.counts[kind] += 1
+
+        await self.cog.reactions.join()
+        while self.cog.rating_edits.tasks:
+            await asyncio.sleep(0.01)
+
+        return time.perf_counter() - start
+
+    async def check(self):
+        """Returns the VNs whose votes differ from the recorded stream, with the expected and actual totals."""
+
+        actual = {}
+        for rating in await self.cog.db.all_ratings():
+            actual[(rating["member_id"], rating["vn_id"])] = rating["rating"]
+
+        expected_totals = vote_totals(self.expected)
+        actual_totals = vote_totals(actual)
+        cached_totals = {vn_id: self.cog.db.ratings.get(vn_id) for vn_id in expected_totals.keys() | actual_totals.keys()}
+
+        mismatches = {}
+
+        for vn_id in sorted(cached_totals):
+            expected = expected_totals.get(vn_id, (0, 0))
+            stored = actual_totals.get(vn_id, (0, 0))
+            cached = tuple(cached_totals[vn_id])
+
+            if expected != stored or expected != cached:
+                mismatches[vn_id] = (expected, stored, cached)
+
+        return mismatches
+
+
+async def replay(args, events, database_path):
+    header = next((event for event in events if event[1] == CHANNELS), None)
+    if header is None:
+        sys.exit("The log has no channel list, it needs to include the bot logging in.")
+
+    _, _, bot_id, channel_ids = header
+
+    api = FakeAPI(latency=args.latency)
+    bot = FakeBot(
+        api=api,
+        database_path=database_path,
+        metrics=Metrics(),
+        backend=args.backend,
+        rating_journal=args.journal,
+        flush_interval=args.flush_interval,
+    )
+    bot.user.id = bot_id
+
+    for name, channel_id in channel_ids.items():
+        if name in bot.channels:
+            bot.channels[name].id = channel_id
+
+    cog = VisualNovels(bot)
+    await cog.warmed_up.wait()
+    replayer = Replay(cog, bot, bot_id)
+    await replayer.prepare()
+
+    elapsed = await replayer.run(events, args.speed, args.max_gap)
+    mismatches = await replayer.check()
+
+    await cog.db.flush()
+    cog.cog_unload()
+
+    print(f"Replayed in {elapsed:.2f}s:")
+    for kind, name in ((REACTION, "reactions"), (COMMAND, "commands"), (LEAVE, "leaves")):
+        print(f"  {name:<20} {replayer.counts[kind]:>8} ({replayer.counts[kind] / elapsed:.1f}/s)")
+    print(f"  {'skipped commands':<20} {replayer.counts['skipped commands']:>8}")
+    print(f"  {'unanswered questions':<20} {replayer.counts['unanswered questions']:>8}")
+
+    print("\nMetrics:")
+    for line in bot.metrics.summary() + cog.reactions.stats():
+        print(f"  {line}")
+
+    print("\nDiscord API calls:")
+    for route, calls in api.calls.most_common():
+        print(f"  {calls:>8} {route}")
+
+    if mismatches:
+        print(f"\n{len(mismatches)} VN(s) don't match the recorded votes (expected, stored, cached):")
+        for vn_id, (expected, stored, cached) in list(mismatches.items())[:20]:
+            print(f"  VN {vn_id}: {expected} {stored} {cached}")
+        return False
+
+    print("\nThe votes of every VN match the recorded stream.")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replays recorded events against a copy of the database.")
+    parser.add_argument("events", help="a log written with FVNBOT_RECORD_PATH")
+    parser.add_argument("database", help="the database the recording started from, it's left untouched")
+    parser.add_argument("--speed", type=float, default=1.0, help="a multiple of the recorded pace, 0 for no pauses")
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated API latency in seconds")
+    parser.add_argument("--backend", choices=("tinydb", "sqlite"), default="tinydb")
+    parser.add_argument("--journal", action="store_true", help="use the rating journal")
+    parser.add_argument("--flush-interval", type=float, help="flush the database on this interval instead of after every write")
+    parser.add_argument("--max-gap", type=float, default=5.0, help="longest pause between events, in seconds")
+    parser.add_argument("--profile", help="write cProfile stats of the replay to this file")
+    args = parser.parse_args()
+
+    events = list(read_events(args.events))
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_path = copy_database(args.database, directory)
+        loop = asyncio.get_event_loop()
+
+        profiler = cProfile.Profile() if args.profile else None
+        if profiler:
+            profiler.enable()
+
+        matched = loop.run_until_complete(replay(args, events, database_path))
+
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+
+    sys.exit(0 if matched else 1)
+
+
+if __name__ == "__main__":
+    main()
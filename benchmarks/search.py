@@ -0,0 +1,70 @@
+"""Measures fuzzy VN searches as the number of VNs grows.
+
+Queries are prefixes, misspellings and abbreviations of random VNs, run
+against the in-memory trigram index.
+
+Usage: python -m benchmarks.search [vns ...]
+"""
+import random
+import string
+import sys
+import time
+
+from tinydb.table import Document
+
+from bot.search import SearchIndex
+
+DEFAULT_SIZES = [1_000, 10_000]
+QUERIES = 2_000
+SYLLABLES = [consonant + vowel for consonant in "bdfghklmnprstvwz" for vowel in "aeiou"]
+
+
+def synthetic_vns(size):
+    vns = []
+    authors = ["".join(random.sample(SYLLABLES, 3)) for _ in range(size // 10 + 1)]
+
+    for doc_id in range(1, size + 1):
+        words = ["".join(random.sample(SYLLABLES, random.randint(2, 4))) for _ in range(random.randint(1, 4))]
+        name = " ".join(words)
+        abbreviation = "".join(word[0] for word in words) + str(doc_id)
+        vns.append(Document({"name": name, "abbreviations": [abbreviation], "authors": [random.choice(authors)]}, doc_id))
+
+    return vns
+
+
+def misspell(text):
+    position = random.randrange(len(text))
+    return text[:position] + random.choice(string.ascii_lowercase) + text[position + 1:]
+
+
+def queries(vns):
+    for _ in range(QUERIES):
+        vn = random.choice(vns)
+        yield random.choice([
+            vn["name"][:random.randint(3, 10)],
+            misspell(vn["name"]),
+            vn["abbreviations"][0],
+        ])
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1:]] or DEFAULT_SIZES
+
+    print(f"{'vns':>8} {'avg':>10} {'max':>10}")
+
+    for size in sizes:
+        vns = synthetic_vns(size)
+        index = SearchIndex()
+        index.build(vns)
+
+        timings = []
+        for query in queries(vns):
+            start = time.perf_counter()
+            index.search(query)
+            timings.append(time.perf_counter() - start)
+
+        print(f"{size:>8} {sum(timings) / len(timings) * 1000:>7.3f} ms {max(timings) * 1000:>7.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
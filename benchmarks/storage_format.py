@@ -0,0 +1,125 @@
+"""Compares the indented JSON database with the compact format, and full backups with deltas.
+
+For every size, the same synthetic database is written and loaded in both
+formats, best of three. Then a backup is taken, a number of votes change and
+another backup is taken. The hourly git backup of the whole file adds about
+the zlib compressed file to the repository every time, which is what the
+delta is compared against.
+
+Usage: python -m benchmarks.storage_format [--sizes 1000,10000] [--ratings-per-vn 10] [--changes 100]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import tempfile
+import time
+import zlib
+
+from benchmarks.suite import synthetic_documents
+from bot import backup
+from bot.helpers import TABLE_VISUAL_NOVEL, TABLE_RATING
+from bot.storage import CompactStorage, WriteBehindStorage
+
+REPEATS = 3
+
+# How the bot opens its JSON database.
+JSON_OPTIONS = {"sort_keys": True, "indent": 4, "separators": (",", ": ")}
+
+
+def best_of(function):
+    timings = []
+
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+
+def measure(storage_class, path, tables):
+    if os.path.exists(path):
+        os.remove(path)
+
+    storage = storage_class(path, **JSON_OPTIONS)
+
+    def write():
+        storage.write(tables)
+        storage.flush()
+
+    write_seconds = best_of(write)
+    load_seconds = best_of(lambda: storage_class(path, **JSON_OPTIONS))
+
+    return os.path.getsize(path), write_seconds, load_seconds
+
+
+def change_votes(tables, changes):
+    ratings = tables[TABLE_RATING]
+
+    for doc_id in random.sample(sorted(ratings), changes):
+        ratings[doc_id] = {**ratings[doc_id], "rating": -ratings[doc_id]["rating"]}
+
+
+def bench_size(vns, ratings_per_vn, changes, directory):
+    vn_documents, rating_documents = synthetic_documents(vns, vns * ratings_per_vn)
+    tables = {
+        TABLE_VISUAL_NOVEL: {str(doc_id): document for doc_id, document in vn_documents.items()},
+        TABLE_RATING: {str(doc_id + 1): document for doc_id, document in rating_documents.items()},
+    }
+
+    json_path = os.path.join(directory, f"{vns}.json")
+    results = {
+        "json": measure(WriteBehindStorage, json_path, tables),
+        "compact": measure(CompactStorage, os.path.join(directory, f"{vns}.jsonl.gz"), tables),
+    }
+
+    with open(json_path, "rb") as f:
+        git_object = len(zlib.compress(f.read()))
+
+    backups = os.path.join(directory, f"backups-{vns}")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        backup.export(json_path, backups, full_every=24)
+
+        change_votes(tables, changes)
+        with open(json_path, "w") as f:
+            json.dump(tables, f, **JSON_OPTIONS)
+
+        # Backups are named by the second they were taken at.
+        time.sleep(1.1)
+
+        start = time.perf_counter()
+        backup.export(json_path, backups, full_every=24)
+        delta_seconds = time.perf_counter() - start
+
+    sizes = {kind: os.path.getsize(path) for _, kind, path in backup.backup_files(backups)}
+
+    return results, git_object, sizes["full"], sizes["delta"], delta_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares the database formats and backups.")
+    parser.add_argument("--sizes", default="1000,10000", help="comma separated VN counts")
+    parser.add_argument("--ratings-per-vn", type=int, default=10)
+    parser.add_argument("--changes", type=int, default=100, help="votes changed between two backups")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for vns in (int(size) for size in args.sizes.split(",")):
+            results, git_object, full, delta, delta_seconds = bench_size(vns, args.ratings_per_vn, args.changes, directory)
+
+            print(f"{vns} VNs, {vns * args.ratings_per_vn} ratings")
+            print(f"  {'format':<10} {'size':>12} {'write':>10} {'load':>10}")
+            for name, (size, write_seconds, load_seconds) in results.items():
+                print(f"  {name:<10} {size:>10,} B {write_seconds * 1000:>7.1f} ms {load_seconds * 1000:>7.1f} ms")
+
+            print(f"  Hourly backup, whole file in git: {git_object:>10,} B")
+            print(f"  Full snapshot:                    {full:>10,} B")
+            print(f"  Delta of {args.changes} votes:                {delta:>10,} B in {delta_seconds * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
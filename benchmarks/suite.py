@@ -0,0 +1,341 @@
+"""Runs the VisualNovels cog against a fake Discord layer and synthetic databases.
+
+For every database size this generates a database file, loads the cog on
+top of it and measures:
+
+- how long loading takes, the memory in use after it and the file size
+- votes per second and the p50/p99 latency of a vote, from the reaction
+  event until its database write is done, with every vote sent at once
+- the cost of the name, abbreviation, message and fuzzy lookups
+- an incremental `rebuild` of every list message, for the smaller sizes
+
+Every Discord API call sleeps for `--latency` seconds. The results are
+printed and saved as JSON in benchmarks/results/ by default, along with the
+commit they were run on, so two runs can be compared with `--compare`.
+
+Usage: python -m benchmarks.suite [--sizes 1000,10000,100000] [--ratings-per-vn 10]
+           [--votes 1000] [--latency 0.05] [--backend tinydb|sqlite] [--format json|compact] [--journal]
+           [--flush-interval SECONDS] [--rebuild-max 1000]
+           [--output results.json] [--compare previous.json]
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import tempfile
+import time
+
+from tinydb.table import Document
+
+from benchmarks.fake_discord import FakeAPI, FakeBot, FakeContext, FakeUser, reaction_payload
+from bot.cogs.visual_novels import VisualNovels
+from bot.helpers import TABLE_VISUAL_NOVEL, TABLE_RATING
+from bot.metrics import Metrics
+from bot.sqlite_database import SQLiteDatabase
+
+LOOKUPS = 2_000
+
+RESULTS_DIRECTORY = os.path.join(os.path.dirname(__file__), "results")
+
+# Each kind of lookup stops early past this many seconds, in case a storage reads the whole file every time.
+LOOKUP_SECONDS = 2.0
+
+
+def synthetic_documents(vns, ratings, seed=0):
+    randomizer = random.Random(seed)
+
+    vn_documents = {
+        doc_id: {
+            "name": f"Visual Novel {doc_id}",
+            "abbreviations": [f"vn{doc_id}"],
+            "authors": [f"Author {doc_id % 500}"],
+            "store": f"https://example.com/{doc_id}",
+            "image": None,
+            "android_support": doc_id % 3 == 0,
+            "undetermined": doc_id % 10 == 0,
+            "message_id": 10 ** 16 + doc_id,
+            "channel_id": None,
+        }
+        for doc_id in range(1, vns + 1)
+    }
+
+    # Member n votes on every VN in turn, so (member, VN) pairs never repeat.
+    rating_documents = {
+        doc_id: {"member_id": doc_id // vns + 1, "vn_id": doc_id % vns + 1, "rating": randomizer.choice((1, -1))}
+        for doc_id in range(ratings)
+    }
+
+    return vn_documents, rating_documents
+
+
+def write_database(path, backend, vn_documents, rating_documents):
+    if backend == "sqlite":
+        database = SQLiteDatabase(path)
+        database.import_documents(
+            [Document(document, doc_id) for doc_id, document in vn_documents.items()],
+            [Document(document, doc_id + 1) for doc_id, document in rating_documents.items()],
+        )
+        database.close()
+        return
+
+    with open(path, "w") as file:
+        json.dump({
+            TABLE_VISUAL_NOVEL: {str(doc_id): document for doc_id, document in vn_documents.items()},
+            TABLE_RATING: {str(doc_id + 1): document for doc_id, document in rating_documents.items()},
+        }, file)
+
+
+def database_bytes(path):
+    suffixes = ("", ".snapshot", ".journal", "-wal")
+    return sum(os.path.getsize(path + suffix) for suffix in suffixes if os.path.exists(path + suffix))
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as file:
+            pages = int(file.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        # Peak rather than current usage, the best there is outside of Linux.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+async def bench_votes(cog, bot, vn_documents, votes):
+    """Sends every vote at once and times each from its reaction event until its write is done."""
+
+    started = {}
+    finished = {}
+    process_reactions = cog.reactions.handler
+
+    async def timed(events):
+        await process_reactions(events)
+        now = time.perf_counter()
+        for _, _, member, _ in events:
+            finished[member] = now
+
+    cog.reactions.handler = timed
+
+    doc_ids = list(vn_documents)
+    payloads = []
+
+    for _ in range(votes):
+        doc_id = random.choice(doc_ids)
+        channel = bot.channels["vn_undetermined" if vn_documents[doc_id]["undetermined"] else "vn_list"]
+        member = FakeUser()
+        payloads.append(reaction_payload(channel, vn_documents[doc_id]["message_id"], member, random.choice("👍👎❌")))
+
+    async def vote(payload):
+        started[payload.member] = time.perf_counter()
+        await cog.on_raw_reaction_add(payload)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(vote(payload) for payload in payloads))
+
+    while len(finished) < votes:
+        await asyncio.sleep(0.01)
+
+    elapsed = time.perf_counter() - start
+    latencies = [finished[member] - started[member] for member in started]
+
+    # Let the coalesced embed edits go out so their API calls are counted.
+    while cog.rating_edits.tasks:
+        await asyncio.sleep(0.01)
+
+    cog.reactions.handler = process_reactions
+
+    return {
+        "votes_per_second": votes / elapsed,
+        "vote_p50_ms": percentile(latencies, 0.5) * 1000,
+        "vote_p99_ms": percentile(latencies, 0.99) * 1000,
+        "vote_mean_ms": statistics.mean(latencies) * 1000,
+    }
+
+
+def bench_lookups(database, vns):
+    names = [f"visual novel {random.randint(1, vns)}" for _ in range(LOOKUPS)]
+    abbreviations = [f"vn{random.randint(1, vns)}" for _ in range(LOOKUPS)]
+    message_ids = [10 ** 16 + random.randint(1, vns) for _ in range(LOOKUPS)]
+    typos = [f"visal novel {random.randint(1, vns)}" for _ in range(LOOKUPS)]
+
+    def timed(function, queries):
+        start = time.perf_counter()
+        done = 0
+
+        for query in queries:
+            function(query)
+            done += 1
+            if time.perf_counter() - start > LOOKUP_SECONDS:
+                break
+
+        return (time.perf_counter() - start) / done * 1_000_000
+
+    return {
+        "find_by_name_us": timed(lambda name: database.find_vn(name=name), names),
+        "find_by_abbreviation_us": timed(lambda abbreviation: database.find_vn(abbreviations=[abbreviation]),
+                                         abbreviations),
+        "find_by_message_us": timed(lambda message_id: database.find_vn(message_id=message_id), message_ids),
+        "fuzzy_search_us": timed(database.search_vns, typos),
+    }
+
+
+async def bench_rebuild(cog, bot):
+    ctx = FakeContext(bot)
+    calls = sum(bot.api.calls.values())
+
+    # The cog isn't added to a bot, so the command is called unbound.
+    start = time.perf_counter()
+    await cog.rebuild.callback(cog, ctx)
+
+    return {
+        "rebuild_seconds": time.perf_counter() - start,
+        "rebuild_api_calls": sum(bot.api.calls.values()) - calls,
+    }
+
+
+async def bench_size(args, vns, directory):
+    ratings = vns * args.ratings_per_vn
+    path = os.path.join(directory, f"bench-{vns}.{'sqlite' if args.backend == 'sqlite' else 'json'}")
+
+    vn_documents, rating_documents = synthetic_documents(vns, ratings)
+    write_database(path, args.backend, vn_documents, rating_documents)
+    del rating_documents
+
+    gc.collect()
+    memory_before = rss_mb()
+
+    api = FakeAPI(latency=args.latency)
+    bot = FakeBot(
+        api=api,
+        database_path=path,
+        metrics=Metrics(),
+        backend=args.backend,
+        database_format=args.format,
+        rating_journal=args.journal,
+        flush_interval=args.flush_interval,
+    )
+
+    start = time.perf_counter()
+    cog = VisualNovels(bot)
+    await cog.warmed_up.wait()
+    load_seconds = time.perf_counter() - start
+
+    for doc_id, document in vn_documents.items():
+        channel = bot.channels["vn_undetermined" if document["undetermined"] else "vn_list"]
+        channel.add_message(message_id=document["message_id"])
+
+    result = {
+        "vns": vns,
+        "ratings": ratings,
+        "load_seconds": load_seconds,
+        "memory_mb": rss_mb() - memory_before,
+    }
+
+    result.update(await bench_votes(cog, bot, vn_documents, args.votes))
+    result.update(bench_lookups(cog.db.database, vns))
+
+    if vns <= args.rebuild_max:
+        result.update(await bench_rebuild(cog, bot))
+
+    await cog.db.flush()
+    cog.cog_unload()
+
+    result["database_bytes"] = database_bytes(path)
+    result["api_calls"] = dict(api.calls)
+
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_result(result):
+    print(f"{result['vns']} VNs, {result['ratings']} ratings")
+
+    for key, value in result.items():
+        if key in ("vns", "ratings", "api_calls"):
+            continue
+        print(f"  {key:<24} {value:>14.2f}" if isinstance(value, float) else f"  {key:<24} {value:>14}")
+
+
+def compare(previous, current):
+    """Prints how every number changed between two result files, matched by VN count."""
+
+    print(f"\nCompared with {previous.get('commit')}:")
+    old_results = {result["vns"]: result for result in previous["results"]}
+
+    for result in current["results"]:
+        old = old_results.get(result["vns"])
+        if old is None:
+            continue
+
+        print(f"{result['vns']} VNs")
+        for key, value in result.items():
+            if not isinstance(value, (int, float)) or key in ("vns", "ratings") or not old.get(key):
+                continue
+            print(f"  {key:<24} {old[key]:>14.2f} -> {value:>14.2f} ({(value - old[key]) / old[key]:+.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the bot against a fake Discord layer.")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma separated VN counts")
+    parser.add_argument("--ratings-per-vn", type=int, default=10)
+    parser.add_argument("--votes", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated API latency in seconds")
+    parser.add_argument("--backend", choices=("tinydb", "sqlite"), default="tinydb")
+    parser.add_argument("--format", choices=("json", "compact"), default="json", help="the TinyDB file format")
+    parser.add_argument("--journal", action="store_true", help="use the rating journal")
+    parser.add_argument("--flush-interval", type=float, help="flush the database on this interval instead of after every write")
+    parser.add_argument("--rebuild-max", type=int, default=1_000, help="largest size to rebuild")
+    parser.add_argument("--output", default=os.path.join(RESULTS_DIRECTORY, "benchmark-results.json"))
+    parser.add_argument("--compare", help="a previous result file to compare against")
+    args = parser.parse_args()
+
+    results = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        loop = asyncio.get_event_loop()
+
+        for vns in (int(size) for size in args.sizes.split(",")):
+            result = loop.run_until_complete(bench_size(args, vns, directory))
+            print_result(result)
+            results.append(result)
+            gc.collect()
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "results": results,
+    }
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=4)
+
+    print(f"\nSaved to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            compare(json.load(file), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,10 +3,16 @@ import datetime
 import logging
 import os
 import random
+import time
 
 import discord
 from discord.ext import commands
 
+from bot.audit import AuditLog
+from bot.metrics import Metrics
+from bot.recorder import EventRecorder
+from bot.sessions import SessionError, Sessions
+
 log = logging.getLogger(__name__)
 
 
@@ -14,10 +20,19 @@ def env_int(name: str) -> int:
     return int(os.getenv(name))
 
 
+def env_optional(name: str, cast=str):
+    value = os.getenv(name)
+    return cast(value) if value else None
+
+
 class FVNBot(commands.Bot):
     def __init__(self, *args, **kwargs):
+        # Sent along with every identify, so the presence also survives reconnects.
+        kwargs.setdefault("activity", discord.Game(name=f"{os.getenv('FVNBOT_PREFIX')}help"))
         super().__init__(*args, **kwargs)
 
+        self.started = time.perf_counter()
+        self.startup_phases = {}
         self.uptime = datetime.datetime.utcnow()
         self.custom_extensions = [
             "bot.cogs.bot_manager",
@@ -26,46 +41,124 @@ class FVNBot(commands.Bot):
         self.guild = None
         self.channels = None
         self.roles = None
+
+        # Parsed once, on_ready only looks the objects up again, as it also fires on every reconnect.
+        self.guild_id = env_int("FVNBOT_GUILD_ID")
+        self.channel_ids = {
+            "vn_list": env_int("FVNBOT_CHANNEL_VN_LIST"),
+            "vn_undetermined": env_int("FVNBOT_CHANNEL_VN_UNDETERMINED"),
+            "vn_news": env_int("FVNBOT_CHANNEL_VN_NEWS"),
+            "top10": env_int("FVNBOT_CHANNEL_TOP10"),
+            "logs": env_int("FVNBOT_CHANNEL_LOGS"),
+            "bot_spam": env_int("FVNBOT_CHANNEL_BOT_SPAM"),
+        }
+        self.role_ids = {
+            "staff": env_int("FVNBOT_ROLE_STAFF"),
+            "bot_manager": env_int("FVNBOT_ROLE_BOT_MANAGER"),
+            "update_notification": env_int("FVNBOT_ROLE_UPDATE_NOTIFICATION"),
+        }
         self.database_path = os.getenv("FVNBOT_DATABASE")
+        self.database_backend = os.getenv("FVNBOT_DATABASE_BACKEND") or "tinydb"
+        self.database_format = os.getenv("FVNBOT_DATABASE_FORMAT") or "json"
+        self.database_flush_interval = env_optional("FVNBOT_DATABASE_FLUSH_INTERVAL", float)
+        self.database_flush_writes = env_optional("FVNBOT_DATABASE_FLUSH_WRITES", int)
+        self.rating_journal = bool(os.getenv("FVNBOT_RATING_JOURNAL"))
+        self.rating_journal_compact_size = env_optional("FVNBOT_RATING_JOURNAL_COMPACT_SIZE", int) or 1024 * 1024
+        self.rating_edit_delay = env_optional("FVNBOT_RATING_EDIT_DELAY", float) or 2.0
+        self.leaderboard_interval = env_optional("FVNBOT_LEADERBOARD_INTERVAL", float) or 300.0
+        self.import_post_interval = env_optional("FVNBOT_IMPORT_POST_INTERVAL", float) or 2.0
+        self.audit_log = AuditLog(interval=env_optional("FVNBOT_AUDIT_LOG_INTERVAL", float) or 5.0)
+        self.sessions = Sessions(limit=env_optional("FVNBOT_SESSION_LIMIT", int) or 50)
         self.log = log
 
+        record_path = os.getenv("FVNBOT_RECORD_PATH")
+        self.recorder = EventRecorder(record_path) if record_path else None
+
+        self.metrics = Metrics()
+        self.metrics.instrument_http(self.http)
+        self.before_invoke(self.start_command_timer)
+
+        metrics_port = env_optional("FVNBOT_METRICS_PORT", int)
+        if metrics_port:
+            metrics_host = os.getenv("FVNBOT_METRICS_HOST") or "127.0.0.1"
+            self.loop.create_task(self.metrics.start_server(metrics_port, metrics_host))
+
+        started = time.perf_counter()
+
         for extension in self.custom_extensions:
             try:
                 self.load_extension(extension)
             except Exception as e:  # noqa
                 log.error("Failed to load extension %s\n%s: %s", extension, type(e).__name__, e)
 
+        self.record_startup("extensions", time.perf_counter() - started)
+
+    def record_startup(self, phase, seconds):
+        """Notes how long a startup phase took, shown by the stats command and in the log."""
+
+        self.startup_phases[phase] = seconds
+        self.metrics.observe("fvnbot_startup_seconds", seconds, phase=phase)
+        log.info("Startup phase %s took %.2fs", phase, seconds)
+
     async def on_ready(self):
-        log.info("Logged in as %s", self.user)
+        first_login = self.guild is None
 
-        await self.change_presence(activity=discord.Game(name=f"{os.getenv('FVNBOT_PREFIX')}help"))
+        # A reconnect can replace the cached objects, looking them up again is only a few dict lookups.
+        self.guild = self.get_guild(self.guild_id)
+        self.channels = {name: self.guild.get_channel(channel_id) for name, channel_id in self.channel_ids.items()}
+        self.roles = {name: self.guild.get_role(role_id) for name, role_id in self.role_ids.items()}
+        self.audit_log.channel = self.channels["logs"]
 
-        self.guild = self.get_guild(env_int("FVNBOT_GUILD_ID"))
+        if not first_login:
+            log.info("Reconnected as %s", self.user)
+            return
 
-        self.channels = {
-            "vn_list": self.guild.get_channel(env_int("FVNBOT_CHANNEL_VN_LIST")),
-            "vn_undetermined": self.guild.get_channel(env_int("FVNBOT_CHANNEL_VN_UNDETERMINED")),
-            "vn_news": self.guild.get_channel(env_int("FVNBOT_CHANNEL_VN_NEWS")),
-            "top10": self.guild.get_channel(env_int("FVNBOT_CHANNEL_TOP10")),
-            "logs": self.guild.get_channel(env_int("FVNBOT_CHANNEL_LOGS")),
-            "bot_spam": self.guild.get_channel(env_int("FVNBOT_CHANNEL_BOT_SPAM")),
-        }
+        log.info("Logged in as %s", self.user)
+        self.record_startup("gateway", time.perf_counter() - self.started)
 
-        self.roles = {
-            "staff": self.guild.get_role(env_int("FVNBOT_ROLE_STAFF")),
-            "bot_manager": self.guild.get_role(env_int("FVNBOT_ROLE_BOT_MANAGER")),
-            "update_notification": self.guild.get_role(env_int("FVNBOT_ROLE_UPDATE_NOTIFICATION")),
-        }
+        if self.recorder is not None:
+            self.recorder.channels(self.user.id, self.channels)
+
+    async def on_message(self, message):
+        self.sessions.dispatch(message)
+        await self.process_commands(message)
+
+    async def on_reaction_add(self, reaction, user):
+        self.sessions.dispatch_reaction(reaction, user)
 
     async def on_command(self, ctx):
-        await self.channels["logs"].send(f"{ctx.author} in #{ctx.channel}: {ctx.message.content}")
+        self.audit_log.add(f"{ctx.author} in #{ctx.channel}: {ctx.message.content}")
+
+        if self.recorder is not None:
+            self.recorder.command(ctx)
+
+    async def on_raw_reaction_add(self, payload):
+        if self.recorder is not None:
+            self.recorder.reaction(payload)
+
+    async def on_socket_response(self, msg):
+        if self.recorder is None or msg.get("t") != "GUILD_MEMBER_REMOVE" or self.guild is None:
+            return
+
+        if int(msg["d"]["guild_id"]) == self.guild.id:
+            self.recorder.leave(int(msg["d"]["user"]["id"]))
+
+    @staticmethod
+    async def start_command_timer(ctx):
+        ctx.started = time.perf_counter()
 
     async def on_command_error(self, ctx: commands.Context, error):
+        if ctx.command is not None:
+            self.metrics.increment("fvnbot_command_errors_total", command=ctx.command.qualified_name)
+
         await self.react_command_error(ctx)
         if not isinstance(error, commands.CommandNotFound) and ctx.command not in ["bonk", "megabonk"]:
-            await self.channels["logs"].send(f"Command error in {ctx.command}: {error}")
-        if isinstance(error, (commands.ConversionError, asyncio.TimeoutError)):
-            await ctx.reply(str(error))
+            self.audit_log.add(f"Command error in {ctx.command}: {error}")
+
+        # Errors raised inside a command come wrapped.
+        original = error.original if isinstance(error, commands.CommandInvokeError) else error
+        if isinstance(original, (commands.ConversionError, asyncio.TimeoutError, SessionError)):
+            await ctx.reply(str(original))
         if isinstance(error, commands.CheckFailure) and random.random() <= 0.4:
             sarcasm = [
                 "Nope, not listening to you.",
@@ -87,7 +180,18 @@ class FVNBot(commands.Bot):
             ]
             await ctx.reply(random.choice(sarcasm))
 
+    async def close(self):
+        self.sessions.cancel_all()
+        await self.audit_log.close()
+        await self.metrics.stop_server()
+        if self.recorder is not None:
+            self.recorder.close()
+        await super().close()
+
     async def on_command_completion(self, ctx: commands.Context):
+        self.metrics.observe(
+            "fvnbot_command_seconds", time.perf_counter() - ctx.started, command=ctx.command.qualified_name
+        )
         await self.react_command_ok(ctx)
 
     @staticmethod
@@ -0,0 +1,185 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ReadWriteLock:
+    """Lets any number of readers in at once, or a single writer.
+
+    Waiting writers go first, so a steady stream of reads can't starve them.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.readers = 0
+        self.writer = False
+        self.waiting_writers = 0
+
+    def acquire_read(self):
+        with self.condition:
+            while self.writer or self.waiting_writers:
+                self.condition.wait()
+            self.readers += 1
+
+    def release_read(self):
+        with self.condition:
+            self.readers -= 1
+            if not self.readers:
+                self.condition.notify_all()
+
+    def acquire_write(self):
+        with self.condition:
+            self.waiting_writers += 1
+            while self.writer or self.readers:
+                self.condition.wait()
+            self.waiting_writers -= 1
+            self.writer = True
+
+    def release_write(self):
+        with self.condition:
+            self.writer = False
+            self.condition.notify_all()
+
+
+class OperationStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_run = 0.0
+        self.max_run = 0.0
+
+    def record(self, wait, run):
+        with self.lock:
+            self.count += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self.total_run += run
+            self.max_run = max(self.max_run, run)
+
+    def describe(self, name):
+        if not self.count:
+            return f"{name}: none yet"
+
+        return (
+            f"{name}: {self.count}, "
+            f"queued avg {self.total_wait / self.count * 1000:.1f}ms max {self.max_wait * 1000:.1f}ms, "
+            f"ran avg {self.total_run / self.count * 1000:.1f}ms max {self.max_run * 1000:.1f}ms"
+        )
+
+
+def _read(name):
+    async def method(self, *args, **kwargs):
+        return await self.read(getattr(self.database, name), *args, **kwargs)
+
+    method.__name__ = name
+    return method
+
+
+def _write(name):
+    async def method(self, *args, **kwargs):
+        return await self.write(getattr(self.database, name), *args, **kwargs)
+
+    method.__name__ = name
+    return method
+
+
+class AsyncDatabase:
+    """Runs the work of a `Database` or `SQLiteDatabase` off the event loop.
+
+    Writes go through a single thread, so they are applied in the order they
+    were awaited. Reads run on a small pool of their own and only wait for a
+    write that is in progress. The time every operation spent queued and
+    running is recorded, that's how long the awaiting coroutine was held up
+    while the event loop kept going.
+    """
+
+    def __init__(self, database, readers=4, metrics=None):
+        self.database = database
+        self.metrics = metrics
+        self.lock = ReadWriteLock()
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="database-writer")
+
+        # TinyDB's JSONStorage reads through a single file handle, which can't be shared between threads.
+        if not getattr(database, "concurrent_reads", True):
+            readers = 1
+
+        self.readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="database-reader")
+
+        self.read_stats = OperationStats()
+        self.write_stats = OperationStats()
+
+    @property
+    def ratings(self):
+        return self.database.ratings
+
+    @property
+    def revisions(self):
+        return self.database.revisions
+
+    async def read(self, function, *args, **kwargs):
+        return await self._run(self.readers, self.lock.acquire_read, self.lock.release_read, self.read_stats,
+                               "read", function, args, kwargs)
+
+    async def write(self, function, *args, **kwargs):
+        return await self._run(self.writer, self.lock.acquire_write, self.lock.release_write, self.write_stats,
+                               "write", function, args, kwargs)
+
+    async def _run(self, executor, acquire, release, stats, kind, function, args, kwargs):
+        submitted = time.perf_counter()
+
+        def run():
+            acquire()
+            try:
+                started = time.perf_counter()
+                result = function(*args, **kwargs)
+                finished = time.perf_counter()
+
+                stats.record(started - submitted, finished - started)
+                if self.metrics is not None:
+                    self.metrics.observe("fvnbot_storage_seconds", finished - started, kind=kind,
+                                         operation=getattr(function, "__name__", "other"))
+                    self.metrics.observe("fvnbot_storage_wait_seconds", started - submitted, kind=kind)
+
+                return result
+            finally:
+                release()
+
+        return await asyncio.get_event_loop().run_in_executor(executor, run)
+
+    all_vns = _read("all_vns")
+    get_vn = _read("get_vn")
+    find_vn = _read("find_vn")
+    search_vns = _read("search_vns")
+    get_rating = _read("get_rating")
+    all_ratings = _read("all_ratings")
+    member_ratings = _read("member_ratings")
+    member_votes = _read("member_votes")
+    rating_members = _read("rating_members")
+    top_vns = _read("top_vns")
+
+    insert_vn = _write("insert_vn")
+    insert_vns = _write("insert_vns")
+    update_vn = _write("update_vn")
+    remove_vn = _write("remove_vn")
+    set_rating = _write("set_rating")
+    remove_rating = _write("remove_rating")
+    apply_ratings = _write("apply_ratings")
+    remove_member_ratings = _write("remove_member_ratings")
+    recount_ratings = _write("recount_ratings")
+    flush = _write("flush")
+
+    def stats(self):
+        return self.database.stats() + [
+            self.read_stats.describe("Reads"),
+            self.write_stats.describe("Writes"),
+        ]
+
+    def close(self):
+        """Waits for every queued operation to finish, then closes the database."""
+
+        self.readers.shutdown(wait=True)
+        self.writer.shutdown(wait=True)
+        self.database.close()
@@ -0,0 +1,81 @@
+import asyncio
+import io
+import logging
+
+import discord
+
+log = logging.getLogger(__name__)
+
+MESSAGE_LIMIT = 2000
+FLUSH_SIZE = 8000
+
+
+class AuditLog:
+    """Buffers the lines meant for the logs channel and sends them together.
+
+    The buffer is sent `interval` seconds after its first line, or right away
+    once it holds `FLUSH_SIZE` characters. Batches too long for a message go
+    out as a file. Once `max_lines` lines are waiting, new ones are only
+    counted, so a flood of commands can't keep the bot busy sending logs.
+    """
+
+    def __init__(self, interval=5.0, max_lines=500):
+        self.channel = None
+        self.interval = interval
+        self.max_lines = max_lines
+
+        self.lines = []
+        self.size = 0
+        self.dropped = 0
+        self.timer = None
+        self.lock = asyncio.Lock()
+
+    def add(self, line):
+        if len(self.lines) >= self.max_lines:
+            self.dropped += 1
+            return
+
+        self.lines.append(line)
+        self.size += len(line) + 1
+
+        if self.size >= FLUSH_SIZE:
+            asyncio.ensure_future(self.flush())
+        elif self.timer is None or self.timer.done():
+            self.timer = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.interval)
+        await self.flush()
+
+    async def flush(self):
+        async with self.lock:
+            # Lines logged before the bot is ready wait for the channel.
+            if self.channel is None or not (self.lines or self.dropped):
+                return
+
+            lines = self.lines
+            if self.dropped:
+                lines.append(f"... and {self.dropped} more line(s) that were dropped.")
+
+            self.lines = []
+            self.size = 0
+            self.dropped = 0
+
+            text = "\n".join(lines)
+
+            try:
+                if len(text) <= MESSAGE_LIMIT:
+                    await self.channel.send(text, allowed_mentions=discord.AllowedMentions.none())
+                else:
+                    await self.channel.send(
+                        f"{len(lines)} log lines",
+                        file=discord.File(io.BytesIO(text.encode("utf-8")), filename="commands.log"),
+                    )
+            except discord.HTTPException:
+                log.exception("Failed to send %s line(s) to the logs channel", len(lines))
+
+    async def close(self):
+        if self.timer is not None:
+            self.timer.cancel()
+
+        await self.flush()
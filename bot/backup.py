@@ -0,0 +1,244 @@
+"""Incremental backups of the database, and restoring from them.
+
+Usage: python -m bot.backup export <database> <backup directory> [--full-every 24]
+       python -m bot.backup restore <backup directory> <database> [--until TIMESTAMP] [--format json|compact]
+
+`export` writes the documents that changed since the last backup as a delta
+file, or a full snapshot once `--full-every` deltas were written since the
+previous one. Both are in the compact format of the database, a removed
+document being null, named after the UTC time they were taken at, like
+`delta-20240101T120000.jsonl.gz`. It only reads the database, JSON, compact or
+SQLite, along with its rating journal, so it can run next to the bot.
+
+`restore` rebuilds a TinyDB database from the latest snapshot and the deltas
+after it, or only from those up to `--until`, given like in the file names. The
+database must not exist yet. The bot moves its ratings into the rating journal
+on the first start with FVNBOT_RATING_JOURNAL, and `python -m bot.migrate`
+turns it into an SQLite database.
+"""
+import argparse
+import gzip
+import json
+import os
+import pathlib
+import re
+import sqlite3
+import time
+
+from bot.helpers import TABLE_VISUAL_NOVEL, TABLE_RATING
+from bot.journal import JournaledTable, read_journaled
+from bot.sqlite_database import iter_ratings, iter_vns
+from bot.storage import COMPRESS_LEVEL, is_compact, read_lines, read_tables, write_tables
+
+BACKUP_NAME = re.compile(r"(?P<kind>full|delta)-(?P<stamp>\d{8}T\d{6})\.jsonl\.gz")
+
+SQLITE_MAGIC = b"SQLite format 3\x00"
+
+# The bot may be halfway through rewriting the file, it's read again after a pause.
+READ_ATTEMPTS = 5
+
+
+def read_database(path):
+    """Returns every table of a database as {table: {doc_id: document}}, with string doc_ids like TinyDB."""
+
+    with open(path, "rb") as f:
+        sqlite = f.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC
+
+    if sqlite:
+        return _read_sqlite(path)
+
+    for attempt in range(READ_ATTEMPTS):
+        try:
+            return _read_tinydb(path)
+        except (ValueError, EOFError, OSError):
+            if attempt == READ_ATTEMPTS - 1:
+                raise
+            time.sleep(1)
+
+
+def _read_sqlite(path):
+    # Read-only, opening it through SQLiteDatabase would set it up and upgrade its schema.
+    connection = sqlite3.connect(f"{pathlib.Path(path).resolve().as_uri()}?mode=ro", uri=True)
+
+    try:
+        # A single transaction, so the ratings match the VNs they were read with.
+        connection.execute("BEGIN")
+
+        return {
+            TABLE_VISUAL_NOVEL: {str(doc_id): fields for doc_id, fields in iter_vns(connection)},
+            TABLE_RATING: {
+                str(doc_id): {"member_id": member_id, "vn_id": vn_id, "rating": rating}
+                for doc_id, member_id, vn_id, rating in iter_ratings(connection)
+            },
+        }
+    finally:
+        connection.close()
+
+
+def _read_tinydb(path):
+    snapshot = f"{path}.snapshot"
+    snapshot_before = os.stat(snapshot).st_mtime_ns if os.path.exists(snapshot) else None
+
+    if is_compact(path):
+        tables = read_tables(path)
+    else:
+        with open(path) as f:
+            tables = json.load(f)
+
+    if JournaledTable.exists(path):
+        ratings = read_journaled(path)
+
+        # A compaction finishing while the journal was read can hide the entries it folded in.
+        if snapshot_before != (os.stat(snapshot).st_mtime_ns if os.path.exists(snapshot) else None):
+            raise ValueError("The rating journal was compacted while being read.")
+
+        tables[TABLE_RATING] = {str(doc_id): document for doc_id, document in ratings.items()}
+
+    return tables
+
+
+def backup_files(directory):
+    """Returns the (timestamp, kind, path) of every backup in the directory, oldest first."""
+
+    files = []
+
+    for name in os.listdir(directory):
+        match = BACKUP_NAME.fullmatch(name)
+        if match:
+            files.append((match["stamp"], match["kind"], os.path.join(directory, name)))
+
+    return sorted(files)
+
+
+def restore_tables(files):
+    """Returns the tables as of the last of the given backups, and how many deltas were applied."""
+
+    fulls = [position for position, (_, kind, _) in enumerate(files) if kind == "full"]
+
+    if not fulls:
+        raise SystemExit("No full snapshot to start from.")
+
+    tables = read_tables(files[fulls[-1]][2])
+    deltas = files[fulls[-1] + 1:]
+
+    for _, _, path in deltas:
+        for table, documents in read_lines(path):
+            restored = tables.setdefault(table, {})
+            for doc_id, document in documents.items():
+                if document is None:
+                    restored.pop(doc_id, None)
+                else:
+                    restored[doc_id] = document
+
+    return tables, len(deltas)
+
+
+def changes(previous, current):
+    """Returns the documents that differ between two sets of tables by table, None for the removed ones."""
+
+    changed = {}
+
+    for table in sorted(previous.keys() | current.keys()):
+        old = previous.get(table, {})
+        new = current.get(table, {})
+
+        documents = {doc_id: document for doc_id, document in new.items() if old.get(doc_id) != document}
+        documents.update((doc_id, None) for doc_id in old.keys() - new.keys())
+
+        if documents:
+            changed[table] = documents
+
+    return changed
+
+
+def write_backup(path, tables):
+    if os.path.exists(path):
+        raise SystemExit(f"{path} already exists, a backup was already taken this second.")
+
+    temp_path = f"{path}.tmp"
+
+    with open(temp_path, "wb") as f:
+        # No timestamp in the header, so the same content always gives the same file.
+        with gzip.GzipFile(fileobj=f, mode="wb", compresslevel=COMPRESS_LEVEL, mtime=0) as compressed:
+            write_tables(compressed, tables)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(temp_path, path)
+
+
+def export(database_path, directory, full_every):
+    os.makedirs(directory, exist_ok=True)
+
+    tables = read_database(database_path)
+    files = backup_files(directory)
+    stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+
+    last_full = max((position for position, (_, kind, _) in enumerate(files) if kind == "full"), default=None)
+
+    if last_full is None or len(files) - last_full - 1 >= full_every:
+        path = os.path.join(directory, f"full-{stamp}.jsonl.gz")
+        write_backup(path, tables)
+        print(f"Wrote a full snapshot to {path}.")
+        return
+
+    previous, _ = restore_tables(files)
+    changed = changes(previous, tables)
+
+    if not changed:
+        print("Nothing changed since the last backup.")
+        return
+
+    path = os.path.join(directory, f"delta-{stamp}.jsonl.gz")
+    write_backup(path, changed)
+    print(f"Wrote {sum(len(documents) for documents in changed.values())} change(s) to {path}.")
+
+
+def restore(directory, database_path, until, database_format):
+    if os.path.exists(database_path):
+        raise SystemExit(f"{database_path} already exists, refusing to overwrite it.")
+
+    if until is not None and not re.fullmatch(r"\d{8}T\d{6}", until):
+        raise SystemExit(f"{until} isn't a timestamp like 20240101T120000.")
+
+    files = [file for file in backup_files(directory) if until is None or file[0] <= until]
+    tables, deltas = restore_tables(files)
+
+    if database_format == "compact":
+        write_backup(database_path, tables)
+    else:
+        # Written the same way as the bot writes its JSON database.
+        with open(database_path, "w") as f:
+            json.dump(tables, f, sort_keys=True, indent=4, separators=(",", ": "))
+
+    print(
+        f"Restored {len(tables.get(TABLE_VISUAL_NOVEL, {}))} VN(s) and {len(tables.get(TABLE_RATING, {}))} "
+        f"rating(s) to {database_path}, from a snapshot and {deltas} delta(s)."
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental backups of the database.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="back up what changed since the last backup")
+    export_parser.add_argument("database")
+    export_parser.add_argument("directory")
+    export_parser.add_argument("--full-every", type=int, default=24, help="deltas between full snapshots")
+
+    restore_parser = commands.add_parser("restore", help="rebuild a database from the backups")
+    restore_parser.add_argument("directory")
+    restore_parser.add_argument("database")
+    restore_parser.add_argument("--until", help="the last backup to restore, like 20240101T120000")
+    restore_parser.add_argument("--format", choices=("json", "compact"), default="json")
+
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export(args.database, args.directory, args.full_every)
+    else:
+        restore(args.directory, args.database, args.until, args.format)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""Adding VNs in bulk from a CSV or JSON file, and exporting the catalog in the same shape.
+
+A file has one VN per row or object, with the fields the `add` command asks
+for: name, abbreviations, authors, store, image, android_support and
+undetermined. Abbreviations and authors are lists in JSON, separated by spaces
+and commas in CSV like in `add`. Any other field is ignored, so an export can
+be imported back into an empty database.
+"""
+import csv
+import io
+import json
+
+from bot.indexes import normalize
+
+FIELDS = ("name", "abbreviations", "authors", "store", "image", "android_support", "undetermined")
+EXPORT_FIELDS = ("doc_id", *FIELDS, "ratings_up", "ratings_down")
+
+TRUE = {"yes", "y", "true", "1"}
+FALSE = {"no", "n", "false", "0", ""}
+
+
+def parse_rows(filename, data):
+    """Returns the rows of a CSV or JSON file as dicts, raising ValueError if it can't be read."""
+
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise ValueError("The file isn't UTF-8 text.")
+
+    if filename.lower().endswith(".json"):
+        try:
+            rows = json.loads(text)
+        except ValueError as e:
+            raise ValueError(f"The file isn't valid JSON: {e}")
+
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ValueError("The JSON file must be a list of objects, one per VN.")
+
+        return rows
+
+    if filename.lower().endswith(".csv"):
+        reader = csv.DictReader(io.StringIO(text))
+
+        if "name" not in (reader.fieldnames or []):
+            raise ValueError(f"The CSV file needs a header row with the columns {', '.join(FIELDS)}.")
+
+        return list(reader)
+
+    raise ValueError("Attach a .csv or a .json file.")
+
+
+def validate(database, rows):
+    """Turns rows into VN documents, checking them against each other and the database.
+
+    Returns the documents and the problems found, as "Row N: ..." lines. Nothing
+    should be inserted unless every row is fine.
+    """
+
+    documents = []
+    errors = []
+    names = {}
+    abbreviations = {}
+
+    for number, row in enumerate(rows, 1):
+        try:
+            document = _document(row)
+        except ValueError as e:
+            errors.append(f"Row {number}: {e}")
+            continue
+
+        name = normalize(document["name"])
+        if name in names:
+            errors.append(f"Row {number}: \"{document['name']}\" is also in row {names[name]}.")
+        elif database.find_vn(name=document["name"]):
+            errors.append(f"Row {number}: \"{document['name']}\" is already in the database.")
+        names.setdefault(name, number)
+
+        for abbreviation in document["abbreviations"]:
+            if abbreviation in abbreviations:
+                errors.append(f"Row {number}: the abbreviation \"{abbreviation}\" is also in row {abbreviations[abbreviation]}.")
+            elif database.find_vn(abbreviations=[abbreviation]):
+                errors.append(f"Row {number}: the abbreviation \"{abbreviation}\" is already used by another VN.")
+            abbreviations.setdefault(abbreviation, number)
+
+        documents.append(document)
+
+    return documents, errors
+
+
+def _document(row):
+    name = _text(row.get("name"))
+    if not name:
+        raise ValueError("it has no name.")
+
+    authors = _list(row.get("authors"), ",")
+    if not authors:
+        raise ValueError(f"\"{name}\" has no authors.")
+
+    store = _text(row.get("store"))
+    image = _text(row.get("image"))
+    if not store or not image:
+        raise ValueError(f"\"{name}\" needs both a store link and an image URL.")
+
+    abbreviations = [abbreviation.lower() for abbreviation in _list(row.get("abbreviations"), None)]
+    if abbreviations == ["none"]:
+        abbreviations = []
+
+    return {
+        "name": name,
+        # Repeats would claim the same key twice.
+        "abbreviations": list(dict.fromkeys(abbreviations)),
+        "authors": authors,
+        "store": store,
+        "image": image,
+        "android_support": _flag(row.get("android_support"), "android_support"),
+        "undetermined": _flag(row.get("undetermined"), "undetermined"),
+        "message_id": None,
+        "channel_id": None,
+    }
+
+
+def _text(value):
+    return str(value).strip() if value is not None else ""
+
+
+def _list(value, separator):
+    if isinstance(value, list):
+        return [_text(item) for item in value if _text(item)]
+
+    return [item.strip() for item in _text(value).split(separator) if item.strip()]
+
+
+def _flag(value, field):
+    if isinstance(value, bool):
+        return value
+
+    text = _text(value).lower()
+
+    if text in TRUE:
+        return True
+    if text in FALSE:
+        return False
+
+    raise ValueError(f"{field} should be yes or no, not \"{value}\".")
+
+
+def write_export(database, f, file_format):
+    """Writes every VN with its rating totals to the binary file `f`, one row at a time."""
+
+    text = io.TextIOWrapper(f, encoding="utf-8", newline="")
+
+    if file_format == "csv":
+        writer = csv.writer(text)
+        writer.writerow(EXPORT_FIELDS)
+
+        for row in _export_rows(database):
+            row["abbreviations"] = " ".join(row["abbreviations"] or [])
+            row["authors"] = ", ".join(row["authors"] or [])
+            row["android_support"] = "yes" if row["android_support"] else "no"
+            row["undetermined"] = "yes" if row["undetermined"] else "no"
+            writer.writerow(row[field] for field in EXPORT_FIELDS)
+    else:
+        separator = "[\n"
+
+        for row in _export_rows(database):
+            text.write(separator + json.dumps(row))
+            separator = ",\n"
+
+        text.write("[]\n" if separator == "[\n" else "\n]\n")
+
+    # Hands the file back to the caller still open.
+    text.flush()
+    text.detach()
+
+
+def _export_rows(database):
+    for doc_id, fields, (ratings_up, ratings_down) in database.iter_vns_with_ratings():
+        yield {
+            "doc_id": doc_id,
+            **{field: fields.get(field) for field in FIELDS},
+            "ratings_up": ratings_up,
+            "ratings_down": ratings_down,
+        }
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+
+import discord
+
+from bot.helpers import LIST_REACTIONS, VOTES, VisualNovel
+
+log = logging.getLogger(__name__)
+
+# How many messages get their reactions read or cleared at once.
+CONCURRENCY = 4
+
+
+class VoteCatchUp:
+    """Recovers the votes cast while the bot wasn't listening.
+
+    Reactions on list messages are removed as soon as their vote is recorded,
+    so any reaction left there besides the bot's own is a vote that was never
+    processed. A pass reads the history of the list channels, applies all the
+    votes it finds in one write and then clears the reactions. A member with
+    different votes left on the same VN can't be told apart, so those are
+    cleared without a vote. Votes cast live during the pass win over the ones
+    it found. Reading and clearing reactions goes through discord.py, which
+    waits out rate limits by itself, and at most CONCURRENCY messages are
+    handled at once so the list channels' buckets aren't flooded.
+    """
+
+    def __init__(self, database, embeds, concurrency=CONCURRENCY):
+        self.db = database
+        self.embeds = embeds
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+        self.running = False
+        self.live = set()
+
+        self.recovered = 0
+        self.ambiguous = 0
+        self.cleared = 0
+
+    def note_live_vote(self, message_id, member_id):
+        if self.running:
+            self.live.add((message_id, member_id))
+
+    async def run(self, channels, guild, bot_user):
+        """Applies the votes left on the given channels.
+        Returns the VNs whose votes changed, as a dict of message id to (VN, channel).
+        """
+
+        self.running = True
+        self.live.clear()
+        self.recovered = self.ambiguous = self.cleared = 0
+
+        try:
+            leftovers = []
+            for channel in channels:
+                async for message in channel.history(limit=None):
+                    if message.author == bot_user and any(_others(reaction) for reaction in message.reactions):
+                        leftovers.append(message)
+
+            reactions = await asyncio.gather(*(self._read(message, bot_user) for message in leftovers))
+
+            vns = {}
+            votes = []
+
+            for message, users in zip(leftovers, reactions):
+                message_votes = self._votes(users, guild)
+                if not message_votes:
+                    continue
+
+                vn = VisualNovel(database=self.db, embeds=self.embeds)
+                try:
+                    await vn.load_from_db(message_id=message.id)
+                except FileNotFoundError:
+                    continue
+
+                # Live votes that came in meanwhile are newer than anything left on the message.
+                message_votes = [(member_id, rating) for member_id, rating in message_votes
+                                 if (message.id, member_id) not in self.live]
+
+                vns[message.id] = (vn, message.channel)
+                votes.extend((member_id, vn.doc_id, rating) for member_id, rating in message_votes)
+
+            await self.db.apply_ratings(votes)
+            self.recovered = len(votes)
+
+            await asyncio.gather(*(self._clear(message, users) for message, users in zip(leftovers, reactions)))
+
+            return vns
+        finally:
+            self.running = False
+
+    async def _read(self, message, bot_user):
+        """Returns the users of every reaction on the message other than the bot's own, by emoji."""
+
+        users = {}
+
+        async with self.semaphore:
+            for reaction in message.reactions:
+                if _others(reaction):
+                    users[str(reaction.emoji)] = [user async for user in reaction.users() if user != bot_user]
+
+        return users
+
+    def _votes(self, users, guild):
+        """Returns the (member id, rating) pairs left on a message."""
+
+        ratings = {}
+
+        for emoji, reacted in users.items():
+            if emoji not in VOTES:
+                continue
+
+            for user in reacted:
+                ratings.setdefault(user.id, set()).add(VOTES[emoji])
+
+        votes = []
+
+        for member_id, member_ratings in ratings.items():
+            # Members who left lose their votes anyway.
+            if guild.get_member(member_id) is None:
+                continue
+
+            if len(member_ratings) > 1:
+                self.ambiguous += 1
+                continue
+
+            votes.append((member_id, member_ratings.pop()))
+
+        return votes
+
+    async def _clear(self, message, users):
+        removals = [(emoji, user) for emoji, reacted in users.items() for user in reacted]
+
+        async with self.semaphore:
+            try:
+                # Past a few reactions, clearing them all and adding the bot's back takes fewer requests.
+                if len(removals) > len(LIST_REACTIONS) + 1:
+                    await message.clear_reactions()
+                    for emoji in LIST_REACTIONS:
+                        await message.add_reaction(emoji)
+                else:
+                    for emoji, user in removals:
+                        await message.remove_reaction(emoji, user)
+            except discord.HTTPException:
+                log.warning("Failed to clear the reactions left on message %s", message.id)
+                return
+
+        self.cleared += len(removals)
+
+
+def _others(reaction):
+    return reaction.count > (1 if reaction.me else 0)
@@ -0,0 +1,70 @@
+import asyncio
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+
+class EditCoalescer:
+    """Collapses bursts of edits to the same message into a single edit.
+
+    `mark_dirty` records that a message needs to be edited, along with a
+    coroutine function that renders and sends the edit. After `delay` seconds
+    the latest of those functions is called once. A message marked dirty
+    again while its edit is being sent gets another edit right after, so the
+    last edit sent always shows the final state.
+    """
+
+    def __init__(self, delay=2.0):
+        self.delay = delay
+        self.pending = {}
+        self.tasks = {}
+
+        self.edits_requested = 0
+        self.edits_sent = 0
+        self.max_staleness = 0.0
+
+    @property
+    def edits_saved(self):
+        return self.edits_requested - self.edits_sent - len(self.pending)
+
+    def mark_dirty(self, key, edit):
+        self.edits_requested += 1
+
+        if key in self.pending:
+            dirty_since, _ = self.pending[key]
+            self.pending[key] = (dirty_since, edit)
+        else:
+            self.pending[key] = (time.monotonic(), edit)
+
+        if key not in self.tasks:
+            self.tasks[key] = asyncio.ensure_future(self._run(key))
+
+    async def _run(self, key):
+        try:
+            while key in self.pending:
+                await asyncio.sleep(self.delay)
+
+                dirty_since, edit = self.pending.pop(key)
+
+                try:
+                    await edit()
+                except Exception:  # noqa
+                    log.exception("Failed to edit message %s", key)
+
+                self.edits_sent += 1
+                self.max_staleness = max(self.max_staleness, time.monotonic() - dirty_since)
+        finally:
+            del self.tasks[key]
+
+    def stats(self):
+        return [
+            f"Edits requested: {self.edits_requested}",
+            f"Edits sent: {self.edits_sent}",
+            f"Edits saved: {self.edits_saved}",
+            f"Max staleness: {self.max_staleness:.1f}s",
+        ]
+
+    def cancel(self):
+        for task in self.tasks.values():
+            task.cancel()
@@ -9,6 +9,7 @@ from discord.ext import commands
 
 from bot import FVNBot
 from bot.checks import check_is_staff, check_is_bot_manager
+from bot.pages import build_pages, send_pages
 
 
 class BotManager(commands.Cog):
@@ -77,6 +78,21 @@ class BotManager(commands.Cog):
 
         await ctx.reply(content="Uptime: {}".format(fmt.format(d=days, h=hours, m=minutes, s=seconds)))
 
+    @commands.command(aliases=["storagestats"])
+    @commands.check(check_is_bot_manager)
+    async def stats(self, ctx: commands.Context):
+        """Shows the latency of commands, votes and storage, the Discord API calls and the internal counters."""
+
+        sections = [("Metrics", self.bot.metrics.summary() or ["Nothing recorded yet."])]
+
+        visual_novels = self.bot.get_cog("VisualNovels")
+        if visual_novels is not None:
+            sections.append(("Internals", visual_novels.stats()))
+
+        sections.append(("Conversations", self.bot.sessions.stats()))
+
+        await send_pages(self.bot, ctx, build_pages("Bot stats", sections))
+
     @commands.command()
     @commands.check(check_is_bot_manager)
     async def embedpost(self, ctx: commands.Context, channel: discord.TextChannel):
@@ -144,6 +160,7 @@ class BotManager(commands.Cog):
 {0}{0}                {0}          {0}            {0}     {0}       {0}
         """
 
+        # A listener of its own rather than a conversation, the bonked member can still use wizards meanwhile.
         def interactive_command_check(msg):
             return msg.author == member and ctx.channel == msg.channel
 
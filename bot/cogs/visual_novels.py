@@ -1,22 +1,34 @@
 import asyncio
+import functools
+import logging
+import tempfile
+import time
 from collections import Counter
 
 import discord
-from discord.ext import commands
-from tinydb import TinyDB, Query, where
+from discord.ext import commands, tasks
 
 from bot import FVNBot
+from bot.async_database import AsyncDatabase
+from bot.bulk import parse_rows, validate, write_export
+from bot.catchup import VoteCatchUp
 from bot.checks import check_is_staff, check_in_botspam, check_is_bot_manager
-from bot.helpers import VisualNovel, TABLE_VISUAL_NOVEL, TABLE_RATING
-from bot.vn_input import (
-    input_name,
-    input_abbreviations,
-    input_undetermined,
-    input_android_support,
-    input_image,
-    input_store,
-    input_authors,
-)
+from bot.coalescer import EditCoalescer
+from bot.database import Database
+from bot.embeds import EmbedCache
+from bot.helpers import VOTES, VisualNovel
+from bot.pages import build_pages, send_pages
+from bot.reactions import ReactionQueue
+from bot.rebuild import ListRebuild
+from bot.sqlite_database import SQLiteDatabase
+from bot.storage import CompactStorage, WriteBehindStorage
+from bot.sessions import Step
+from bot.vn_input import EDIT_VN, UPDATE_TITLE, UPDATE_URL, UPDATE_VN, VN_STEPS, choice
+
+log = logging.getLogger(__name__)
+
+# Problems listed when an import is turned down, the rest are only counted.
+IMPORT_ERRORS_SHOWN = 20
 
 
 class VisualNovels(commands.Cog):
@@ -24,53 +36,207 @@ class VisualNovels(commands.Cog):
 
     def __init__(self, bot: FVNBot):
         self.bot = bot
-        self.db = TinyDB(self.bot.database_path, sort_keys=True, indent=4, separators=(",", ": "))
+
+        # Opened in the background by warm_up, commands and votes wait for it.
+        self.db = None
+        self.catch_up = None
+        self.warmed_up = asyncio.Event()
+
+        self.embeds = EmbedCache()
+        self.rating_edits = EditCoalescer(delay=self.bot.rating_edit_delay)
+        self.reactions = ReactionQueue(self.process_reactions, metrics=self.bot.metrics)
+
+        # Held while messages are posted to the lists, so two runs don't post the same VNs.
+        self.list_lock = asyncio.Lock()
+
+        self.leaderboard_message = None
+        self.leaderboard = None
+
+        self.warm_up_task = self.bot.loop.create_task(self.warm_up())
+
+    def open_database(self):
+        if self.bot.database_backend == "sqlite":
+            return SQLiteDatabase(self.bot.database_path)
+
+        options = {
+            "rating_journal": self.bot.rating_journal,
+            "journal_compact_size": self.bot.rating_journal_compact_size,
+        }
+
+        # Both keep the database in memory, so reads don't parse the whole file every time.
+        options["storage"] = CompactStorage if self.bot.database_format == "compact" else WriteBehindStorage
+        # Without a flush timer every write still goes straight to disk.
+        options["flush_writes"] = self.bot.database_flush_writes or (None if self.bot.database_flush_interval else 1)
+
+        return Database(self.bot.database_path, **options)
+
+    async def warm_up(self):
+        """Loads the database and builds its caches on a thread, while the bot connects to Discord."""
+
+        started = time.perf_counter()
+
+        try:
+            database = await self.bot.loop.run_in_executor(None, self.open_database)
+        except Exception:  # noqa
+            # Same as the extension failing to load, the rest of the bot keeps running.
+            log.exception("Failed to load the database, unloading the VN commands")
+            self.bot.remove_cog(self.qualified_name)
+            return
+
+        opened = time.perf_counter() - started - database.load_seconds
+
+        self.bot.record_startup("database_open", opened)
+        self.bot.record_startup("database_load", database.load_seconds)
+
+        self.db = AsyncDatabase(database, metrics=self.bot.metrics)
+        self.catch_up = VoteCatchUp(self.db, self.embeds)
+        self.warmed_up.set()
+        self.bot.record_startup("warm_up", time.perf_counter() - self.bot.started)
+
+        if self.bot.database_flush_interval:
+            self.flush_database.change_interval(seconds=self.bot.database_flush_interval)
+            self.flush_database.start()
+
+        self.update_leaderboard.change_interval(seconds=self.bot.leaderboard_interval)
+        self.update_leaderboard.start()
+
+    async def cog_before_invoke(self, ctx):
+        if not self.warmed_up.is_set():
+            await ctx.reply("I'm still warming up, your command will run in a moment.")
+            await self.warmed_up.wait()
+
+    def cog_unload(self):
+        # Also reached on SIGTERM, discord.py closes the bot which unloads every extension.
+        self.warm_up_task.cancel()
+        self.flush_database.cancel()
+        self.update_leaderboard.cancel()
+        self.reactions.cancel()
+        self.rating_edits.cancel()
+
+        if self.db is not None:
+            self.db.close()
+
+    @tasks.loop(seconds=60.0)
+    async def flush_database(self):
+        await self.db.flush()
+
+    @tasks.loop(seconds=300.0)
+    async def update_leaderboard(self):
+        """Edits the top 10 leaderboard, if its order or the shown shares changed since it was last shown."""
+
+        # The channels are only known once on_ready ran.
+        if self.bot.channels is None:
+            return
+
+        try:
+            await self.show_leaderboard()
+        except Exception:  # noqa
+            # tasks.loop only carries on after connection errors, anything else would stop it for good.
+            log.exception("Failed to update the leaderboard")
+
+    async def show_leaderboard(self):
+        """Edits the current top 10 into the leaderboard message, or sends a new one if it's gone."""
+
+        top = await self.db.top_vns(10)
+        # Only what's shown, the vote counts themselves change with almost every vote.
+        shown = [(doc_id, name, round(100 * up / (up + down))) for doc_id, name, up, down in top]
+
+        if shown == self.leaderboard:
+            return
+
+        embed = discord.Embed(colour=discord.Colour.blurple(), title="Top 10 Visual Novels")
+        embed.description = "\n".join(
+            f"{position}. **{name}** 👍 {share}%" for position, (_, name, share) in enumerate(shown, 1)
+        ) or "No votes yet."
+        embed.set_footer(text="Ranked by how sure we can be that people like them, not just by the share of 👍.")
+
+        channel = self.bot.channels["top10"]
+
+        if self.leaderboard_message is None:
+            async for message in channel.history(limit=20):
+                if message.author == self.bot.user:
+                    self.leaderboard_message = message
+                    break
+
+        if self.leaderboard_message is not None:
+            try:
+                await self.leaderboard_message.edit(embed=embed)
+            except discord.NotFound:
+                self.leaderboard_message = None
+
+        if self.leaderboard_message is None:
+            self.leaderboard_message = await channel.send(embed=embed)
+
+        # Only once it's shown, so a failed edit is tried again on the next run.
+        self.leaderboard = shown
+
+    @update_leaderboard.before_loop
+    async def before_update_leaderboard(self):
+        await self.bot.wait_until_ready()
 
     @commands.command()
     async def search(self, ctx: commands.Context, *, name: str):
         """Search for a Visual Novel by name or abbreviation."""
 
-        name = name.lower()
+        vn = await self._find_vn(ctx, name.lower())
+        if vn is None:
+            return
 
-        vn = VisualNovel(database=self.db)
+        await ctx.reply(f"The VN {vn.name} can be found at {vn.jump_url(self.bot.guild.id, self.bot.channels)}")
+
+    async def _find_vn(self, ctx, name, session=None):
+        """Loads the VN with the given name or abbreviation.
+        Without an exact match, the closest VNs are listed and the author can pick one by its number,
+        in the given conversation or a new one.
+        Returns None if no VN was picked.
+        """
+
+        vn = VisualNovel(database=self.db, embeds=self.embeds)
 
         try:
-            vn.load_from_db(name=name, abbreviations=[name])
+            await vn.load_from_db(name=name, abbreviations=[name])
+            return vn
         except FileNotFoundError:
-            return await ctx.send("VN not found.")
+            pass
+
+        suggestions = await self.db.search_vns(name)
+
+        if not suggestions:
+            await ctx.reply("VN not found.")
+            return None
+
+        choices = "\n".join(f"{number}. {suggestion}" for number, (_, suggestion) in enumerate(suggestions, 1))
+        step = Step(f"VN not found. Did you mean one of these? Input the corresponding number.\n{choices}", reply=True)
 
-        channel = self.bot.channels["vn_undetermined" if vn.undetermined else "vn_list"]
-        message = await channel.fetch_message(vn.message_id)
-        await ctx.reply(f"The VN {vn.name} can be found at {message.jump_url}")
+        if session is None:
+            async with self.bot.sessions.open(ctx.channel, ctx.author) as session:
+                picked = await session.ask(ctx, step)
+        else:
+            picked = await session.ask(ctx, step)
+
+        picked = picked.strip()
+
+        if not picked.isdigit() or not 1 <= int(picked) <= len(suggestions):
+            await ctx.reply("VN not found.")
+            return None
+
+        await vn.load_from_db(doc_id=suggestions[int(picked) - 1][0])
+        return vn
 
     @commands.command()
     @commands.check(check_is_bot_manager)
     async def add(self, ctx: commands.Context):
         """Interactively add a Visual Novel to the database."""
 
-        def interactive_command_check(msg):
-            return msg.author == ctx.author and ctx.channel == msg.channel
+        async with self.bot.sessions.open(ctx.channel, ctx.author) as session:
+            fields = await session.run(ctx, VN_STEPS)
 
-        name = await input_name(self.bot, ctx, interactive_command_check)
-        abbreviations = await input_abbreviations(self.bot, ctx, interactive_command_check)
-        authors = await input_authors(self.bot, ctx, interactive_command_check)
-        store = await input_store(self.bot, ctx, interactive_command_check)
-        image = await input_image(self.bot, ctx, interactive_command_check)
-        android = await input_android_support(self.bot, ctx, interactive_command_check)
-        undetermined = await input_undetermined(self.bot, ctx, interactive_command_check)
+        vn = VisualNovel(database=self.db, embeds=self.embeds, **fields)
 
-        vn = VisualNovel(
-            database=self.db,
-            name=name,
-            abbreviations=abbreviations,
-            authors=authors,
-            store=store,
-            image=image,
-            android_support=android,
-            undetermined=undetermined,
-        )
-
-        doc_id = vn.add_to_db()
+        try:
+            doc_id = await vn.add_to_db()
+        except ValueError as e:
+            return await ctx.reply(str(e))
         self.bot.log.info("VN added to DB with ID %s", doc_id)
 
         await vn.post_to_list(self.bot.channels)
@@ -82,21 +248,14 @@ class VisualNovels(commands.Cog):
     async def delete(self, ctx: commands.Context, *, name: str):
         """Delete a Visual Novel from the database."""
 
-        name = name.lower()
-
-        vn = VisualNovel(database=self.db)
-
-        try:
-            vn.load_from_db(name=name, abbreviations=[name])
-        except FileNotFoundError:
-            return await ctx.reply("VN not found.")
+        vn = await self._find_vn(ctx, name.lower())
+        if vn is None:
+            return
 
-        channel = self.bot.channels["vn_undetermined" if vn.undetermined else "vn_list"]
-        message = await channel.fetch_message(vn.message_id)
-        await message.delete()
+        await vn.message_channel(self.bot.channels).get_partial_message(vn.message_id).delete()
 
-        self.db.table(TABLE_VISUAL_NOVEL).remove(doc_ids=[vn.doc_id])
-        self.db.table(TABLE_RATING).remove(where("vn_id") == vn.doc_id)
+        await self.db.remove_vn(vn.doc_id)
+        self.embeds.invalidate(vn.doc_id)
 
         await ctx.reply(f"The VN {vn.name} got successfully deleted!")
 
@@ -105,25 +264,15 @@ class VisualNovels(commands.Cog):
     async def edit(self, ctx: commands.Context):
         """Edits the information about a VN."""
 
-        def interactive_command_check(msg):
-            return msg.author == ctx.author and ctx.channel == msg.channel
+        async with self.bot.sessions.open(ctx.channel, ctx.author) as session:
+            vn_name = await session.ask(ctx, EDIT_VN)
 
-        await ctx.reply("What VN do you want to edit? Enter a name or an abbreviation.")
+            vn = await self._find_vn(ctx, vn_name.lower(), session)
+            if vn is None:
+                return
 
-        try:
-            vn_name = await self.bot.wait_for("message", timeout=60.0, check=interactive_command_check)
-        except asyncio.TimeoutError:
-            return await ctx.reply("You took long. Aborting.")
-
-        vn_name = vn_name.content.lower()
-        vn = VisualNovel(database=self.db)
-        try:
-            vn.load_from_db(name=vn_name, abbreviations=[vn_name])
-        except FileNotFoundError:
-            return await ctx.reply("VN not found.")
-
-        await ctx.reply(
-            f"""What do you want to edit about the VN "{vn.name}"? Input the corresponding number.
+            menu = Step(
+                f"""What do you want to edit about the VN "{vn.name}"? Input the corresponding number.
         1. Name
         2. Abbreviations
         3. Authors
@@ -131,50 +280,121 @@ class VisualNovels(commands.Cog):
         5. Image
         6. Android Support
         7. Is undetermined?
-        """
-        )
+        """,
+                choice(len(VN_STEPS)),
+                reply=True,
+            )
+            field, step = VN_STEPS[await session.ask(ctx, menu) - 1]
+
+            setattr(vn, field, await session.ask(ctx, step))
 
         try:
-            choice = await self.bot.wait_for("message", timeout=60.0, check=interactive_command_check)
-        except asyncio.TimeoutError:
-            return await ctx.reply("You took long. Aborting.")
-        choice = int(choice.content.strip())
-
-        if choice == 1:
-            vn.name = await input_name(self.bot, ctx, interactive_command_check)
-        if choice == 2:
-            vn.abbreviations = await input_abbreviations(self.bot, ctx, interactive_command_check)
-        if choice == 3:
-            vn.authors = await input_authors(self.bot, ctx, interactive_command_check)
-        if choice == 4:
-            vn.store = await input_store(self.bot, ctx, interactive_command_check)
-        if choice == 5:
-            vn.image = await input_image(self.bot, ctx, interactive_command_check)
-        if choice == 6:
-            vn.android_support = await input_android_support(self.bot, ctx, interactive_command_check)
-        if choice == 7:
-            vn.undetermined = await input_undetermined(self.bot, ctx, interactive_command_check)
-
-        vn.update_to_db()
+            await vn.update_to_db()
+        except ValueError as e:
+            return await ctx.reply(str(e))
         await vn.update_to_list(self.bot.channels)
 
         await ctx.reply(f"VN {vn.name} updated successfully.")
 
     @commands.command()
     @commands.check(check_is_bot_manager)
-    async def rebuild(self, ctx: commands.Context):
-        """Reposts all the VNs again in the VN channels."""
+    async def rebuild(self, ctx: commands.Context, mode: str = "incremental"):
+        """Brings the VN channels in line with the database.
+        Only the messages that differ are edited, reposted or deleted. Use `full` to delete
+        everything and repost all the VNs in order. Running it again resumes an interrupted full rebuild.
+        """
+
+        if self.list_lock.locked():
+            return await ctx.reply("The VN lists are already being posted to.")
+
+        status = await ctx.reply("Rebuilding the VN lists...")
+
+        rebuild = ListRebuild(
+            database=self.db,
+            embeds=self.embeds,
+            channel_list=self.bot.channels,
+            state_path=f"{self.bot.database_path}.rebuild",
+            progress=lambda text: status.edit(content=text),
+        )
+
+        async with self.list_lock:
+            if mode == "full" or rebuild.resumable:
+                await rebuild.full()
+            else:
+                await rebuild.incremental()
+
+        await status.edit(content=f"Done! {rebuild.describe()}")
+
+    @commands.command(name="import")
+    @commands.check(check_is_bot_manager)
+    async def import_vns(self, ctx: commands.Context):
+        """Adds the VNs of an attached CSV or JSON file and posts them to the lists.
+        It takes the fields `add` asks for, as columns or keys: name, abbreviations, authors, store, image,
+        android_support and undetermined. Nothing is added unless every row is fine. Without a file,
+        it posts the VNs that aren't on the lists yet, like after an interrupted import.
+        """
+
+        if self.list_lock.locked():
+            return await ctx.reply("The VN lists are already being posted to.")
+
+        if ctx.message.attachments:
+            attachment = ctx.message.attachments[0]
+
+            try:
+                rows = parse_rows(attachment.filename, await attachment.read())
+            except ValueError as e:
+                return await ctx.reply(str(e))
 
-        async for message in self.bot.channels["vn_undetermined"].history(limit=None):
-            await message.delete()
+            documents, errors = await self.db.read(validate, self.db.database, rows)
 
-        async for message in self.bot.channels["vn_list"].history(limit=None):
-            await message.delete()
+            if errors:
+                more = len(errors) - IMPORT_ERRORS_SHOWN
+                lines = errors[:IMPORT_ERRORS_SHOWN] + ([f"...and {more} more."] if more > 0 else [])
+                return await ctx.reply("Nothing was imported, fix these first:\n" + "\n".join(lines))
 
-        for entry in sorted(self.db.table(TABLE_VISUAL_NOVEL).all(), key=lambda doc: doc.doc_id):
-            vn = VisualNovel(database=self.db)
-            vn.load_from_db(doc_id=entry.doc_id)
-            await vn.post_to_list(self.bot.channels)
+            if not documents:
+                return await ctx.reply("The file has no VNs.")
+
+            try:
+                doc_ids = await self.db.insert_vns(documents)
+            except ValueError as e:
+                return await ctx.reply(str(e))
+
+            self.bot.log.info("Imported %s VN(s) with IDs %s to %s", len(doc_ids), doc_ids[0], doc_ids[-1])
+
+        status = await ctx.reply("Posting the imported VNs to the lists...")
+
+        poster = ListRebuild(
+            database=self.db,
+            embeds=self.embeds,
+            channel_list=self.bot.channels,
+            state_path=f"{self.bot.database_path}.rebuild",
+            progress=lambda text: status.edit(content=text),
+            interval=self.bot.import_post_interval,
+        )
+
+        async with self.list_lock:
+            await poster.unposted()
+
+        await status.edit(content=f"Done! Posted {poster.posted} VN(s).")
+
+    @commands.command()
+    @commands.check(check_is_bot_manager)
+    async def export(self, ctx: commands.Context, file_format: str = "csv"):
+        """Sends every VN with its rating totals as a CSV or JSON file, which `import` takes back."""
+
+        if file_format not in ("csv", "json"):
+            return await ctx.reply("The format can be csv or json.")
+
+        # Written to disk row by row and uploaded from there.
+        with tempfile.TemporaryFile() as f:
+            await self.db.read(write_export, self.db.database, f, file_format)
+
+            if f.tell() > self.bot.guild.filesize_limit:
+                return await ctx.reply(f"The export is {f.tell() // 1024} KiB, more than this server allows to upload.")
+
+            f.seek(0)
+            await ctx.reply(file=discord.File(f, filename=f"vns.{file_format}"))
 
     @commands.command()
     @commands.check(check_in_botspam)
@@ -185,119 +405,163 @@ class VisualNovels(commands.Cog):
 
         member = member or ctx.author
 
-        upvoted = []
-        downvoted = []
+        votes = await self.db.member_votes(member.id)
 
-        for doc in self.db.table(TABLE_RATING).search(where("member_id") == member.id):
-            name = self.db.table(TABLE_VISUAL_NOVEL).get(doc_id=doc["vn_id"])["name"]
-            if doc["rating"] == 1:
-                upvoted.append(f"{name}")
-            elif doc["rating"] == -1:
-                downvoted.append(f"{name}")
+        upvoted = [name for name, rating in votes if rating == 1]
+        downvoted = [name for name, rating in votes if rating == -1]
 
-        embed = discord.Embed(title=f"Ratings by user {member}")
-        embed.set_author(
-            name="FVN Bot",
-            icon_url="https://media.discordapp.net/attachments/729276573496246304/747178571834982431/bonkshinbookmirrored.png",
-        )
+        pages = build_pages(f"Ratings by user {member}", [("👍 Upvoted", upvoted), ("👎 Downvoted", downvoted)])
 
-        embed.add_field(name="👍 Upvoted", value="\n".join(upvoted) if upvoted else "------")
-        embed.add_field(name="👎 Downvoted", value="\n".join(downvoted) if downvoted else "------")
+        await send_pages(self.bot, ctx, pages)
+
+    @commands.command()
+    @commands.check(check_is_bot_manager)
+    async def cleanleavers(self, ctx: commands.Context):
+        """Removes the votes from people that aren't in the server anymore.
+        Leavers are removed as they leave, this catches up on the ones who left while the bot was down.
+        """
+
+        leavers = set(await self.db.rating_members()) - {member.id for member in self.bot.guild.members}
+
+        removed, edited = await self.remove_leavers(leavers)
+
+        await ctx.reply(f"{removed} votes from {len(leavers)} leavers removed! {edited} VN entries were updated.")
+
+    async def remove_leavers(self, member_ids):
+        """Removes the votes of members who left and updates the list entries of the VNs they voted for.
+        Returns how many votes were removed and how many entries are updated.
+        """
+
+        vn_ids = await self.db.remove_member_ratings(member_ids)
+        edited = 0
+
+        for vn_id in set(vn_ids):
+            vn = VisualNovel(database=self.db, embeds=self.embeds)
+            await vn.load_from_db(doc_id=vn_id)
+
+            if not vn.message_id:
+                continue
+
+            self.mark_ratings_dirty(vn)
+            edited += 1
+
+        return len(vn_ids), edited
+
+    def mark_ratings_dirty(self, vn):
+        self.rating_edits.mark_dirty(vn.message_id, functools.partial(self.edit_entry_ratings, vn.doc_id))
+
+    async def edit_entry_ratings(self, doc_id):
+        """Edits the list message of a VN, loaded when the edit is sent so staff edits made meanwhile aren't undone."""
+
+        vn = VisualNovel(database=self.db, embeds=self.embeds)
 
         try:
-            await ctx.reply(embed=embed)
-        except discord.HTTPException:
-            # embed is too big, send two instead
-            embed = discord.Embed(title=f"Ratings by user {member}")
-            embed.set_author(
-                name="FVN Bot",
-                icon_url="https://media.discordapp.net/attachments/729276573496246304/747178571834982431/bonkshinbookmirrored.png",
-            )
-            embed.add_field(name="👍 Upvoted", value="\n".join(upvoted) if upvoted else "------")
-            await ctx.reply(embed=embed)
+            await vn.load_from_db(doc_id=doc_id)
+        except FileNotFoundError:
+            # Deleted since the vote.
+            return
 
-            embed = discord.Embed(title=f"Ratings by user {member}")
-            embed.set_author(
-                name="FVN Bot",
-                icon_url="https://media.discordapp.net/attachments/729276573496246304/747178571834982431/bonkshinbookmirrored.png",
-            )
-            embed.add_field(name="👎 Downvoted", value="\n".join(downvoted) if downvoted else "------")
-            await ctx.reply(embed=embed)
+        if vn.message_id:
+            await vn.update_entry_ratings(vn.message_channel(self.bot.channels))
+
+    @commands.Cog.listener()
+    async def on_socket_response(self, msg):
+        # discord.py only dispatches member_remove for cached members, the raw gateway event always arrives.
+        if msg.get("t") != "GUILD_MEMBER_REMOVE" or self.bot.guild is None:
+            return
+
+        if int(msg["d"]["guild_id"]) != self.bot.guild.id:
+            return
+
+        member_id = int(msg["d"]["user"]["id"])
+        await self.warmed_up.wait()
+        removed, edited = await self.remove_leavers([member_id])
+
+        if removed:
+            log.info("Removed %s vote(s) of leaver %s, updating %s VN entries", removed, member_id, edited)
 
     @commands.command()
     @commands.check(check_is_bot_manager)
-    async def cleanleavers(self, ctx: commands.Context):
-        """Removes the votes from people that aren't in the server anymore."""
+    async def checkratings(self, ctx: commands.Context):
+        """Checks the cached rating counts against the rating table.
+        Any drift found is reported and the cache is rebuilt from the table.
+        """
+
+        drifted = await self.db.recount_ratings()
+
+        if not drifted:
+            return await ctx.reply("The cached ratings match the database.")
+
+        lines = []
+        for vn_id, (cached, actual) in sorted(drifted.items()):
+            lines.append(f"VN {vn_id}: cached 👍 {cached[0]} 👎 {cached[1]}, actual 👍 {actual[0]} 👎 {actual[1]}")
+
+        self.bot.log.warning("Rating cache drifted for %s VN(s), rebuilt from the database", len(drifted))
 
-        to_remove = [
-            document.doc_id
-            for document in self.db.table(TABLE_RATING).all()
-            if not self.bot.guild.get_member(document["member_id"])
-        ]
+        await ctx.reply(f"Found drift in {len(drifted)} VN(s), the cache has been rebuilt:\n" + "\n".join(lines[:20]))
 
-        self.db.table(TABLE_RATING).remove(doc_ids=to_remove)
+    def stats(self):
+        """Returns the counters of the database storage, the reaction queue, the embed cache and the rating edits."""
 
-        await ctx.reply(f"{len(to_remove)} leavers removed from the votes! Don't forget to run the `rebuild` command.")
+        database = self.db.stats() if self.db is not None else ["Database: warming up"]
+
+        return database + self.reactions.stats() + self.embeds.stats() + self.rating_edits.stats()
 
     @commands.command()
     @commands.check(check_is_staff)
     async def update(self, ctx: commands.Context):
         """Posts a VN update in the VN News Channel."""
 
-        def interactive_command_check(msg):
-            return msg.author == ctx.author and ctx.channel == msg.channel
+        async with self.bot.sessions.open(ctx.channel, ctx.author) as session:
+            vn_name = await session.ask(ctx, UPDATE_VN)
 
-        await ctx.reply("What VN do you want to publish an update? Enter a name or an abbreviation.")
+            vn = await self._find_vn(ctx, vn_name.lower(), session)
+            if vn is None:
+                return
 
-        try:
-            vn_name = await self.bot.wait_for("message", timeout=60.0, check=interactive_command_check)
-        except asyncio.TimeoutError:
-            return await ctx.reply("You took long. Aborting.")
+            url = await session.ask(ctx, UPDATE_URL)
+            title = await session.ask(ctx, UPDATE_TITLE)
 
-        vn_name = vn_name.content.lower()
-        vn = VisualNovel(database=self.db)
-        try:
-            vn.load_from_db(name=vn_name, abbreviations=[vn_name])
-        except FileNotFoundError:
-            return await ctx.reply("VN not found.")
+        title = f"{vn.name}: {title}"
 
-        await ctx.reply("What is the URL to the update?")
+        embed = vn.build_news_embed(title, url)
 
-        try:
-            url = await self.bot.wait_for("message", timeout=60.0, check=interactive_command_check)
-        except asyncio.TimeoutError:
-            return await ctx.reply("You took long. Aborting.")
-        url = url.content
+        msg = await self.bot.channels["vn_news"].send(f"{title}\n{self.bot.roles['update_notification'].mention}", embed=embed)
+        await msg.publish()
 
-        await ctx.reply("What is the title of the update?")
+    @commands.Cog.listener()
+    async def on_ready(self):
+        await self.catch_up_votes()
 
-        try:
-            title = await self.bot.wait_for("message", timeout=60.0, check=interactive_command_check)
-        except asyncio.TimeoutError:
-            return await ctx.reply("You took long. Aborting.")
-        title = title.content
+    @commands.Cog.listener()
+    async def on_resumed(self):
+        await self.catch_up_votes()
 
-        title = f"{vn.name}: {title}"
+    async def catch_up_votes(self):
+        """Applies the votes left as reactions on the list messages while the bot wasn't listening."""
 
-        embed = discord.Embed(
-            colour=discord.Colour.blurple(),
-            title=title,
-            url=url,
-        )
-        embed.add_field(name="Current Ratings", value=vn.calculate_ratings())
-        embed.add_field(name="Abbreviations", value=vn.pretty_abbreviations())
-        embed.add_field(name="Android Support", value="Yes" if vn.android_support else "No")
-        embed.set_image(url=vn.image)
-        embed.set_author(
-            name="FVN Bot",
-            icon_url="https://media.discordapp.net/attachments/729276573496246304/747178571834982431/bonkshinbookmirrored.png",
-        )
-        embed.set_footer(
-            text=f"Brought to you by Furry Visual Novels server. Join us for vn-lists, development channels and more. discord.gg/GFjSPkh"
-        )
+        await self.warmed_up.wait()
 
-        msg = await self.bot.channels["vn_news"].send(f"{title}\n{self.bot.roles['update_notification'].mention}", embed=embed)
-        await msg.publish()
+        # A reconnect while a pass is running is covered by that pass.
+        if self.bot.channels is None or self.catch_up.running:
+            return
+
+        channels = [self.bot.channels["vn_list"], self.bot.channels["vn_undetermined"]]
+
+        try:
+            vns = await self.catch_up.run(channels, self.bot.guild, self.bot.user)
+        except discord.HTTPException:
+            log.exception("Failed to catch up on the votes missed")
+            return
+
+        for vn, _ in vns.values():
+            self.mark_ratings_dirty(vn)
+
+        if self.catch_up.recovered or self.catch_up.cleared:
+            self.bot.audit_log.add(
+                f"Recovered {self.catch_up.recovered} missed vote(s) on {len(vns)} VN(s), "
+                f"{self.catch_up.ambiguous} conflicting, {self.catch_up.cleared} reaction(s) cleared."
+            )
 
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, payload):
@@ -320,25 +584,43 @@ class VisualNovels(commands.Cog):
         if not channel:
             return
 
-        message = await channel.fetch_message(message_id)
-        await message.remove_reaction(emoji, member)
+        if self.catch_up is not None:
+            self.catch_up.note_live_vote(message_id, member.id)
+
+        await self.reactions.put(message_id, (channel, message_id, member, emoji))
+
+    async def process_reactions(self, events):
+        """Applies a batch of reactions on list messages, with their votes written in one go."""
+
+        # Votes cast during warm-up wait here, in the order they came in.
+        await self.warmed_up.wait()
+
+        vns = {}
+        votes = []
 
-        vn = VisualNovel(database=self.db)
-        vn.load_from_db(message_id=message_id)
+        for channel, message_id, member, emoji in events:
+            try:
+                await channel.get_partial_message(message_id).remove_reaction(emoji, member)
+            except discord.HTTPException:
+                log.warning("Failed to remove the reaction of %s on message %s", member, message_id)
 
-        Rating = Query()
-        query = (Rating.member_id == member.id) & (Rating.vn_id == vn.doc_id)
+            if emoji.name not in VOTES:
+                continue
 
-        if emoji.name == "👍":
-            self.db.table(TABLE_RATING).upsert({"member_id": member.id, "vn_id": vn.doc_id, "rating": 1}, query)
+            if message_id not in vns:
+                vn = VisualNovel(database=self.db, embeds=self.embeds)
+                try:
+                    await vn.load_from_db(message_id=message_id)
+                except FileNotFoundError:
+                    continue
+                vns[message_id] = (vn, channel)
 
-        if emoji.name == "👎":
-            self.db.table(TABLE_RATING).upsert({"member_id": member.id, "vn_id": vn.doc_id, "rating": -1}, query)
+            votes.append((member.id, vns[message_id][0].doc_id, VOTES[emoji.name]))
 
-        if emoji.name == "❌":
-            self.db.table(TABLE_RATING).remove(query)
+        await self.db.apply_ratings(votes)
 
-        await vn.update_entry_ratings(message)
+        for vn, _ in vns.values():
+            self.mark_ratings_dirty(vn)
 
 
 def setup(bot):
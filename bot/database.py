@@ -0,0 +1,422 @@
+import itertools
+import logging
+import time
+from collections import defaultdict
+
+import tinydb
+from tinydb.storages import JSONStorage
+from tinydb.table import Document, Table
+
+from bot.helpers import TABLE_VISUAL_NOVEL, TABLE_RATING
+from bot.indexes import VisualNovelIndex, RatingIndex
+from bot.journal import JournaledTable
+from bot.ratings import RatingAggregate
+from bot.search import SearchIndex
+from bot.storage import WriteBehindStorage
+
+log = logging.getLogger(__name__)
+
+
+class DocIdTable(Table):
+    """A TinyDB table whose doc_id based operations don't walk the whole table.
+
+    Stock TinyDB converts the ID of every document in the table on each read
+    and write, even when a single document is touched. These overrides work on
+    the raw storage data instead, so their cost doesn't grow with the table
+    (besides whatever the storage itself does on read and write).
+    """
+
+    def get(self, cond=None, doc_id=None):
+        if doc_id is None:
+            return super().get(cond)
+
+        tables = self._storage.read() or {}
+        document = tables.get(self.name, {}).get(str(doc_id))
+
+        if document is None:
+            return None
+
+        return self.document_class(document, doc_id)
+
+    def insert(self, document):
+        if isinstance(document, Document):
+            return super().insert(document)
+
+        doc_id = self._get_next_id()
+
+        def updater(table):
+            table[str(doc_id)] = dict(document)
+
+        self._update_raw_table(updater)
+
+        return doc_id
+
+    def update(self, fields, cond=None, doc_ids=None):
+        if doc_ids is None or callable(fields):
+            return super().update(fields, cond, doc_ids)
+
+        updated_ids = list(doc_ids)
+
+        def updater(table):
+            for doc_id in updated_ids:
+                table[str(doc_id)].update(fields)
+
+        self._update_raw_table(updater)
+
+        return updated_ids
+
+    def remove(self, cond=None, doc_ids=None):
+        if doc_ids is None:
+            return super().remove(cond)
+
+        removed_ids = list(doc_ids)
+
+        def updater(table):
+            for doc_id in removed_ids:
+                table.pop(str(doc_id))
+
+        self._update_raw_table(updater)
+
+        return removed_ids
+
+    def _update_raw_table(self, updater):
+        tables = self._storage.read() or {}
+        updater(tables.setdefault(self.name, {}))
+        self._storage.write(tables)
+        self.clear_cache()
+
+
+class TinyDB(tinydb.TinyDB):
+    table_class = DocIdTable
+
+
+class Database:
+    """The bot's TinyDB database, together with the in-memory indexes kept on top of it.
+
+    Every write to the VN and rating tables goes through here so the indexes
+    never get out of sync with what's stored on disk.
+    """
+
+    def __init__(self, path, storage=JSONStorage, rating_journal=False, journal_compact_size=1024 * 1024, **kwargs):
+        if path is not None:
+            self.tinydb = TinyDB(path, storage=storage, sort_keys=True, indent=4, separators=(",", ": "), **kwargs)
+        else:
+            self.tinydb = TinyDB(storage=storage, **kwargs)
+
+        if rating_journal:
+            self.rating_table = self._open_rating_journal(path, journal_compact_size)
+        else:
+            self.rating_table = self._open_rating_table(path)
+
+        self.vn_index = VisualNovelIndex()
+        self.rating_index = RatingIndex()
+        self.ratings = RatingAggregate()
+        self.search_index = SearchIndex()
+        # Bumped on every change to a VN, so embeds rendered from its older fields aren't reused.
+        self.revisions = {}
+
+        started = time.perf_counter()
+        self.build_indexes()
+        # Reading every table happens here too, stores parse the file on first access.
+        self.load_seconds = time.perf_counter() - started
+
+    def build_indexes(self):
+        ratings = self.rating_table.all()
+        vns = self.table(TABLE_VISUAL_NOVEL).all()
+
+        self.vn_index.build(vns)
+        self.search_index.build(vns)
+        self.rating_index.build(ratings)
+        self.ratings.build(ratings)
+
+    def table(self, name):
+        return self.tinydb.table(name)
+
+    @property
+    def storage(self):
+        return self.tinydb.storage
+
+    @property
+    def concurrent_reads(self):
+        return not isinstance(self.storage, JSONStorage)
+
+    def flush(self):
+        """Writes any pending changes to disk, for storages that batch their writes."""
+
+        if isinstance(self.storage, WriteBehindStorage):
+            self.storage.flush()
+
+    def stats(self):
+        """Returns human readable lines describing the state of the storage."""
+
+        lines = []
+
+        if isinstance(self.storage, WriteBehindStorage):
+            lines.append(f"Pending writes: {self.storage.pending_writes}")
+            lines.append(f"Flushes: {self.storage.flush_count}")
+            lines.append(f"Last flush: {self.storage.last_flush_duration * 1000:.1f}ms")
+            lines.append(f"Slowest flush: {self.storage.max_flush_duration * 1000:.1f}ms")
+        else:
+            lines.append("The database writes every change straight to disk.")
+
+        if isinstance(self.rating_table, JournaledTable):
+            lines.append(f"Rating journal: {self.rating_table.journal_size} bytes")
+            lines.append(f"Rating journal compactions: {self.rating_table.compaction_count}")
+
+        return lines
+
+    def close(self):
+        if isinstance(self.rating_table, JournaledTable):
+            self.rating_table.close()
+
+        self.tinydb.close()
+
+    def _open_rating_journal(self, path, compact_size):
+        exists = JournaledTable.exists(path)
+        journal = JournaledTable(path, compact_size=compact_size)
+
+        if not exists:
+            # First start with the journal, move the ratings over from the TinyDB file.
+            journal.seed({document.doc_id: dict(document) for document in self.table(TABLE_RATING).all()})
+            self.tinydb.drop_table(TABLE_RATING)
+            log.info("Moved %s rating(s) into the rating journal", len(journal))
+
+        return journal
+
+    def _open_rating_table(self, path):
+        table = self.table(TABLE_RATING)
+
+        if path is None or not JournaledTable.exists(path):
+            return table
+
+        # The journal was turned off, move the ratings back into the TinyDB file.
+        journal = JournaledTable(path, compact_size=None)
+        journal.close()
+
+        tables = self.storage.read() or {}
+        tables[TABLE_RATING] = {str(doc_id): document for doc_id, document in journal.documents.items()}
+        self.storage.write(tables)
+        table.clear_cache()
+
+        journal.delete()
+        log.info("Moved %s rating(s) from the rating journal back into the database", len(journal))
+
+        return table
+
+    def get_vn(self, doc_id):
+        return self.table(TABLE_VISUAL_NOVEL).get(doc_id=doc_id)
+
+    def all_vns(self):
+        return sorted(self.table(TABLE_VISUAL_NOVEL).all(), key=lambda document: document.doc_id)
+
+    def iter_vns_with_ratings(self):
+        """Yields the (doc_id, fields, (up, down)) of every VN, going over the table instead of listing it."""
+
+        for document in self.table(TABLE_VISUAL_NOVEL):
+            yield document.doc_id, document, self.ratings.get(document.doc_id)
+
+    def find_vn(self, *, message_id=None, name=None, abbreviations=None):
+        doc_id = self.vn_index.find(message_id=message_id, name=name, abbreviations=abbreviations)
+
+        if doc_id is None:
+            return None
+
+        return self.get_vn(doc_id)
+
+    def search_vns(self, query, limit=5):
+        return self.search_index.search(query, limit)
+
+    def insert_vn(self, fields):
+        self.vn_index.check_abbreviations(fields.get("abbreviations"))
+
+        doc_id = self.table(TABLE_VISUAL_NOVEL).insert(fields)
+        self.vn_index.add(doc_id, fields)
+        self.search_index.add(doc_id, fields)
+
+        return doc_id
+
+    def insert_vns(self, documents):
+        """Inserts many VNs with a single write of the storage and returns their doc_ids."""
+
+        for fields in documents:
+            self.vn_index.check_abbreviations(fields.get("abbreviations"))
+
+        doc_ids = self.table(TABLE_VISUAL_NOVEL).insert_multiple(documents)
+
+        for doc_id, fields in zip(doc_ids, documents):
+            self.vn_index.add(doc_id, fields)
+            self.search_index.add(doc_id, fields)
+
+        return doc_ids
+
+    def update_vn(self, doc_id, fields):
+        if "abbreviations" in fields:
+            self.vn_index.check_abbreviations(fields["abbreviations"], doc_id=doc_id)
+
+        self.table(TABLE_VISUAL_NOVEL).update(fields, doc_ids=[doc_id])
+
+        document = self.get_vn(doc_id)
+        self.vn_index.update(doc_id, document)
+        self.search_index.update(doc_id, document)
+        self.revisions[doc_id] = self.revisions.get(doc_id, 0) + 1
+
+        return self.revisions[doc_id]
+
+    def remove_vn(self, doc_id):
+        self.table(TABLE_VISUAL_NOVEL).remove(doc_ids=[doc_id])
+        removed = self.rating_index.vn_doc_ids(doc_id)
+        if removed:
+            self.rating_table.remove(doc_ids=removed)
+
+        for rating_id in removed:
+            self.rating_index.remove(rating_id)
+
+        self.vn_index.remove(doc_id)
+        self.search_index.remove(doc_id)
+        self.ratings.drop(doc_id)
+        self.revisions.pop(doc_id, None)
+
+    def get_rating(self, member_id, vn_id):
+        doc_id = self.rating_index.find(member_id, vn_id)
+
+        if doc_id is None:
+            return None
+
+        return self.rating_index.rating(doc_id)
+
+    def set_rating(self, member_id, vn_id, rating):
+        doc_id = self.rating_index.find(member_id, vn_id)
+
+        if doc_id is None:
+            doc_id = self.rating_table.insert({"member_id": member_id, "vn_id": vn_id, "rating": rating})
+            self.rating_index.add(doc_id, member_id, vn_id, rating)
+            self.ratings.add(vn_id, rating)
+            return
+
+        previous = self.rating_index.rating(doc_id)
+
+        if previous == rating:
+            return
+
+        self.rating_table.update({"rating": rating}, doc_ids=[doc_id])
+        self.rating_index.set_rating(doc_id, rating)
+        self.ratings.change(vn_id, previous, rating)
+
+    def remove_rating(self, member_id, vn_id):
+        doc_id = self.rating_index.find(member_id, vn_id)
+
+        if doc_id is None:
+            return
+
+        self.rating_table.remove(doc_ids=[doc_id])
+        _, _, rating = self.rating_index.remove(doc_id)
+        self.ratings.remove(vn_id, rating)
+
+    def apply_ratings(self, votes):
+        """Applies a batch of (member_id, vn_id, rating) votes, a rating of None removes the vote.
+
+        The last vote of a member on a VN wins. The whole batch is written with
+        at most one insert, one remove and one update per rating value. Votes on
+        VNs that no longer exist are dropped.
+        """
+
+        final = {}
+        for member_id, vn_id, rating in votes:
+            # The VN may have been removed while the batch waited for the writer.
+            if vn_id in self.vn_index.names:
+                final[(member_id, vn_id)] = rating
+
+        inserts = []
+        updates = defaultdict(list)
+        removes = []
+
+        for (member_id, vn_id), rating in final.items():
+            doc_id = self.rating_index.find(member_id, vn_id)
+
+            if doc_id is None:
+                if rating is not None:
+                    inserts.append({"member_id": member_id, "vn_id": vn_id, "rating": rating})
+            elif rating is None:
+                removes.append(doc_id)
+            elif self.rating_index.rating(doc_id) != rating:
+                updates[rating].append(doc_id)
+
+        if inserts:
+            doc_ids = self.rating_table.insert_multiple(inserts)
+            for doc_id, document in zip(doc_ids, inserts):
+                self.rating_index.add(doc_id, document["member_id"], document["vn_id"], document["rating"])
+                self.ratings.add(document["vn_id"], document["rating"])
+
+        for rating, doc_ids in updates.items():
+            self.rating_table.update({"rating": rating}, doc_ids=doc_ids)
+            for doc_id in doc_ids:
+                _, vn_id, previous = self.rating_index.documents[doc_id]
+                self.rating_index.set_rating(doc_id, rating)
+                self.ratings.change(vn_id, previous, rating)
+
+        if removes:
+            self.rating_table.remove(doc_ids=removes)
+            for doc_id in removes:
+                _, vn_id, rating = self.rating_index.remove(doc_id)
+                self.ratings.remove(vn_id, rating)
+
+    def all_ratings(self):
+        return self.rating_table.all()
+
+    def recount_ratings(self):
+        """Checks the cached rating counts against the rating table, rebuilding them if they drifted.
+
+        Returns the drift like RatingAggregate.drift. Run as a single write, so no
+        vote can land between reading the table and rebuilding from it.
+        """
+
+        documents = self.all_ratings()
+        drifted = self.ratings.drift(documents)
+
+        if drifted:
+            self.ratings.build(documents)
+
+        return drifted
+
+    def member_ratings(self, member_id):
+        return self.rating_index.member_ratings(member_id)
+
+    def member_votes(self, member_id):
+        """Returns the (VN name, rating) pairs of every vote of the member, sorted by name."""
+
+        return sorted(
+            ((self.vn_index.names[vn_id], rating) for vn_id, rating in self.member_ratings(member_id).items()),
+            key=lambda vote: vote[0].lower(),
+        )
+
+    def top_vns(self, limit=10):
+        """Returns the (doc_id, name, upvotes, downvotes) of the best ranked VNs."""
+
+        # Ratings of VNs removed before their votes were, left in older files, rank too.
+        vn_ids = (vn_id for vn_id in self.ratings.ranking if vn_id in self.vn_index.names)
+
+        return [
+            (vn_id, self.vn_index.names[vn_id], *self.ratings.get(vn_id))
+            for vn_id in itertools.islice(vn_ids, limit)
+        ]
+
+    def rating_members(self):
+        return self.rating_index.members()
+
+    def remove_member_ratings(self, member_ids):
+        """Removes every rating of the given members and returns the vn_id of each removed rating."""
+
+        doc_ids = [doc_id for member_id in member_ids for doc_id in self.rating_index.member_doc_ids(member_id)]
+
+        if not doc_ids:
+            return []
+
+        self.rating_table.remove(doc_ids=doc_ids)
+        vn_ids = []
+
+        for doc_id in doc_ids:
+            _, vn_id, rating = self.rating_index.remove(doc_id)
+            self.ratings.remove(vn_id, rating)
+            vn_ids.append(vn_id)
+
+        return vn_ids
@@ -0,0 +1,45 @@
+import copy
+from collections import OrderedDict
+
+
+class EmbedCache:
+    """A small LRU cache of rendered VN list embeds, as dicts keyed by VN doc_id.
+
+    Every embed is stored along with the version it was rendered for, the
+    revision and the rating counts of the VN, so a vote or an edit of the VN
+    makes the next lookup miss. `invalidate` only frees the entry early.
+    """
+
+    def __init__(self, size=128):
+        self.size = size
+        self.embeds = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, doc_id, version):
+        entry = self.embeds.get(doc_id)
+
+        if entry is None or entry[0] != version:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.embeds.move_to_end(doc_id)
+        return copy.deepcopy(entry[1])
+
+    def put(self, doc_id, version, embed):
+        self.embeds[doc_id] = (version, copy.deepcopy(embed))
+        self.embeds.move_to_end(doc_id)
+
+        while len(self.embeds) > self.size:
+            self.embeds.popitem(last=False)
+
+    def invalidate(self, doc_id):
+        self.embeds.pop(doc_id, None)
+
+    def stats(self):
+        return [
+            f"Cached embeds: {len(self.embeds)} of {self.size}",
+            f"Embed cache hits: {self.hits}, misses: {self.misses}",
+        ]
@@ -1,14 +1,26 @@
 import discord
-from tinydb import Query, where
+
+ICON_URL = "https://media.discordapp.net/attachments/729276573496246304/747178571834982431/bonkshinbookmirrored.png"
 
 TABLE_VISUAL_NOVEL = "visual_novel"
 TABLE_RATING = "rating"
 
+LIST_REACTIONS = ("👍", "👎", "❌")
+
+# The rating each reaction on a list message stands for, None removes the vote.
+VOTES = {"👍": 1, "👎": -1, "❌": None}
+
+NEWS_FOOTER = (
+    "Brought to you by Furry Visual Novels server. Join us for vn-lists, development channels and more. "
+    "discord.gg/GFjSPkh"
+)
+
 
 class VisualNovel:
     def __init__(self, *, database, name=None, undetermined=None, android_support=None, image=None, store=None,
-                 authors=None, abbreviations=None):
+                 authors=None, abbreviations=None, embeds=None):
         self.db = database
+        self.embeds = embeds
         self.doc_id = None
         self.name = name
         self.abbreviations = abbreviations
@@ -18,8 +30,36 @@ class VisualNovel:
         self.android_support = android_support
         self.undetermined = undetermined
         self.message_id = None
+        self.channel_id = None
+        # The database revision the fields were read at, part of the embed cache version.
+        self.revision = None
+
+    def list_channel(self, channel_list):
+        return channel_list["vn_undetermined" if self.undetermined else "vn_list"]
+
+    def message_channel(self, channel_list):
+        """Returns the channel the list message of this VN was posted in."""
+
+        for channel in (channel_list["vn_list"], channel_list["vn_undetermined"]):
+            if channel.id == self.channel_id:
+                return channel
+
+        # VNs posted before the channel was stored are in the channel their list status points to.
+        return self.list_channel(channel_list)
+
+    def jump_url(self, guild_id, channel_list):
+        return f"https://discord.com/channels/{guild_id}/{self.message_channel(channel_list).id}/{self.message_id}"
+
+    def build_embed(self):
+        """Builds the list embed of this VN with its current ratings."""
+
+        version = (self.revision, self.db.ratings.get(self.doc_id))
+        cached = self.embeds is not None and self.revision is not None
+        embed = self.embeds.get(self.doc_id, version) if cached else None
+
+        if embed is not None:
+            return discord.Embed.from_dict(embed)
 
-    async def post_to_list(self, channel_list):
         embed = discord.Embed(
             colour=discord.Colour.blurple(),
             title=self.name,
@@ -30,66 +70,74 @@ class VisualNovel:
         embed.add_field(name="Abbreviations", value=self.pretty_abbreviations())
         embed.add_field(name="Android Support", value="Yes" if self.android_support else "No")
         embed.set_image(url=self.image)
-        embed.set_author(name="FVN Bot", icon_url="https://media.discordapp.net/attachments/729276573496246304/747178571834982431/bonkshinbookmirrored.png")
+        embed.set_author(name="FVN Bot", icon_url=ICON_URL)
         embed.set_footer(text=f"{self.name}, by {', '.join(self.authors)}")
 
-        channel = channel_list["vn_undetermined" if self.undetermined else "vn_list"]
+        if cached and self.doc_id:
+            self.embeds.put(self.doc_id, version, embed.to_dict())
 
-        message = await channel.send(embed=embed)
-        await message.add_reaction("👍")
-        await message.add_reaction("👎")
-        await message.add_reaction("❌")
+        return embed
 
-        if self.doc_id:
-            self.db.table(TABLE_VISUAL_NOVEL).update({"message_id": message.id}, doc_ids=[self.doc_id])
-        else:
-            raise Exception("VN database ID not found before saving to list.")
+    def build_news_embed(self, title, url):
+        """Builds the embed of an update of this VN for the news channel, from its list embed."""
 
-    async def update_to_list(self, channel_list):
-        try:
-            channel = channel_list["vn_undetermined" if self.undetermined else "vn_list"]
-            message = await channel.fetch_message(self.message_id)
+        embed = self.build_embed()
+        embed.title = title
+        embed.url = url
+        embed.set_footer(text=NEWS_FOOTER)
 
-            embed = message.embeds[0]
+        return embed
 
-            embed.set_field_at(0, name="Current Ratings", value=self.calculate_ratings())
-            embed.set_field_at(1, name="Abbreviations", value=self.pretty_abbreviations())
-            embed.set_field_at(2, name="Android Support", value="Yes" if self.android_support else "No")
-            embed.set_image(url=self.image)
-            embed.set_author(name="FVN Bot", icon_url="https://media.discordapp.net/attachments/729276573496246304/747178571834982431/bonkshinbookmirrored.png")
-            embed.set_footer(text=f"{self.name}, by {', '.join(self.authors)}")
+    async def post_to_list(self, channel_list):
+        message = await self.send_to_list(channel_list)
 
-            await message.edit(embed=embed)
+        for emoji in LIST_REACTIONS:
+            await message.add_reaction(emoji)
 
-        except discord.NotFound:
-            channel = channel_list["vn_undetermined" if not self.undetermined else "vn_list"]
-            message = await channel.fetch_message(self.message_id)
-            await message.delete()
+    async def send_to_list(self, channel_list):
+        """Sends the list message of this VN, without its reactions, and stores where it went."""
 
-            await self.post_to_list(channel_list)
+        if not self.doc_id:
+            raise Exception("VN database ID not found before saving to list.")
 
-    async def update_entry_ratings(self, message):
-        ratings = self.calculate_ratings()
+        channel = self.list_channel(channel_list)
+        message = await channel.send(embed=self.build_embed())
 
-        embed = message.embeds[0]
-        embed.set_field_at(0, name="Current Ratings", value=ratings)
+        self.message_id = message.id
+        self.channel_id = channel.id
+        await self.db.update_vn(self.doc_id, {"message_id": message.id, "channel_id": channel.id})
 
-        await message.edit(embed=embed)
+        return message
 
-    def calculate_ratings(self):
-        ratings_up = 0
-        ratings_down = 0
+    async def update_to_list(self, channel_list):
+        channel = self.list_channel(channel_list)
 
-        for ratings in self.db.table(TABLE_RATING).search(where("vn_id") == self.doc_id):
-            if ratings["rating"] == 1:
-                ratings_up += 1
-            if ratings["rating"] == -1:
-                ratings_down += 1
+        if self.channel_id in (None, channel.id):
+            try:
+                await channel.get_partial_message(self.message_id).edit(embed=self.build_embed())
+                return
+            except discord.NotFound:
+                pass
+
+        # The VN moved between the lists, so its message is in the other channel.
+        other_channel = channel_list["vn_list" if self.undetermined else "vn_undetermined"]
+        try:
+            await other_channel.get_partial_message(self.message_id).delete()
+        except discord.NotFound:
+            pass
+
+        await self.post_to_list(channel_list)
+
+    async def update_entry_ratings(self, channel):
+        await channel.get_partial_message(self.message_id).edit(embed=self.build_embed())
+
+    def calculate_ratings(self):
+        ratings_up, ratings_down = self.db.ratings.get(self.doc_id)
 
         return f"👍 {ratings_up} 👎 {ratings_down}"
 
-    def add_to_db(self):
-        self.doc_id = self.db.table(TABLE_VISUAL_NOVEL).insert({
+    async def add_to_db(self):
+        self.doc_id = await self.db.insert_vn({
             "name": self.name,
             "abbreviations": self.abbreviations,
             "authors": self.authors,
@@ -97,13 +145,14 @@ class VisualNovel:
             "image": self.image,
             "android_support": self.android_support,
             "undetermined": self.undetermined,
-            "message_id": None
+            "message_id": None,
+            "channel_id": None,
         })
+        self.revision = self.db.revisions.get(self.doc_id, 0)
         return self.doc_id
 
-    def update_to_db(self):
-        VN = Query()
-        self.db.table(TABLE_VISUAL_NOVEL).update({
+    async def update_to_db(self):
+        revision = await self.db.update_vn(self.doc_id, {
             "name": self.name,
             "abbreviations": self.abbreviations,
             "authors": self.authors,
@@ -111,10 +160,16 @@ class VisualNovel:
             "image": self.image,
             "android_support": self.android_support,
             "undetermined": self.undetermined,
-            "message_id": self.message_id
-        }, doc_ids=[self.doc_id])
+            "message_id": self.message_id,
+            "channel_id": self.channel_id,
+        })
 
-    def load_from_db(self, *, doc_id=None, name=None, abbreviations=None, message_id=None):
+        # Only once the write is done, a rating edit rendering meanwhile would cache the old fields again.
+        if self.embeds is not None:
+            self.embeds.invalidate(self.doc_id)
+        self.revision = revision
+
+    async def load_from_db(self, *, doc_id=None, name=None, abbreviations=None, message_id=None):
         def fill_fields(fields):
             self.doc_id = fields.doc_id
             self.name = fields["name"]
@@ -125,27 +180,24 @@ class VisualNovel:
             self.android_support = fields["android_support"]
             self.undetermined = fields["undetermined"]
             self.message_id = fields["message_id"]
-
-        VN = Query()
+            self.channel_id = fields.get("channel_id")
 
         if doc_id:
-            document = self.db.table(TABLE_VISUAL_NOVEL).get(doc_id=doc_id)
+            # Read before the fields, so a change landing in between only makes the cache miss.
+            revision = self.db.revisions.get(doc_id, 0)
+            document = await self.db.get_vn(doc_id)
+            if document is None:
+                raise FileNotFoundError("No VN Found.")
             fill_fields(document)
+            self.revision = revision
             return
 
-        vns = None
+        document = await self.db.find_vn(message_id=message_id, name=name, abbreviations=abbreviations)
 
-        if message_id:
-            vns = self.db.table(TABLE_VISUAL_NOVEL).search(VN.message_id == message_id)
-
-        if name:
-            vns = self.db.table(TABLE_VISUAL_NOVEL).search(VN.name.test(lambda s: s.lower() == name.lower()))
-
-        if not vns and abbreviations:
-            vns = self.db.table(TABLE_VISUAL_NOVEL).search(VN.abbreviations.any(abbreviations))
-
-        if vns:
-            fill_fields(vns[0])
+        if document:
+            fill_fields(document)
+            # Unknown until the doc_id is, these fields don't go through the embed cache.
+            self.revision = None
             return
 
         raise FileNotFoundError("No VN Found.")
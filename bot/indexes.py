@@ -0,0 +1,166 @@
+def normalize(text):
+    return text.strip().lower()
+
+
+class VisualNovelIndex:
+    """In-memory lookup tables from message ID, name and abbreviation to a VN doc_id.
+
+    Names and abbreviations are stored normalized, so lookups are done with
+    whatever the user typed after going through `normalize`. The name of every
+    VN is also kept as it was written, for listing VNs without loading them.
+    """
+
+    def __init__(self):
+        self.by_message_id = {}
+        self.by_name = {}
+        self.by_abbreviation = {}
+        self.keys = {}
+        self.names = {}
+
+    def build(self, documents):
+        self.by_message_id.clear()
+        self.by_name.clear()
+        self.by_abbreviation.clear()
+        self.keys.clear()
+        self.names.clear()
+
+        for document in sorted(documents, key=lambda doc: doc.doc_id):
+            self.add(document.doc_id, document)
+
+    def add(self, doc_id, fields):
+        message_id = fields.get("message_id")
+        name = normalize(fields["name"]) if fields.get("name") else None
+        abbreviations = [normalize(abbreviation) for abbreviation in fields.get("abbreviations") or []]
+
+        # The first VN to claim a key keeps it, like the first search result used to.
+        if message_id:
+            self.by_message_id.setdefault(message_id, doc_id)
+        if name:
+            self.by_name.setdefault(name, doc_id)
+        for abbreviation in abbreviations:
+            self.by_abbreviation.setdefault(abbreviation, doc_id)
+
+        self.keys[doc_id] = (message_id, name, abbreviations)
+        self.names[doc_id] = fields.get("name")
+
+    def remove(self, doc_id):
+        if doc_id not in self.keys:
+            return
+
+        message_id, name, abbreviations = self.keys.pop(doc_id)
+        del self.names[doc_id]
+
+        _discard(self.by_message_id, message_id, doc_id)
+        _discard(self.by_name, name, doc_id)
+        for abbreviation in abbreviations:
+            _discard(self.by_abbreviation, abbreviation, doc_id)
+
+    def update(self, doc_id, fields):
+        self.remove(doc_id)
+        self.add(doc_id, fields)
+
+    def find(self, *, message_id=None, name=None, abbreviations=None):
+        doc_id = None
+
+        if message_id:
+            doc_id = self.by_message_id.get(message_id)
+
+        if name:
+            doc_id = self.by_name.get(normalize(name))
+
+        if not doc_id and abbreviations:
+            for abbreviation in abbreviations:
+                doc_id = self.by_abbreviation.get(normalize(abbreviation))
+                if doc_id:
+                    break
+
+        return doc_id
+
+    def check_abbreviations(self, abbreviations, doc_id=None):
+        """Raises ValueError if any of the abbreviations already belongs to another VN."""
+
+        for abbreviation in abbreviations or []:
+            owner = self.by_abbreviation.get(normalize(abbreviation))
+            if owner is not None and owner != doc_id:
+                raise ValueError(f"The abbreviation \"{abbreviation}\" is already used by another VN.")
+
+
+class RatingIndex:
+    """In-memory lookup tables from a (member_id, vn_id) pair to its rating doc_id.
+
+    Each member also gets a reverse index of the VNs they voted for, each VN one
+    of the members who voted for it, and the rating of every document is kept so
+    a vote change doesn't need to read it back.
+    """
+
+    def __init__(self):
+        self.by_pair = {}
+        self.by_member = {}
+        self.by_vn = {}
+        self.documents = {}
+
+    def build(self, documents):
+        self.by_pair.clear()
+        self.by_member.clear()
+        self.by_vn.clear()
+        self.documents.clear()
+
+        for document in documents:
+            self.add(document.doc_id, document["member_id"], document["vn_id"], document["rating"])
+
+    def find(self, member_id, vn_id):
+        return self.by_pair.get((member_id, vn_id))
+
+    def rating(self, doc_id):
+        return self.documents[doc_id][2]
+
+    def add(self, doc_id, member_id, vn_id, rating):
+        self.by_pair[(member_id, vn_id)] = doc_id
+        self.by_member.setdefault(member_id, {})[vn_id] = doc_id
+        self.by_vn.setdefault(vn_id, {})[member_id] = doc_id
+        self.documents[doc_id] = (member_id, vn_id, rating)
+
+    def set_rating(self, doc_id, rating):
+        member_id, vn_id, _ = self.documents[doc_id]
+        self.documents[doc_id] = (member_id, vn_id, rating)
+
+    def remove(self, doc_id):
+        """Removes a rating document from the index and returns its (member_id, vn_id, rating)."""
+
+        member_id, vn_id, rating = self.documents.pop(doc_id)
+
+        _discard(self.by_pair, (member_id, vn_id), doc_id)
+
+        votes = self.by_member.get(member_id, {})
+        _discard(votes, vn_id, doc_id)
+        if not votes:
+            self.by_member.pop(member_id, None)
+
+        voters = self.by_vn.get(vn_id, {})
+        _discard(voters, member_id, doc_id)
+        if not voters:
+            self.by_vn.pop(vn_id, None)
+
+        return member_id, vn_id, rating
+
+    def member_ratings(self, member_id):
+        """Returns a dict mapping each VN the member voted for to their rating."""
+
+        return {
+            vn_id: self.documents[doc_id][2]
+            for vn_id, doc_id in self.by_member.get(member_id, {}).items()
+        }
+
+    def vn_doc_ids(self, vn_id):
+        return list(self.by_vn.get(vn_id, {}).values())
+
+    def member_doc_ids(self, member_id):
+        return list(self.by_member.get(member_id, {}).values())
+
+    def members(self):
+        return list(self.by_member)
+
+
+def _discard(index, key, doc_id):
+    if key is not None and index.get(key) == doc_id:
+        del index[key]
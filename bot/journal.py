@@ -0,0 +1,209 @@
+import json
+import logging
+import os
+import threading
+
+from tinydb.table import Document
+
+log = logging.getLogger(__name__)
+
+
+class JournaledTable:
+    """A table stored as a snapshot file plus an append-only journal of changes.
+
+    Every insert, update and remove appends one line to the journal instead of
+    rewriting the whole table, so the cost of a write doesn't depend on the
+    size of the table. On load the snapshot is read and the journal replayed on
+    top of it. Once the journal grows past `compact_size` bytes it is folded
+    into a new snapshot by a background thread.
+
+    Only the doc_id based subset of the TinyDB table API used by `Database` is
+    implemented.
+    """
+
+    def __init__(self, path, compact_size=1024 * 1024):
+        self.snapshot_path = f"{path}.snapshot"
+        self.journal_path = f"{path}.journal"
+        self.compacting_path = f"{path}.journal.compacting"
+        self.compact_size = compact_size
+
+        self.documents = {}
+        self.next_id = 1
+        self.compaction = None
+        self.compaction_count = 0
+
+        self._load()
+
+        # Finish a compaction that was interrupted by a crash before rotating the journal again.
+        if os.path.exists(self.compacting_path):
+            self._write_snapshot(list(self.documents.items()))
+
+        self.journal = open(self.journal_path, "a", encoding="utf-8")
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(f"{path}.snapshot") or os.path.exists(f"{path}.journal")
+
+    @property
+    def journal_size(self):
+        return self.journal.tell()
+
+    def get(self, doc_id):
+        document = self.documents.get(doc_id)
+
+        if document is None:
+            return None
+
+        return Document(document, doc_id)
+
+    def all(self):
+        return [Document(document, doc_id) for doc_id, document in self.documents.items()]
+
+    def __len__(self):
+        return len(self.documents)
+
+    def insert(self, document):
+        doc_id = self.next_id
+        self._set(doc_id, dict(document))
+
+        return doc_id
+
+    def insert_multiple(self, documents):
+        return [self.insert(document) for document in documents]
+
+    def update(self, fields, doc_ids):
+        for doc_id in doc_ids:
+            # A new dict is stored so a running compaction never sees a document change under it.
+            self._set(doc_id, {**self.documents[doc_id], **fields})
+
+        return list(doc_ids)
+
+    def remove(self, doc_ids):
+        for doc_id in doc_ids:
+            self.documents.pop(doc_id)
+            self._append({"op": "remove", "doc_id": doc_id})
+
+        self._maybe_compact()
+
+        return list(doc_ids)
+
+    def seed(self, documents):
+        """Replaces the whole table with the given {doc_id: document} dict and snapshots it."""
+
+        self.documents = dict(documents)
+        self.next_id = max(self.documents, default=0) + 1
+        self.compact(wait=True)
+
+    def delete(self):
+        for path in (self.snapshot_path, self.journal_path, self.compacting_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def compact(self, wait=False):
+        """Folds the journal into a new snapshot.
+
+        The journal is rotated right away and the snapshot is written by a
+        background thread, unless `wait` is given.
+        """
+
+        if self.compaction and self.compaction.is_alive():
+            if not wait:
+                return
+            self.compaction.join()
+
+        self.journal.close()
+        os.replace(self.journal_path, self.compacting_path)
+        self.journal = open(self.journal_path, "a", encoding="utf-8")
+
+        documents = list(self.documents.items())
+
+        self.compaction = threading.Thread(target=self._write_snapshot, args=(documents,), daemon=True)
+        self.compaction.start()
+
+        if wait:
+            self.compaction.join()
+
+    def close(self):
+        if self.compaction:
+            self.compaction.join()
+
+        self.journal.close()
+
+    def _set(self, doc_id, document):
+        self.documents[doc_id] = document
+        self.next_id = max(self.next_id, doc_id + 1)
+        self._append({"op": "set", "doc_id": doc_id, "document": document})
+
+        self._maybe_compact()
+
+    def _append(self, entry):
+        self.journal.write(json.dumps(entry, sort_keys=True) + "\n")
+        self.journal.flush()
+
+    def _maybe_compact(self):
+        if self.compact_size and self.journal_size >= self.compact_size:
+            self.compact()
+
+    def _write_snapshot(self, documents):
+        temp_path = f"{self.snapshot_path}.tmp"
+
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for doc_id, document in sorted(documents):
+                f.write(json.dumps({"doc_id": doc_id, "document": document}, sort_keys=True) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(temp_path, self.snapshot_path)
+        os.remove(self.compacting_path)
+
+        self.compaction_count += 1
+        log.info("Compacted %s into a snapshot of %s document(s)", self.journal_path, len(documents))
+
+    def _load(self):
+        self.documents = read_documents(self.snapshot_path, (self.compacting_path, self.journal_path))
+
+        if self.documents:
+            self.next_id = max(self.documents) + 1
+
+
+def read_documents(snapshot_path, journal_paths):
+    """Returns the {doc_id: document} dict of a snapshot with the given journals replayed on top, in order."""
+
+    documents = {}
+
+    if os.path.exists(snapshot_path):
+        with open(snapshot_path, encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                documents[entry["doc_id"]] = entry["document"]
+
+    # A compaction interrupted by a crash leaves its journal behind. Replaying
+    # it is safe even if the snapshot was already replaced, as every entry
+    # sets or removes a whole document.
+    for path in journal_paths:
+        if os.path.exists(path):
+            _replay(documents, path)
+
+    return documents
+
+
+def read_journaled(path):
+    """Reads the journaled table of a database without opening it for writing, for tools running next to the bot."""
+
+    return read_documents(f"{path}.snapshot", (f"{path}.journal.compacting", f"{path}.journal"))
+
+
+def _replay(documents, path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Only the last line can be torn, by a crash in the middle of a write.
+                log.warning("Skipping a torn entry at the end of %s", path)
+                break
+
+            if entry["op"] == "set":
+                documents[entry["doc_id"]] = entry["document"]
+            if entry["op"] == "remove":
+                documents.pop(entry["doc_id"], None)
@@ -0,0 +1,168 @@
+import bisect
+import functools
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from aiohttp import web
+
+log = logging.getLogger(__name__)
+
+# Upper bounds in seconds, from a fast in-memory read up to a slow rebuild.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+RATE_LIMIT_MESSAGE = 'We are being rate limited. Retrying in %.2f seconds. Handled under the bucket "%s"'
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, quantile):
+        """Returns the upper bound of the bucket the quantile falls in."""
+
+        rank = quantile * self.count
+        seen = 0
+
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+
+        return float("inf")
+
+
+class Metrics:
+    """Latency histograms and counters of the bot, labelled like Prometheus metrics.
+
+    Recording takes a lock and a dict lookup, so it can be done from the
+    database threads and on every vote. The stats command shows a summary and,
+    if enabled, a local HTTP endpoint serves everything in Prometheus' format.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = defaultdict(int)
+        self.runner = None
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def increment(self, name, amount=1, **labels):
+        with self.lock:
+            self.counters[(name, tuple(sorted(labels.items())))] += amount
+
+    def instrument_http(self, http):
+        """Counts and times every request discord.py sends, along with the 429s it gets back, by route."""
+
+        request = http.request
+
+        @functools.wraps(request)
+        async def instrumented(route, **kwargs):
+            path = f"{route.method} {route.path}"
+            started = time.perf_counter()
+
+            try:
+                return await request(route, **kwargs)
+            finally:
+                self.increment("fvnbot_discord_requests_total", route=path)
+                self.observe("fvnbot_discord_request_seconds", time.perf_counter() - started, route=path)
+
+        http.request = instrumented
+        logging.getLogger("discord.http").addHandler(RateLimitHandler(self))
+
+    def summary(self):
+        """Returns human readable lines with the counts and quantiles of every metric."""
+
+        lines = []
+
+        with self.lock:
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                lines.append(
+                    f"{_describe(name, labels)}: {histogram.count}, avg {histogram.sum / histogram.count * 1000:.1f}ms, "
+                    f"p50 <{histogram.quantile(0.5) * 1000:g}ms, p99 <{histogram.quantile(0.99) * 1000:g}ms"
+                )
+
+            for (name, labels), value in sorted(self.counters.items()):
+                lines.append(f"{_describe(name, labels)}: {value}")
+
+        return lines
+
+    def render(self):
+        """Returns every metric in the Prometheus text format."""
+
+        lines = []
+
+        with self.lock:
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip((*histogram.buckets, "+Inf"), histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+
+            for (name, labels), value in sorted(self.counters.items()):
+                lines.append(f"{name}{_labels(labels)} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    async def start_server(self, port, host="127.0.0.1"):
+        async def handle(request):
+            return web.Response(text=self.render(), content_type="text/plain")
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle)
+
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+
+        log.info("Serving metrics on http://%s:%s/metrics", host, port)
+
+    async def stop_server(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+
+class RateLimitHandler(logging.Handler):
+    """Counts the 429s discord.py logs, it retries them by itself so they never reach the caller."""
+
+    def __init__(self, metrics):
+        super().__init__(logging.WARNING)
+        self.metrics = metrics
+
+    def emit(self, record):
+        if record.msg != RATE_LIMIT_MESSAGE:
+            return
+
+        # Buckets look like "channel_id:guild_id:path".
+        _, bucket = record.args
+        self.metrics.increment("fvnbot_discord_rate_limits_total", route=bucket.split(":", 2)[-1])
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+def _describe(name, labels):
+    return name + "".join(f" {value}" for _, value in labels)
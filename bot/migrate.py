@@ -0,0 +1,81 @@
+"""Converts the TinyDB JSON database into an SQLite database.
+
+Usage: python -m bot.migrate <json database> <sqlite database>
+
+The SQLite database must not exist yet. After copying, the VN and rating row
+counts and the rating totals of every VN are compared against the JSON
+database, and the command exits with an error if anything doesn't match.
+"""
+import os
+import sys
+
+from bot.database import Database
+from bot.journal import JournaledTable
+from bot.sqlite_database import SQLiteDatabase
+
+
+def migrate(json_path, sqlite_path):
+    if not os.path.exists(json_path):
+        raise SystemExit(f"{json_path} doesn't exist.")
+
+    if os.path.exists(sqlite_path):
+        raise SystemExit(f"{sqlite_path} already exists, refusing to overwrite it.")
+
+    source = Database(json_path, rating_journal=JournaledTable.exists(json_path))
+    target = SQLiteDatabase(sqlite_path)
+
+    vns = source.all_vns()
+    ratings = source.all_ratings()
+
+    skipped_abbreviations, skipped_ratings = target.import_documents(vns, ratings)
+
+    for doc_id, abbreviation in skipped_abbreviations:
+        print(f"Skipped the abbreviation \"{abbreviation}\" of VN {doc_id}, it's used by another VN.")
+
+    if skipped_ratings:
+        print(f"Skipped {len(skipped_ratings)} rating(s) of VNs that don't exist anymore.")
+
+    errors = verify(source, target, len(vns), len(ratings) - len(skipped_ratings))
+
+    source.close()
+    target.close()
+
+    for error in errors:
+        print(error)
+
+    if errors:
+        raise SystemExit("Migration failed verification.")
+
+    print(f"Migrated {len(vns)} VN(s) and {len(ratings) - len(skipped_ratings)} rating(s) to {sqlite_path}.")
+
+
+def verify(source, target, vn_count, rating_count):
+    errors = []
+
+    migrated_vns = len(target.all_vns())
+    migrated_ratings = len(target.all_ratings())
+
+    if migrated_vns != vn_count:
+        errors.append(f"Expected {vn_count} VN(s), found {migrated_vns}.")
+
+    if migrated_ratings != rating_count:
+        errors.append(f"Expected {rating_count} rating(s), found {migrated_ratings}.")
+
+    for document in source.all_vns():
+        expected = source.ratings.get(document.doc_id)
+        actual = target.ratings.get(document.doc_id)
+        if expected != actual:
+            errors.append(f"VN {document.doc_id} should have {expected} rating(s), found {actual}.")
+
+    return errors
+
+
+def main():
+    if len(sys.argv) != 3:
+        raise SystemExit(__doc__)
+
+    migrate(sys.argv[1], sys.argv[2])
+
+
+if __name__ == "__main__":
+    main()
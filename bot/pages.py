@@ -0,0 +1,123 @@
+import asyncio
+
+import discord
+
+from bot.helpers import ICON_URL
+from bot.sessions import SessionError
+
+FIELD_LIMIT = 1024
+EMBED_LIMIT = 6000
+FIELDS_PER_PAGE = 6
+
+PREVIOUS_PAGE = "◀️"
+NEXT_PAGE = "▶️"
+
+
+def chunk_lines(lines, limit=FIELD_LIMIT):
+    """Groups lines into chunks whose joined text fits in `limit` characters."""
+
+    chunks = []
+    current = []
+    size = 0
+
+    for line in lines:
+        line = line[:limit]
+
+        if current and size + len(line) + 1 > limit:
+            chunks.append(current)
+            current = []
+            size = 0
+
+        current.append(line)
+        size += len(line) + 1
+
+    if current:
+        chunks.append(current)
+
+    return chunks
+
+
+def build_pages(title, sections):
+    """Lays out (field name, lines) sections over as many embeds as needed.
+
+    Every field and every embed is kept within Discord's size limits, so the
+    pages can be sent without the risk of being rejected.
+    """
+
+    fields = []
+    for name, lines in sections:
+        fields += [(name, "\n".join(chunk)) for chunk in chunk_lines(lines) or [["------"]]]
+
+    # Room for the title, the author and the page number footer.
+    base_size = len(title) + 100
+
+    pages = [[]]
+    size = base_size
+
+    for name, value in fields:
+        field_size = len(name) + len(value)
+
+        if pages[-1] and (len(pages[-1]) >= FIELDS_PER_PAGE or size + field_size > EMBED_LIMIT):
+            pages.append([])
+            size = base_size
+
+        pages[-1].append((name, value))
+        size += field_size
+
+    embeds = []
+
+    for number, page in enumerate(pages, 1):
+        embed = discord.Embed(title=title)
+        embed.set_author(name="FVN Bot", icon_url=ICON_URL)
+
+        for name, value in page:
+            embed.add_field(name=name, value=value)
+
+        if len(pages) > 1:
+            embed.set_footer(text=f"Page {number} of {len(pages)}")
+
+        embeds.append(embed)
+
+    return embeds
+
+
+async def send_pages(bot, ctx, pages, timeout=120.0):
+    """Replies with the first page, the author can then flip through them with reactions."""
+
+    message = await ctx.reply(embed=pages[0])
+
+    if len(pages) > 1:
+        # Flipping pages happens in the background so the command finishes right away.
+        asyncio.ensure_future(_flip_pages(bot, ctx.author, message, pages, timeout))
+
+    return message
+
+
+async def _flip_pages(bot, author, message, pages, timeout):
+    for emoji in (PREVIOUS_PAGE, NEXT_PAGE):
+        await message.add_reaction(emoji)
+
+    page = 0
+
+    try:
+        async with bot.sessions.open_reactions(message, author, timeout) as session:
+            while True:
+                reaction, user = await session.wait()
+
+                if str(reaction.emoji) not in (PREVIOUS_PAGE, NEXT_PAGE):
+                    continue
+
+                page = (page + (1 if str(reaction.emoji) == NEXT_PAGE else -1)) % len(pages)
+                await message.edit(embed=pages[page])
+
+                try:
+                    await message.remove_reaction(reaction.emoji, user)
+                except discord.HTTPException:
+                    pass
+    except (asyncio.TimeoutError, SessionError):
+        pass
+
+    try:
+        await message.clear_reactions()
+    except discord.HTTPException:
+        pass
@@ -0,0 +1,140 @@
+import bisect
+import math
+from collections import defaultdict
+
+
+def count_ratings(documents):
+    """Counts the up and down votes of every VN in the given rating documents.
+
+    Returns a dict mapping each vn_id to a list of [upvotes, downvotes].
+    """
+
+    counts = defaultdict(lambda: [0, 0])
+
+    for document in documents:
+        if document["rating"] == 1:
+            counts[document["vn_id"]][0] += 1
+        if document["rating"] == -1:
+            counts[document["vn_id"]][1] += 1
+
+    return dict(counts)
+
+
+def wilson_lower_bound(up, down, z=1.96):
+    """The lower bound of the Wilson score interval for the share of upvotes, with 95% confidence by default.
+
+    A few votes can't rank a VN as high as many votes with the same share could.
+    """
+
+    total = up + down
+
+    if not total:
+        return 0.0
+
+    share = up / total
+    spread = z * math.sqrt((share * (1 - share) + z * z / (4 * total)) / total)
+
+    return (share + z * z / (2 * total) - spread) / (1 + z * z / total)
+
+
+class Ranking:
+    """The VNs with votes, kept sorted by the Wilson lower bound of their votes."""
+
+    def __init__(self):
+        self.entries = []
+        self.keys = {}
+
+    def clear(self):
+        self.entries.clear()
+        self.keys.clear()
+
+    def set(self, vn_id, up, down):
+        self.remove(vn_id)
+
+        if up or down:
+            key = (-wilson_lower_bound(up, down), vn_id)
+            bisect.insort(self.entries, key)
+            self.keys[vn_id] = key
+
+    def remove(self, vn_id):
+        key = self.keys.pop(vn_id, None)
+
+        if key is not None:
+            del self.entries[bisect.bisect_left(self.entries, key)]
+
+    def top(self, limit=10):
+        return [vn_id for _, vn_id in self.entries[:limit]]
+
+    def __iter__(self):
+        return (vn_id for _, vn_id in self.entries)
+
+
+class RatingAggregate:
+    """Keeps the up and down vote counts of every VN in memory.
+
+    It is built once from the rating table and then updated on every vote, so
+    showing the ratings of a VN doesn't need to scan the whole rating table.
+    The ranking of the VNs is kept up to date along with the counts.
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.ranking = Ranking()
+
+    def build(self, documents):
+        self.counts = count_ratings(documents)
+
+        self.ranking.clear()
+        for vn_id, (up, down) in self.counts.items():
+            self.ranking.set(vn_id, up, down)
+
+    def get(self, vn_id):
+        up, down = self.counts.get(vn_id, (0, 0))
+        return up, down
+
+    def add(self, vn_id, rating):
+        self._apply(vn_id, rating, 1)
+
+    def remove(self, vn_id, rating):
+        self._apply(vn_id, rating, -1)
+
+    def change(self, vn_id, old_rating, new_rating):
+        if old_rating is not None:
+            self.remove(vn_id, old_rating)
+        if new_rating is not None:
+            self.add(vn_id, new_rating)
+
+    def drop(self, vn_id):
+        self.counts.pop(vn_id, None)
+        self.ranking.remove(vn_id)
+
+    def drift(self, documents):
+        """Compares the in-memory counts against the given rating documents.
+
+        Returns a dict mapping each drifted vn_id to a tuple of
+        (cached counts, actual counts).
+        """
+
+        actual = count_ratings(documents)
+        drifted = {}
+
+        for vn_id in set(actual) | set(self.counts):
+            cached = self.get(vn_id)
+            expected = tuple(actual.get(vn_id, (0, 0)))
+            if cached != expected:
+                drifted[vn_id] = (cached, expected)
+
+        return drifted
+
+    def _apply(self, vn_id, rating, delta):
+        counts = self.counts.setdefault(vn_id, [0, 0])
+
+        if rating == 1:
+            counts[0] += delta
+        if rating == -1:
+            counts[1] += delta
+
+        if counts == [0, 0]:
+            del self.counts[vn_id]
+
+        self.ranking.set(vn_id, *counts)
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+
+class ReactionQueue:
+    """Processes reaction events on a bounded pool of workers.
+
+    Events are spread over the workers by key, so all the events of a message
+    are handled by the same worker, in the order they arrived. A worker takes
+    every event waiting in its queue, up to `batch_size`, and passes them to
+    `handler` as a single batch. `put` waits while the queue of its worker is
+    full, so a burst of reactions can't pile up unbounded work.
+    """
+
+    def __init__(self, handler, workers=4, queue_size=256, batch_size=50, metrics=None):
+        self.handler = handler
+        self.metrics = metrics
+        self.batch_size = batch_size
+        self.queues = [asyncio.Queue(maxsize=queue_size) for _ in range(workers)]
+        self.tasks = []
+
+        self.events = 0
+        self.batches = 0
+        self.largest_batch = 0
+        self.max_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_processing = 0.0
+        self.max_processing = 0.0
+
+    @property
+    def depth(self):
+        return sum(queue.qsize() for queue in self.queues)
+
+    async def put(self, key, event):
+        if not self.tasks:
+            self.tasks = [asyncio.ensure_future(self._work(queue)) for queue in self.queues]
+
+        await self.queues[hash(key) % len(self.queues)].put((time.monotonic(), event))
+        self.max_depth = max(self.max_depth, self.depth)
+
+    async def _work(self, queue):
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+
+            started = time.monotonic()
+
+            try:
+                await self.handler([event for _, event in batch])
+            except Exception:  # noqa
+                log.exception("Failed to process %s reaction event(s)", len(batch))
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+            processing = time.monotonic() - started
+            wait = max(started - enqueued for enqueued, _ in batch)
+
+            self.events += len(batch)
+            self.batches += 1
+            self.largest_batch = max(self.largest_batch, len(batch))
+            self.total_wait += sum(started - enqueued for enqueued, _ in batch)
+            self.max_wait = max(self.max_wait, wait)
+            self.total_processing += processing
+            self.max_processing = max(self.max_processing, processing)
+
+            if self.metrics is not None:
+                self.metrics.observe("fvnbot_reaction_batch_seconds", processing)
+                for enqueued, _ in batch:
+                    self.metrics.observe("fvnbot_reaction_seconds", started - enqueued + processing)
+
+    async def join(self):
+        """Waits until every event put so far has been handled."""
+
+        await asyncio.gather(*(queue.join() for queue in self.queues))
+
+    def stats(self):
+        if not self.batches:
+            return [f"Reactions queued: {self.depth}", "Reactions processed: none yet"]
+
+        return [
+            f"Reactions queued: {self.depth} (max {self.max_depth})",
+            f"Reactions processed: {self.events} in {self.batches} batch(es), largest {self.largest_batch}",
+            f"Reaction wait: avg {self.total_wait / self.events * 1000:.1f}ms max {self.max_wait * 1000:.1f}ms",
+            f"Reaction batches: avg {self.total_processing / self.batches * 1000:.1f}ms "
+            f"max {self.max_processing * 1000:.1f}ms",
+        ]
+
+    def cancel(self):
+        for task in self.tasks:
+            task.cancel()
@@ -0,0 +1,279 @@
+import asyncio
+import datetime
+import json
+import logging
+import os
+import time
+
+import discord
+
+from bot.helpers import LIST_REACTIONS, VisualNovel
+
+log = logging.getLogger(__name__)
+
+LIST_CHANNELS = ("vn_list", "vn_undetermined")
+
+# Discord only bulk deletes messages younger than two weeks, with some margin for long rebuilds.
+BULK_DELETE_AGE = datetime.timedelta(days=13, hours=12)
+BULK_DELETE_SIZE = 100
+
+PROGRESS_INTERVAL = 5.0
+
+
+class ListRebuild:
+    """Brings the VN list channels in line with the database.
+
+    `incremental` compares the messages actually in the list channels with the
+    message and channel stored for every VN. Up to date messages are kept,
+    outdated ones are edited, missing ones are reposted and anything else is
+    deleted.
+
+    `full` deletes everything and reposts every VN in order. Its progress is
+    saved to `state_path` after every post, so a full rebuild cut short by a
+    crash resumes where it stopped the next time it runs.
+
+    `unposted` only posts the VNs that have no list message yet, like the ones
+    of an import. Each post stores its message right away, so running it again
+    picks up where it stopped. `interval` spaces the posts out, leaving room
+    in the list channels' rate limits for the vote edits.
+
+    Reactions are added by separate workers while the next messages are sent.
+    discord.py waits out the rate limit of each route by itself, so this keeps
+    every route as busy as Discord allows.
+    """
+
+    def __init__(self, *, database, embeds, channel_list, state_path, progress=None, reactors=2, interval=0.0):
+        self.db = database
+        self.embeds = embeds
+        self.channel_list = channel_list
+        self.state_path = state_path
+        self.progress = progress
+        self.reactors = reactors
+        self.interval = interval
+
+        self.reaction_queue = asyncio.Queue()
+        self.last_report = 0.0
+
+        self.kept = 0
+        self.edited = 0
+        self.posted = 0
+        self.to_post = 0
+        self.deleted = 0
+
+    @property
+    def resumable(self):
+        return os.path.exists(self.state_path)
+
+    def describe(self):
+        return (
+            f"Kept {self.kept}, edited {self.edited}, posted {self.posted} of {self.to_post} "
+            f"and deleted {self.deleted} message(s). "
+            f"{self.reaction_queue.qsize()} message(s) waiting for their reactions."
+        )
+
+    async def incremental(self):
+        messages = await self._scan()
+        vns = await self._load_vns()
+
+        claimed = set()
+        reposts = []
+
+        for vn in vns:
+            message = messages.get(vn.message_id)
+
+            if message is None or message.channel.id != vn.list_channel(self.channel_list).id:
+                reposts.append(vn)
+                continue
+
+            claimed.add(message.id)
+            embed = vn.build_embed()
+
+            if not message.embeds or _embed_key(message.embeds[0]) != _embed_key(embed):
+                await message.edit(embed=embed)
+                self.edited += 1
+            else:
+                self.kept += 1
+
+            self._queue_reactions(message)
+            await self._report()
+
+        self.to_post = len(reposts)
+
+        await self._run(
+            [message for message_id, message in messages.items() if message_id not in claimed],
+            reposts,
+        )
+
+    async def full(self):
+        done = set(self._load_state())
+
+        messages = await self._scan()
+        vns = await self._load_vns()
+
+        # VNs posted before an interrupted rebuild stopped keep their message.
+        kept = {vn.message_id for vn in vns if vn.doc_id in done and vn.message_id in messages}
+        reposts = [vn for vn in vns if vn.message_id not in kept]
+
+        posted = [vn.doc_id for vn in vns if vn.message_id in kept]
+        self._save_state(posted)
+
+        for message_id in kept:
+            self._queue_reactions(messages[message_id])
+
+        self.kept = len(kept)
+        self.to_post = len(reposts)
+
+        def on_post(vn):
+            posted.append(vn.doc_id)
+            self._save_state(posted)
+
+        await self._run(
+            [message for message_id, message in messages.items() if message_id not in kept],
+            reposts,
+            on_post,
+        )
+
+        os.remove(self.state_path)
+
+    async def unposted(self):
+        vns = [vn for vn in await self._load_vns() if vn.message_id is None]
+        self.to_post = len(vns)
+
+        await self._run([], vns)
+
+    async def _run(self, stale, reposts, on_post=None):
+        reactors = [asyncio.ensure_future(self._react()) for _ in range(self.reactors)]
+
+        try:
+            await self._delete(stale)
+
+            for vn in reposts:
+                message = await vn.send_to_list(self.channel_list)
+                self._queue_reactions(message)
+                self.posted += 1
+
+                if on_post:
+                    on_post(vn)
+
+                await self._report()
+
+                if self.interval:
+                    await asyncio.sleep(self.interval)
+
+            await self.reaction_queue.join()
+        finally:
+            for reactor in reactors:
+                reactor.cancel()
+
+        await self._report(force=True)
+
+    async def _scan(self):
+        messages = {}
+
+        for key in LIST_CHANNELS:
+            async for message in self.channel_list[key].history(limit=None):
+                messages[message.id] = message
+
+        return messages
+
+    async def _load_vns(self):
+        vns = []
+
+        for document in await self.db.all_vns():
+            vn = VisualNovel(database=self.db, embeds=self.embeds)
+            await vn.load_from_db(doc_id=document.doc_id)
+            vns.append(vn)
+
+        return vns
+
+    async def _delete(self, messages):
+        bulk_after = datetime.datetime.utcnow() - BULK_DELETE_AGE
+
+        for key in LIST_CHANNELS:
+            channel = self.channel_list[key]
+            in_channel = [message for message in messages if message.channel.id == channel.id]
+            recent = [message for message in in_channel if message.created_at > bulk_after]
+
+            for start in range(0, len(recent), BULK_DELETE_SIZE):
+                chunk = recent[start:start + BULK_DELETE_SIZE]
+                await channel.delete_messages(chunk)
+                self.deleted += len(chunk)
+                await self._report()
+
+            for message in in_channel:
+                if message.created_at > bulk_after:
+                    continue
+
+                try:
+                    await message.delete()
+                except discord.NotFound:
+                    pass
+
+                self.deleted += 1
+                await self._report()
+
+    def _queue_reactions(self, message):
+        missing = [
+            emoji for emoji in LIST_REACTIONS
+            if not any(reaction.me and str(reaction.emoji) == emoji for reaction in message.reactions)
+        ]
+
+        if missing:
+            self.reaction_queue.put_nowait((message, missing))
+
+    async def _react(self):
+        while True:
+            message, emojis = await self.reaction_queue.get()
+
+            try:
+                for emoji in emojis:
+                    await message.add_reaction(emoji)
+            except discord.HTTPException:
+                log.warning("Failed to add the reactions to message %s", message.id)
+            finally:
+                self.reaction_queue.task_done()
+
+    async def _report(self, force=False):
+        if self.progress is None:
+            return
+
+        now = time.monotonic()
+        if not force and now - self.last_report < PROGRESS_INTERVAL:
+            return
+
+        self.last_report = now
+        await self.progress(self.describe())
+
+    def _load_state(self):
+        if not self.resumable:
+            return []
+
+        with open(self.state_path) as file:
+            posted = json.load(file)["posted"]
+
+        log.info("Resuming a full rebuild with %s VN(s) already posted", len(posted))
+        return posted
+
+    def _save_state(self, posted):
+        tmp_path = f"{self.state_path}.tmp"
+
+        with open(tmp_path, "w") as file:
+            json.dump({"posted": posted}, file)
+
+        os.replace(tmp_path, self.state_path)
+
+
+def _embed_key(embed):
+    """The parts of an embed the VN list sets, to tell whether a list message is outdated."""
+
+    data = embed.to_dict()
+
+    return (
+        data.get("title"),
+        data.get("url"),
+        data.get("color"),
+        [(field["name"], field["value"]) for field in data.get("fields", [])],
+        data.get("image", {}).get("url"),
+        data.get("author", {}).get("name"),
+        data.get("footer", {}).get("text"),
+    )
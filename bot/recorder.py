@@ -0,0 +1,60 @@
+import json
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+# Event types, the first element after the timestamp of every line.
+CHANNELS = "h"
+REACTION = "r"
+COMMAND = "c"
+LEAVE = "l"
+
+
+class EventRecorder:
+    """Appends the events that drive the bot to a JSON lines file, to be replayed by `benchmarks.replay`.
+
+    Every line is a compact array starting with the time the event arrived at:
+    - `[time, "h", bot_id, {channel name: channel id}]` on every login
+    - `[time, "r", channel_id, message_id, member_id, emoji]` for a reaction
+    - `[time, "c", channel_id, author_id, command, arguments]` for a command
+    - `[time, "l", member_id]` for a member leaving the server
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # Line buffered, so a crash loses at most the event being written.
+        self.file = open(path, "a", buffering=1, encoding="utf-8")
+        self.events = 0
+
+        log.info("Recording events to %s", path)
+
+    def channels(self, bot_id, channels):
+        self._write(CHANNELS, bot_id, {name: channel.id for name, channel in channels.items() if channel})
+
+    def reaction(self, payload):
+        self._write(REACTION, payload.channel_id, payload.message_id, payload.user_id, str(payload.emoji))
+
+    def command(self, ctx):
+        arguments = ctx.message.content[len(ctx.prefix) + len(ctx.invoked_with):].strip()
+        self._write(COMMAND, ctx.channel.id, ctx.author.id, ctx.command.qualified_name, arguments)
+
+    def leave(self, member_id):
+        self._write(LEAVE, member_id)
+
+    def close(self):
+        self.file.close()
+
+    def _write(self, *event):
+        self.file.write(json.dumps([round(time.time(), 3), *event], ensure_ascii=False, separators=(",", ":")) + "\n")
+        self.events += 1
+
+
+def read_events(path):
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # Only the last line can be cut short, by the bot stopping mid write.
+                log.warning("Skipping a malformed line in %s", path)
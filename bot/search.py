@@ -0,0 +1,152 @@
+import bisect
+from collections import Counter
+
+from bot.indexes import normalize
+
+# Below this trigram similarity a VN isn't worth suggesting.
+MIN_SIMILARITY = 0.2
+
+# How many of the VNs sharing the most trigrams with the query get scored.
+CANDIDATES = 20
+
+# Past this many VNs sharing a trigram with the query, no new ones are taken in.
+CANDIDATE_POOL = 100
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    """Finds VNs from a partial or misspelled name, abbreviation or author.
+
+    Terms starting with the query are found first through a sorted list of
+    every searchable term, so typing the start of a name is enough. Only if
+    there are none, the VNs sharing the most trigrams with the query are
+    scored by similarity. Trigrams are
+    counted from the rarest to the most common, and once enough VNs were seen
+    the common ones only count towards those, as they cost the most and tell
+    the least.
+    """
+
+    def __init__(self):
+        self.by_trigram = {}
+        self.sorted_terms = []
+        self.terms = {}
+        self.names = {}
+
+    def build(self, documents):
+        self.by_trigram.clear()
+        self.sorted_terms.clear()
+        self.terms.clear()
+        self.names.clear()
+
+        for document in documents:
+            self.add(document.doc_id, document)
+
+    def add(self, doc_id, fields):
+        terms = [fields.get("name"), *(fields.get("abbreviations") or []), *(fields.get("authors") or [])]
+        terms = [(term, trigrams(term)) for term in dict.fromkeys(normalize(term) for term in terms if term)]
+
+        self.terms[doc_id] = terms
+        self.names[doc_id] = fields.get("name")
+
+        for term, grams in terms:
+            bisect.insort(self.sorted_terms, (term, doc_id))
+            for gram in grams:
+                self.by_trigram.setdefault(gram, set()).add(doc_id)
+
+    def remove(self, doc_id):
+        terms = self.terms.pop(doc_id, None)
+
+        if terms is None:
+            return
+
+        del self.names[doc_id]
+
+        for term, grams in terms:
+            position = bisect.bisect_left(self.sorted_terms, (term, doc_id))
+            del self.sorted_terms[position]
+
+            for gram in grams:
+                postings = self.by_trigram.get(gram)
+                if postings is not None:
+                    postings.discard(doc_id)
+                    if not postings:
+                        del self.by_trigram[gram]
+
+    def update(self, doc_id, fields):
+        self.remove(doc_id)
+        self.add(doc_id, fields)
+
+    def search(self, query, limit=5):
+        """Returns up to `limit` (doc_id, name) pairs of the VNs closest to the query, best first."""
+
+        query = normalize(query)
+
+        if not query:
+            return []
+
+        grams = trigrams(query)
+        scores = self._prefix_scores(query)
+
+        if not scores:
+            scores.update(self._similarity_scores(query, grams))
+
+        ranked = sorted(scores, key=lambda doc_id: (-scores[doc_id], doc_id))
+
+        return [(doc_id, self.names[doc_id]) for doc_id in ranked[:limit]]
+
+    def _prefix_scores(self, query):
+        scores = {}
+        position = bisect.bisect_left(self.sorted_terms, (query,))
+
+        while position < len(self.sorted_terms) and len(scores) < CANDIDATES:
+            term, doc_id = self.sorted_terms[position]
+            if not term.startswith(query):
+                break
+
+            scores[doc_id] = max(scores.get(doc_id, 0.0), 2.0 + len(query) / len(term))
+            position += 1
+
+        return scores
+
+    def _similarity_scores(self, query, grams):
+        postings = sorted((self.by_trigram[gram] for gram in grams if gram in self.by_trigram), key=len)
+
+        shared = Counter()
+        pool = None
+
+        for doc_ids in postings:
+            if pool is None:
+                shared.update(doc_ids)
+                if len(shared) >= CANDIDATE_POOL:
+                    pool = set(shared)
+            else:
+                shared.update(pool.intersection(doc_ids))
+
+        scores = {}
+
+        for doc_id, _ in shared.most_common(CANDIDATES):
+            score = self._score(doc_id, query, grams)
+            if score >= MIN_SIMILARITY:
+                scores[doc_id] = score
+
+        return scores
+
+    def _score(self, doc_id, query, grams):
+        best = 0.0
+
+        for term, term_grams in self.terms[doc_id]:
+            if term.startswith(query):
+                score = 2.0 + len(query) / len(term)
+            elif query in term:
+                score = 1.0 + len(query) / len(term)
+            else:
+                shared = len(grams & term_grams)
+                score = shared / (len(grams) + len(term_grams) - shared)
+
+            best = max(best, score)
+
+        return best
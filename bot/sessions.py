@@ -0,0 +1,162 @@
+import asyncio
+
+# Typed as an answer, ends the conversation.
+CANCEL = "cancel"
+
+
+class SessionError(Exception):
+    """A conversation couldn't start or was cancelled, the message is meant for the user."""
+
+
+class Step:
+    """A question of a conversation.
+
+    `parse` turns the answer into a value, raising ValueError with a hint makes
+    the question be asked again.
+    """
+
+    def __init__(self, prompt, parse=None, reply=False):
+        self.prompt = prompt
+        self.parse = parse or (lambda message: message.content)
+        self.reply = reply
+
+
+class Session:
+    """A conversation with a member, receiving the messages or reactions routed to it by `Sessions`."""
+
+    def __init__(self, sessions, table, key, timeout, cancellable):
+        self.sessions = sessions
+        self.table = table
+        self.key = key
+        self.timeout = timeout
+        self.cancellable = cancellable
+        self.waiter = None
+        self.cancelled = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.sessions.close(self)
+
+    async def wait(self, timeout=None):
+        """Returns the next message sent, or (reaction, user) added, while waiting."""
+
+        if self.cancelled:
+            raise SessionError(self.cancelled)
+
+        self.waiter = asyncio.get_event_loop().create_future()
+
+        try:
+            return await asyncio.wait_for(self.waiter, timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self.sessions.timeouts += 1
+            raise asyncio.TimeoutError("You took long. Aborting.")
+        finally:
+            self.waiter = None
+
+    async def ask(self, ctx, step):
+        send = ctx.reply if step.reply else ctx.send
+        await send(step.prompt)
+
+        while True:
+            message = await self.wait()
+
+            try:
+                return step.parse(message)
+            except ValueError as e:
+                await ctx.send(f"{e} Try again, or type \"{CANCEL}\".")
+
+    async def run(self, ctx, steps):
+        """Asks every (field, step) in turn and returns the answers by field."""
+
+        return {field: await self.ask(ctx, step) for field, step in steps}
+
+    def feed(self, event):
+        if self.waiter is None or self.waiter.done():
+            return
+
+        if self.cancellable and event.content.strip().lower() == CANCEL:
+            self.cancel()
+        else:
+            self.waiter.set_result(event)
+
+    def cancel(self, reason="Cancelled."):
+        self.cancelled = reason
+
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_exception(SessionError(reason))
+
+
+class Sessions:
+    """Routes incoming messages and reactions to the conversations waiting for them.
+
+    Message conversations are keyed by (channel_id, author_id) and reaction ones
+    by (message_id, user_id), so each event is a dict lookup, where every
+    `wait_for` listener checks every event of the guild. A member has at most
+    one conversation per channel, and at most `limit` are open at once.
+    """
+
+    def __init__(self, limit=50):
+        self.limit = limit
+        self.by_channel = {}
+        self.by_message = {}
+
+        self.opened = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def __len__(self):
+        return len(self.by_channel) + len(self.by_message)
+
+    def open(self, channel, author, timeout=60.0):
+        """Starts a conversation with the messages `author` sends in `channel`, to be used with `async with`."""
+
+        return self._open(self.by_channel, (channel.id, author.id), timeout, True,
+                          "There's already a conversation going on with them in this channel.")
+
+    def open_reactions(self, message, user, timeout=60.0):
+        """Starts a conversation with the reactions `user` adds to `message`, waits return (reaction, user)."""
+
+        return self._open(self.by_message, (message.id, user.id), timeout, False,
+                          "There's already a conversation going on with them on this message.")
+
+    def _open(self, table, key, timeout, cancellable, busy):
+        if key in table:
+            self.rejected += 1
+            raise SessionError(busy)
+
+        if len(self) >= self.limit:
+            self.rejected += 1
+            raise SessionError("Too many conversations are going on, try again in a bit.")
+
+        session = table[key] = Session(self, table, key, timeout, cancellable)
+        self.opened += 1
+
+        return session
+
+    def close(self, session):
+        if session.table.get(session.key) is session:
+            del session.table[session.key]
+
+    def dispatch(self, message):
+        session = self.by_channel.get((message.channel.id, message.author.id))
+
+        if session is not None:
+            session.feed(message)
+
+    def dispatch_reaction(self, reaction, user):
+        session = self.by_message.get((reaction.message.id, user.id))
+
+        if session is not None:
+            session.feed((reaction, user))
+
+    def cancel_all(self, reason="The bot is shutting down."):
+        for session in [*self.by_channel.values(), *self.by_message.values()]:
+            session.cancel(reason)
+
+    def stats(self):
+        return [
+            f"Conversations open: {len(self)} (limit {self.limit})",
+            f"Conversations: {self.opened} opened, {self.rejected} rejected, {self.timeouts} timed out",
+        ]
@@ -0,0 +1,557 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from tinydb.table import Document
+
+from bot.indexes import normalize
+from bot.ratings import RatingAggregate
+from bot.search import SearchIndex
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS visual_novel (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    name_lower TEXT NOT NULL,
+    authors TEXT NOT NULL,
+    store TEXT,
+    image TEXT,
+    android_support INTEGER NOT NULL,
+    undetermined INTEGER NOT NULL,
+    message_id INTEGER,
+    channel_id INTEGER
+);
+
+CREATE INDEX IF NOT EXISTS visual_novel_message_id ON visual_novel (message_id);
+CREATE INDEX IF NOT EXISTS visual_novel_name_lower ON visual_novel (name_lower);
+
+CREATE TABLE IF NOT EXISTS abbreviation (
+    vn_id INTEGER NOT NULL REFERENCES visual_novel (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    abbreviation TEXT NOT NULL UNIQUE,
+    PRIMARY KEY (vn_id, position)
+);
+
+CREATE TABLE IF NOT EXISTS rating (
+    id INTEGER PRIMARY KEY,
+    member_id INTEGER NOT NULL,
+    vn_id INTEGER NOT NULL REFERENCES visual_novel (id) ON DELETE CASCADE,
+    rating INTEGER NOT NULL,
+    UNIQUE (member_id, vn_id)
+);
+
+CREATE INDEX IF NOT EXISTS rating_vn_id ON rating (vn_id);
+"""
+
+VN_COLUMNS = ("name", "authors", "store", "image", "android_support", "undetermined", "message_id", "channel_id")
+VN_PLACEHOLDERS = ", ".join("?" * len(VN_COLUMNS))
+
+# SQLite limits how many parameters a single statement can take.
+CHUNK_SIZE = 500
+
+
+def iter_vns(connection):
+    """Yields the (doc_id, fields) of every VN in order, without a query per VN or a list of them all."""
+
+    # Databases not upgraded yet, read by a backup, have no channel_id.
+    existing = {row[1] for row in connection.execute("PRAGMA table_info(visual_novel)")}
+    columns = [column for column in VN_COLUMNS if column in existing]
+
+    rows = connection.execute(f"SELECT id, {', '.join(columns)} FROM visual_novel ORDER BY id")
+
+    for doc_id, values, abbreviations in _with_abbreviations(connection, rows):
+        yield doc_id, _vn_fields(columns, values, abbreviations)
+
+
+def iter_vns_with_ratings(connection):
+    """Like `iter_vns`, along with the (up, down) vote counts of each VN, summed up by the same query."""
+
+    rows = connection.execute(
+        f"SELECT visual_novel.id, {', '.join(f'visual_novel.{column}' for column in VN_COLUMNS)}, "
+        "COALESCE(SUM(rating.rating = 1), 0), COALESCE(SUM(rating.rating = -1), 0) "
+        "FROM visual_novel LEFT JOIN rating ON rating.vn_id = visual_novel.id "
+        "GROUP BY visual_novel.id ORDER BY visual_novel.id"
+    )
+
+    for doc_id, values, abbreviations in _with_abbreviations(connection, rows):
+        *values, ratings_up, ratings_down = values
+        yield doc_id, _vn_fields(VN_COLUMNS, values, abbreviations), (ratings_up, ratings_down)
+
+
+def _with_abbreviations(connection, rows):
+    """Pairs rows sorted by VN id with their abbreviations, read from a second cursor sorted the same way."""
+
+    abbreviations = connection.execute("SELECT vn_id, abbreviation FROM abbreviation ORDER BY vn_id, position")
+    next_abbreviation = next(abbreviations, None)
+
+    for doc_id, *values in rows:
+        vn_abbreviations = []
+
+        # Abbreviations of VNs that aren't there anymore are skipped over.
+        while next_abbreviation is not None and next_abbreviation[0] <= doc_id:
+            if next_abbreviation[0] == doc_id:
+                vn_abbreviations.append(next_abbreviation[1])
+            next_abbreviation = next(abbreviations, None)
+
+        yield doc_id, values, vn_abbreviations
+
+
+def _vn_fields(columns, values, abbreviations):
+    fields = dict.fromkeys(VN_COLUMNS)
+    fields.update(zip(columns, values))
+    fields["authors"] = json.loads(fields["authors"])
+    fields["android_support"] = bool(fields["android_support"])
+    fields["undetermined"] = bool(fields["undetermined"])
+    fields["abbreviations"] = abbreviations
+
+    return fields
+
+
+def iter_ratings(connection):
+    """Yields every rating as (doc_id, member_id, vn_id, rating), in order."""
+
+    yield from connection.execute("SELECT id, member_id, vn_id, rating FROM rating ORDER BY id")
+
+
+class SQLiteDatabase:
+    """The bot's database stored in SQLite, with the same interface as `Database`.
+
+    Lookups go through SQLite's own indexes. Only the per-VN rating counts and
+    the fuzzy search index are kept in memory, as SQLite can't do either fast.
+
+    Every thread gets its own connection, so reads from several threads can run
+    alongside a write thanks to WAL mode.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.connections = []
+        self.connections_lock = threading.Lock()
+
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.executescript(SCHEMA)
+        self._upgrade_schema()
+
+        self.ratings = RatingAggregate()
+        self.search_index = SearchIndex()
+        # Bumped on every change to a VN, so embeds rendered from its older fields aren't reused.
+        self.revisions = {}
+        started = time.perf_counter()
+        self.build_indexes()
+        # Reading every table happens here too, stores parse the file on first access.
+        self.load_seconds = time.perf_counter() - started
+
+    @property
+    def connection(self):
+        connection = getattr(self.local, "connection", None)
+
+        if connection is None:
+            # Connections are only closed from another thread once their own thread is done with them.
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute("PRAGMA synchronous = NORMAL")
+            connection.execute("PRAGMA foreign_keys = ON")
+            self.local.connection = connection
+
+            with self.connections_lock:
+                self.connections.append(connection)
+
+        return connection
+
+    def _upgrade_schema(self):
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(visual_novel)")]
+
+        # Databases created before the list channel of a VN was stored.
+        if "channel_id" not in columns:
+            with self.connection:
+                self.connection.execute("ALTER TABLE visual_novel ADD COLUMN channel_id INTEGER")
+
+    def build_indexes(self):
+        self.ratings.build(self.all_ratings())
+        self.search_index.build(self.all_vns())
+
+    def flush(self):
+        pass
+
+    def stats(self):
+        vns, = self.connection.execute("SELECT COUNT(*) FROM visual_novel").fetchone()
+        ratings, = self.connection.execute("SELECT COUNT(*) FROM rating").fetchone()
+
+        wal_path = f"{self.path}-wal"
+        wal_size = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+
+        return [
+            f"SQLite database with {vns} VN(s) and {ratings} rating(s).",
+            f"Write-ahead log: {wal_size} bytes",
+        ]
+
+    def close(self):
+        with self.connections_lock:
+            for connection in self.connections:
+                connection.close()
+            self.connections.clear()
+
+        self.local = threading.local()
+
+    def all_vns(self):
+        return [Document(fields, doc_id) for doc_id, fields in iter_vns(self.connection)]
+
+    def iter_vns_with_ratings(self):
+        return iter_vns_with_ratings(self.connection)
+
+    def get_vn(self, doc_id):
+        row = self.connection.execute(
+            f"SELECT {', '.join(VN_COLUMNS)} FROM visual_novel WHERE id = ?", (doc_id,)
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        fields = dict(zip(VN_COLUMNS, row))
+        fields["authors"] = json.loads(fields["authors"])
+        fields["android_support"] = bool(fields["android_support"])
+        fields["undetermined"] = bool(fields["undetermined"])
+        fields["abbreviations"] = [
+            abbreviation for abbreviation, in self.connection.execute(
+                "SELECT abbreviation FROM abbreviation WHERE vn_id = ? ORDER BY position", (doc_id,)
+            )
+        ]
+
+        return Document(fields, doc_id)
+
+    def find_vn(self, *, message_id=None, name=None, abbreviations=None):
+        row = None
+
+        if message_id:
+            row = self.connection.execute(
+                "SELECT id FROM visual_novel WHERE message_id = ? ORDER BY id LIMIT 1", (message_id,)
+            ).fetchone()
+
+        if name:
+            row = self.connection.execute(
+                "SELECT id FROM visual_novel WHERE name_lower = ? ORDER BY id LIMIT 1", (normalize(name),)
+            ).fetchone()
+
+        if not row and abbreviations:
+            for abbreviation in abbreviations:
+                row = self.connection.execute(
+                    "SELECT vn_id FROM abbreviation WHERE abbreviation = ?", (normalize(abbreviation),)
+                ).fetchone()
+                if row:
+                    break
+
+        if not row:
+            return None
+
+        return self.get_vn(row[0])
+
+    def search_vns(self, query, limit=5):
+        return self.search_index.search(query, limit)
+
+    def insert_vn(self, fields):
+        self._check_abbreviations(fields.get("abbreviations"))
+
+        with self.connection:
+            cursor = self.connection.execute(
+                f"INSERT INTO visual_novel (name_lower, {', '.join(VN_COLUMNS)}) VALUES (?, {VN_PLACEHOLDERS})",
+                (normalize(fields["name"]), *self._vn_values(fields)),
+            )
+            doc_id = cursor.lastrowid
+            self._set_abbreviations(doc_id, fields.get("abbreviations"))
+
+        self.search_index.add(doc_id, fields)
+
+        return doc_id
+
+    def insert_vns(self, documents):
+        """Inserts many VNs in a single transaction and returns their doc_ids."""
+
+        for fields in documents:
+            self._check_abbreviations(fields.get("abbreviations"))
+
+        doc_ids = []
+
+        with self.connection:
+            for fields in documents:
+                cursor = self.connection.execute(
+                    f"INSERT INTO visual_novel (name_lower, {', '.join(VN_COLUMNS)}) VALUES (?, {VN_PLACEHOLDERS})",
+                    (normalize(fields["name"]), *self._vn_values(fields)),
+                )
+                doc_ids.append(cursor.lastrowid)
+                self._set_abbreviations(cursor.lastrowid, fields.get("abbreviations"))
+
+        for doc_id, fields in zip(doc_ids, documents):
+            self.search_index.add(doc_id, fields)
+
+        return doc_ids
+
+    def update_vn(self, doc_id, fields):
+        fields = dict(fields)
+        abbreviations = fields.pop("abbreviations", None)
+
+        if abbreviations is not None:
+            self._check_abbreviations(abbreviations, doc_id=doc_id)
+
+        columns = [column for column in VN_COLUMNS if column in fields]
+        values = self._vn_values(fields, columns)
+
+        if "name" in fields:
+            columns.append("name_lower")
+            values.append(normalize(fields["name"]))
+
+        with self.connection:
+            if columns:
+                self.connection.execute(
+                    f"UPDATE visual_novel SET {', '.join(f'{column} = ?' for column in columns)} WHERE id = ?",
+                    (*values, doc_id),
+                )
+
+            if abbreviations is not None:
+                self.connection.execute("DELETE FROM abbreviation WHERE vn_id = ?", (doc_id,))
+                self._set_abbreviations(doc_id, abbreviations)
+
+        self.search_index.update(doc_id, self.get_vn(doc_id))
+        self.revisions[doc_id] = self.revisions.get(doc_id, 0) + 1
+
+        return self.revisions[doc_id]
+
+    def remove_vn(self, doc_id):
+        with self.connection:
+            # Its abbreviations and ratings go with it through ON DELETE CASCADE.
+            self.connection.execute("DELETE FROM visual_novel WHERE id = ?", (doc_id,))
+
+        self.ratings.drop(doc_id)
+        self.search_index.remove(doc_id)
+        self.revisions.pop(doc_id, None)
+
+    def get_rating(self, member_id, vn_id):
+        row = self.connection.execute(
+            "SELECT rating FROM rating WHERE member_id = ? AND vn_id = ?", (member_id, vn_id)
+        ).fetchone()
+
+        return row[0] if row else None
+
+    def set_rating(self, member_id, vn_id, rating):
+        previous = self.get_rating(member_id, vn_id)
+
+        if previous == rating:
+            return
+
+        with self.connection:
+            self.connection.execute(
+                "INSERT INTO rating (member_id, vn_id, rating) VALUES (?, ?, ?) "
+                "ON CONFLICT (member_id, vn_id) DO UPDATE SET rating = excluded.rating",
+                (member_id, vn_id, rating),
+            )
+
+        self.ratings.change(vn_id, previous, rating)
+
+    def remove_rating(self, member_id, vn_id):
+        previous = self.get_rating(member_id, vn_id)
+
+        if previous is None:
+            return
+
+        with self.connection:
+            self.connection.execute("DELETE FROM rating WHERE member_id = ? AND vn_id = ?", (member_id, vn_id))
+
+        self.ratings.remove(vn_id, previous)
+
+    def apply_ratings(self, votes):
+        """Applies a batch of (member_id, vn_id, rating) votes in a single transaction.
+
+        A rating of None removes the vote, and the last vote of a member on a VN wins.
+        Votes on VNs that no longer exist are dropped.
+        """
+
+        final = {}
+        for member_id, vn_id, rating in votes:
+            final[(member_id, vn_id)] = rating
+
+        changes = []
+
+        with self.connection:
+            # The VN may have been removed while the batch waited for the writer.
+            existing = self._existing_vn_ids({vn_id for _, vn_id in final})
+
+            for (member_id, vn_id), rating in final.items():
+                if vn_id not in existing:
+                    continue
+
+                previous = self.get_rating(member_id, vn_id)
+
+                if previous == rating:
+                    continue
+
+                if rating is None:
+                    self.connection.execute(
+                        "DELETE FROM rating WHERE member_id = ? AND vn_id = ?", (member_id, vn_id)
+                    )
+                else:
+                    self.connection.execute(
+                        "INSERT INTO rating (member_id, vn_id, rating) VALUES (?, ?, ?) "
+                        "ON CONFLICT (member_id, vn_id) DO UPDATE SET rating = excluded.rating",
+                        (member_id, vn_id, rating),
+                    )
+
+                changes.append((vn_id, previous, rating))
+
+        for vn_id, previous, rating in changes:
+            self.ratings.change(vn_id, previous, rating)
+
+    def _existing_vn_ids(self, vn_ids):
+        vn_ids = list(vn_ids)
+        existing = set()
+
+        for start in range(0, len(vn_ids), CHUNK_SIZE):
+            chunk = vn_ids[start:start + CHUNK_SIZE]
+            placeholders = ", ".join("?" * len(chunk))
+
+            existing.update(
+                vn_id for vn_id, in self.connection.execute(f"SELECT id FROM visual_novel WHERE id IN ({placeholders})", chunk)
+            )
+
+        return existing
+
+    def all_ratings(self):
+        return [
+            Document({"member_id": member_id, "vn_id": vn_id, "rating": rating}, doc_id)
+            for doc_id, member_id, vn_id, rating in iter_ratings(self.connection)
+        ]
+
+    def recount_ratings(self):
+        """Checks the cached rating counts against the rating table, rebuilding them if they drifted.
+
+        Returns the drift like RatingAggregate.drift. Run as a single write, so no
+        vote can land between reading the table and rebuilding from it.
+        """
+
+        documents = self.all_ratings()
+        drifted = self.ratings.drift(documents)
+
+        if drifted:
+            self.ratings.build(documents)
+
+        return drifted
+
+    def member_ratings(self, member_id):
+        return dict(self.connection.execute("SELECT vn_id, rating FROM rating WHERE member_id = ?", (member_id,)))
+
+    def member_votes(self, member_id):
+        """Returns the (VN name, rating) pairs of every vote of the member, sorted by name."""
+
+        return self.connection.execute(
+            "SELECT visual_novel.name, rating.rating FROM rating "
+            "JOIN visual_novel ON visual_novel.id = rating.vn_id "
+            "WHERE rating.member_id = ? ORDER BY visual_novel.name_lower",
+            (member_id,),
+        ).fetchall()
+
+    def top_vns(self, limit=10):
+        """Returns the (doc_id, name, upvotes, downvotes) of the best ranked VNs."""
+
+        vn_ids = self.ratings.ranking.top(limit)
+        placeholders = ", ".join("?" * len(vn_ids))
+        names = dict(self.connection.execute(f"SELECT id, name FROM visual_novel WHERE id IN ({placeholders})", vn_ids))
+
+        return [(vn_id, names[vn_id], *self.ratings.get(vn_id)) for vn_id in vn_ids]
+
+    def rating_members(self):
+        return [member_id for member_id, in self.connection.execute("SELECT DISTINCT member_id FROM rating")]
+
+    def remove_member_ratings(self, member_ids):
+        """Removes every rating of the given members and returns the vn_id of each removed rating."""
+
+        member_ids = list(member_ids)
+        removed = []
+
+        with self.connection:
+            for start in range(0, len(member_ids), CHUNK_SIZE):
+                chunk = member_ids[start:start + CHUNK_SIZE]
+                placeholders = ", ".join("?" * len(chunk))
+
+                removed += self.connection.execute(
+                    f"SELECT vn_id, rating FROM rating WHERE member_id IN ({placeholders})", chunk
+                ).fetchall()
+                self.connection.execute(f"DELETE FROM rating WHERE member_id IN ({placeholders})", chunk)
+
+        for vn_id, rating in removed:
+            self.ratings.remove(vn_id, rating)
+
+        return [vn_id for vn_id, _ in removed]
+
+    def import_documents(self, vns, ratings):
+        """Copies VN and rating documents over as they are, keeping their doc_ids.
+
+        Everything is written in a single transaction. Returns the lists of
+        (vn doc_id, abbreviation) pairs and rating doc_ids that were skipped, for
+        duplicate abbreviations and ratings of VNs that don't exist anymore.
+        """
+
+        skipped_abbreviations = []
+        skipped_ratings = []
+
+        with self.connection:
+            for document in vns:
+                self.connection.execute(
+                    f"INSERT INTO visual_novel (id, name_lower, {', '.join(VN_COLUMNS)}) VALUES (?, ?, {VN_PLACEHOLDERS})",
+                    (document.doc_id, normalize(document["name"]), *self._vn_values(document)),
+                )
+
+                for position, abbreviation in enumerate(document.get("abbreviations") or []):
+                    cursor = self.connection.execute(
+                        "INSERT OR IGNORE INTO abbreviation (vn_id, position, abbreviation) VALUES (?, ?, ?)",
+                        (document.doc_id, position, normalize(abbreviation)),
+                    )
+                    if not cursor.rowcount:
+                        skipped_abbreviations.append((document.doc_id, abbreviation))
+
+            vn_ids = {document.doc_id for document in vns}
+
+            for document in ratings:
+                if document["vn_id"] not in vn_ids:
+                    skipped_ratings.append(document.doc_id)
+                    continue
+
+                self.connection.execute(
+                    "INSERT INTO rating (id, member_id, vn_id, rating) VALUES (?, ?, ?, ?)",
+                    (document.doc_id, document["member_id"], document["vn_id"], document["rating"]),
+                )
+
+        self.build_indexes()
+
+        return skipped_abbreviations, skipped_ratings
+
+    def _check_abbreviations(self, abbreviations, doc_id=None):
+        """Raises ValueError if any of the abbreviations already belongs to another VN."""
+
+        for abbreviation in abbreviations or []:
+            row = self.connection.execute(
+                "SELECT vn_id FROM abbreviation WHERE abbreviation = ?", (normalize(abbreviation),)
+            ).fetchone()
+            if row and row[0] != doc_id:
+                raise ValueError(f"The abbreviation \"{abbreviation}\" is already used by another VN.")
+
+    def _set_abbreviations(self, doc_id, abbreviations):
+        abbreviations = dict.fromkeys(normalize(abbreviation) for abbreviation in abbreviations or [])
+
+        self.connection.executemany(
+            "INSERT INTO abbreviation (vn_id, position, abbreviation) VALUES (?, ?, ?)",
+            [(doc_id, position, abbreviation) for position, abbreviation in enumerate(abbreviations)],
+        )
+
+    @staticmethod
+    def _vn_values(fields, columns=VN_COLUMNS):
+        values = []
+
+        for column in columns:
+            value = fields.get(column)
+            if column == "authors":
+                value = json.dumps(value or [])
+            if column in ("android_support", "undetermined"):
+                value = bool(value)
+            values.append(value)
+
+        return values
@@ -0,0 +1,161 @@
+import gzip
+import io
+import json
+import logging
+import os
+import time
+
+from tinydb.storages import Storage
+
+log = logging.getLogger(__name__)
+
+# Level 6 compresses JSON about as well as 9, for well under half the time.
+COMPRESS_LEVEL = 6
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+# Documents per line of the compact format, enough for the json module to spend its time in C.
+LINE_DOCUMENTS = 1000
+
+
+class WriteBehindStorage(Storage):
+    """A JSON storage that keeps the database in memory and writes it to disk in batches.
+
+    Writes only mark the data as dirty. The file is rewritten when `flush` is
+    called, either by the owner on a timer or here once `flush_writes` writes
+    are pending. Every flush goes to a temporary file first and is then renamed
+    over the database, so the file on disk is never half-written.
+    """
+
+    def __init__(self, path, encoding=None, flush_writes=None, **kwargs):
+        super().__init__()
+
+        self.path = path
+        self.encoding = encoding
+        self.flush_writes = flush_writes
+        self.kwargs = kwargs
+
+        self.memory = self._load()
+
+        self.pending_writes = 0
+        self.flush_count = 0
+        self.last_flush_duration = 0.0
+        self.max_flush_duration = 0.0
+
+    def read(self):
+        return self.memory
+
+    def write(self, data):
+        self.memory = data
+        self.pending_writes += 1
+
+        if self.flush_writes and self.pending_writes >= self.flush_writes:
+            self.flush()
+
+    def flush(self):
+        if not self.pending_writes:
+            return
+
+        start = time.perf_counter()
+
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "wb") as f:
+            self._dump(f)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(temp_path, self.path)
+
+        duration = time.perf_counter() - start
+        log.debug("Flushed %s pending write(s) to %s in %.3fs", self.pending_writes, self.path, duration)
+
+        self.pending_writes = 0
+        self.flush_count += 1
+        self.last_flush_duration = duration
+        self.max_flush_duration = max(self.max_flush_duration, duration)
+
+    def close(self):
+        self.flush()
+
+    def _dump(self, f):
+        text = io.TextIOWrapper(f, encoding=self.encoding)
+        json.dump(self.memory, text, **self.kwargs)
+        text.flush()
+        text.detach()
+
+    def _load(self):
+        if not os.path.exists(self.path) or not os.path.getsize(self.path):
+            return None
+
+        with open(self.path, encoding=self.encoding) as f:
+            return json.load(f)
+
+
+class CompactStorage(WriteBehindStorage):
+    """Keeps the database as gzip compressed JSON lines instead of indented JSON.
+
+    Every line holds up to LINE_DOCUMENTS documents of a table, as
+    `[table, {doc_id: document}]`, so the file is a fraction of the size and
+    quicker to write and load. Like its parent it
+    serves reads from memory, writes are flushed right away unless
+    `flush_writes` or a flush timer batch them.
+    """
+
+    def __init__(self, path, encoding=None, flush_writes=1, **kwargs):
+        # The indentation and sorting options of the JSON file don't apply.
+        super().__init__(path, flush_writes=flush_writes)
+
+    def _dump(self, f):
+        with gzip.GzipFile(fileobj=f, mode="wb", compresslevel=COMPRESS_LEVEL, mtime=0) as compressed:
+            write_tables(compressed, self.memory)
+
+    def _load(self):
+        if not os.path.exists(self.path) or not os.path.getsize(self.path):
+            return None
+
+        # Switching from the JSON format, the file is converted on the first flush.
+        if not is_compact(self.path):
+            return super()._load()
+
+        return read_tables(self.path)
+
+
+def write_tables(f, tables):
+    """Writes {table: {doc_id: document}} to a binary file as JSON lines of `[table, {doc_id: document}]`."""
+
+    text = io.TextIOWrapper(f, encoding="utf-8")
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+    for table, documents in tables.items():
+        items = list(documents.items())
+
+        # An empty table still gets a line, so it's kept.
+        for start in range(0, max(len(items), 1), LINE_DOCUMENTS):
+            text.write(encoder.encode([table, dict(items[start:start + LINE_DOCUMENTS])]))
+            text.write("\n")
+
+    text.flush()
+    text.detach()
+
+
+def read_lines(path):
+    """Yields the (table, {doc_id: document}) lines of a compact file, a removed document is None."""
+
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            table, documents = json.loads(line)
+            yield table, documents
+
+
+def read_tables(path):
+    tables = {}
+
+    for table, documents in read_lines(path):
+        tables.setdefault(table, {}).update(documents)
+
+    return tables
+
+
+def is_compact(path):
+    with open(path, "rb") as f:
+        return f.read(2) == GZIP_MAGIC
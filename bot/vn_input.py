@@ -1,75 +1,67 @@
-import asyncio
+from bot.sessions import Step
 
 
-async def input_name(bot, ctx, check):
-    await ctx.send("What's the name of the VN?")
+def _abbreviations(message):
+    if message.content.strip().lower() == "none":
+        return []
 
-    try:
-        name = await bot.wait_for('message', timeout=60.0, check=check)
-        return name.content
-    except asyncio.TimeoutError:
-        raise asyncio.TimeoutError("You took long. Aborting.")
+    return [abbreviation.lower() for abbreviation in message.content.split()]
 
 
-async def input_abbreviations(bot, ctx, check):
-    await ctx.send("What are the abbreviations that this VN will be known for? Enter them separated by spaces. If there are no abbreviations, type \"none\".")
+def _authors(message):
+    return [author.strip() for author in message.content.split(",")]
 
-    try:
-        abbreviations = await bot.wait_for('message', timeout=60.0, check=check)
 
-        if abbreviations.content.strip().lower() == "none":
-            return []
+def _image(message):
+    if not message.attachments:
+        raise ValueError("That message has no image.")
 
-        return [abbreviation.lower() for abbreviation in abbreviations.content.split()]
-    except asyncio.TimeoutError:
-        raise asyncio.TimeoutError("You took long. Aborting.")
+    return message.attachments[0].url
 
 
-async def input_authors(bot, ctx, check):
-    await ctx.send("Who are the owners of this VN? Enter their names separated by commas.")
+def _yes_no(message):
+    return "yes" in message.content
 
-    try:
-        authors = await bot.wait_for('message', timeout=60.0, check=check)
-        return [author.strip() for author in authors.content.split(",")]
-    except asyncio.TimeoutError:
-        raise asyncio.TimeoutError("You took long. Aborting.")
 
+def choice(count):
+    """Parses a number from 1 to `count`."""
 
-async def input_store(bot, ctx, check):
-    await ctx.send("What is the store link? (itch.io, Steam, etc)")
+    def parse(message):
+        text = message.content.strip()
 
-    try:
-        store = await bot.wait_for('message', timeout=60.0, check=check)
-        return store.content
-    except asyncio.TimeoutError:
-        raise asyncio.TimeoutError("You took long. Aborting.")
+        if not text.isdigit() or not 1 <= int(text) <= count:
+            raise ValueError(f"Input a number from 1 to {count}.")
 
+        return int(text)
 
-async def input_image(bot, ctx, check):
-    await ctx.send("Please upload an image to use as a preview")
+    return parse
 
-    try:
-        image = await bot.wait_for('message', timeout=60.0, check=check)
-        return image.attachments[0].url
-    except asyncio.TimeoutError:
-        raise asyncio.TimeoutError("You took long. Aborting.")
 
+NAME = Step("What's the name of the VN?")
+ABBREVIATIONS = Step(
+    "What are the abbreviations that this VN will be known for? Enter them separated by spaces. "
+    "If there are no abbreviations, type \"none\".",
+    _abbreviations,
+)
+AUTHORS = Step("Who are the owners of this VN? Enter their names separated by commas.", _authors)
+STORE = Step("What is the store link? (itch.io, Steam, etc)")
+IMAGE = Step("Please upload an image to use as a preview", _image)
+ANDROID_SUPPORT = Step("Does this VN work on Android phones? Type yes or no.", _yes_no)
+UNDETERMINED = Step("Is it an undetermined VN? Type yes or no.", _yes_no)
 
-async def input_android_support(bot, ctx, check):
-    await ctx.send("Does this VN work on Android phones? Type yes or no.")
+# Every field of a VN as asked by `add`, in order. `edit` offers them by their position.
+VN_STEPS = [
+    ("name", NAME),
+    ("abbreviations", ABBREVIATIONS),
+    ("authors", AUTHORS),
+    ("store", STORE),
+    ("image", IMAGE),
+    ("android_support", ANDROID_SUPPORT),
+    ("undetermined", UNDETERMINED),
+]
 
-    try:
-        android = await bot.wait_for('message', timeout=60.0, check=check)
-        return "yes" in android.content
-    except asyncio.TimeoutError:
-        raise asyncio.TimeoutError("You took long. Aborting.")
+EDIT_VN = Step("What VN do you want to edit? Enter a name or an abbreviation.", reply=True)
 
-
-async def input_undetermined(bot, ctx, check):
-    await ctx.send("Is it an undetermined VN? Type yes or no.")
-
-    try:
-        undetermined = await bot.wait_for('message', timeout=60.0, check=check)
-        return "yes" in undetermined.content
-    except asyncio.TimeoutError:
-        raise asyncio.TimeoutError("You took long. Aborting.")
+UPDATE_VN = Step("What VN do you want to publish an update? Enter a name or an abbreviation.", reply=True)
+UPDATE_URL = Step("What is the URL to the update?", reply=True)
+UPDATE_TITLE = Step("What is the title of the update?", reply=True)
@@ -1,8 +1,25 @@
 #!/bin/bash
 
+# Only needed with FVNBOT_DATABASE_BACKEND=sqlite: the name of the database file inside the volume.
+SQLITE_DATABASE=""
+
+# For incremental backups: the name of the bot's container and of the database file inside the volume.
+CONTAINER=""
+DATABASE=""
+
 cd /var/lib/docker/volumes/fvnbot-database/_data
 
-git add .
+if [ -n "$CONTAINER" ]; then
+    # Only what changed since the last backup is written, with a full snapshot once a day.
+    docker exec "$CONTAINER" python3 -m bot.backup export "/app/database/$DATABASE" /app/database/backups
+    git add backups
+elif [ -n "$SQLITE_DATABASE" ]; then
+    # An online backup is consistent even while the bot is writing, unlike copying the live file.
+    sqlite3 "$SQLITE_DATABASE" ".backup 'backup-$SQLITE_DATABASE'"
+    git add "backup-$SQLITE_DATABASE"
+else
+    git add .
+fi
 
 git commit -m "backup `date -Is`"
 
@@ -0,0 +1,56 @@
+"""Slow database writes must not stall the event loop, and index lookups must stay cheap.
+
+The limits are loose enough for a busy CI machine, but a write running on the
+event loop again, or a lookup scanning the tables, goes well past them.
+"""
+import asyncio
+import time
+
+from tinydb.storages import MemoryStorage
+
+from benchmarks import event_loop_latency
+from benchmarks.event_loop_latency import SlowStorage, open_database, run
+from bot.async_database import AsyncDatabase
+from bot.database import Database
+
+WRITE_DELAY = 0.1
+
+# A heartbeat tick may be late by a fraction of a single write, never by whole writes.
+MAX_TICK_DELAY = WRITE_DELAY / 2
+# A lookup may wait for the write in progress, not for the burst.
+MAX_LOOKUP_DURING_WRITES = WRITE_DELAY * 3
+
+LOOKUP_VNS = 10000
+MAX_LOOKUP_SECONDS = 0.001
+
+
+def test_writes_do_not_block_the_event_loop(monkeypatch):
+    monkeypatch.setattr(SlowStorage, "delay", WRITE_DELAY)
+    monkeypatch.setattr(event_loop_latency, "VOTES", 10)
+
+    database, vn_id = open_database()
+    async_database = AsyncDatabase(database)
+
+    try:
+        _, tick, lookup = asyncio.run(run(async_database, vn_id))
+    finally:
+        async_database.close()
+
+    assert tick < MAX_TICK_DELAY
+    assert lookup < MAX_LOOKUP_DURING_WRITES
+
+
+def test_index_lookups_do_not_grow_with_the_tables():
+    database = Database(None, storage=MemoryStorage)
+    for number in range(1, LOOKUP_VNS + 1):
+        database.insert_vn({"name": f"Visual Novel {number}", "abbreviations": [f"vn{number}"], "message_id": number})
+
+    for lookup in (
+        lambda number: database.find_vn(name=f"visual novel {number}"),
+        lambda number: database.find_vn(abbreviations=[f"vn{number}"]),
+        lambda number: database.find_vn(message_id=number),
+    ):
+        start = time.perf_counter()
+        for number in range(1, 1001):
+            assert lookup(number).doc_id == number
+        assert (time.perf_counter() - start) / 1000 < MAX_LOOKUP_SECONDS
@@ -0,0 +1,52 @@
+"""Votes must not outlive a VN removed while they wait to be written."""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.fake_discord import FakeAPI, FakeBot, FakeUser
+from benchmarks.suite import synthetic_documents, write_database
+from bot.cogs.visual_novels import VisualNovels
+from bot.metrics import Metrics
+
+API_LATENCY = 0.05
+
+
+async def vote_while_removed(backend, path):
+    vn_documents, rating_documents = synthetic_documents(2, 0)
+    write_database(path, backend, vn_documents, rating_documents)
+
+    bot = FakeBot(api=FakeAPI(latency=API_LATENCY), database_path=path, metrics=Metrics(), backend=backend)
+    cog = VisualNovels(bot)
+    await cog.warmed_up.wait()
+
+    channel = bot.channels["vn_list"]
+    for document in vn_documents.values():
+        channel.add_message(message_id=document["message_id"])
+
+    member = FakeUser()
+    events = [
+        (channel, vn_documents[doc_id]["message_id"], member, SimpleNamespace(name="👍"))
+        for doc_id in vn_documents
+    ]
+
+    try:
+        processing = asyncio.ensure_future(cog.process_reactions(events))
+        # The first VN is loaded by now, the batch still waits on the second reaction's removal.
+        await asyncio.sleep(API_LATENCY * 1.4)
+        await cog.db.remove_vn(1)
+        await processing
+
+        ratings = [(rating["vn_id"], rating["rating"]) for rating in await cog.db.all_ratings()]
+        return ratings, cog.db.ratings.get(1), cog.db.ratings.get(2)
+    finally:
+        cog.cog_unload()
+
+
+@pytest.mark.parametrize("backend", ["tinydb", "sqlite"])
+def test_votes_on_a_removed_vn_are_dropped(backend, tmp_path):
+    ratings, removed, kept = asyncio.run(vote_while_removed(backend, str(tmp_path / "database")))
+
+    assert ratings == [(2, 1)]
+    assert removed == (0, 0)
+    assert kept == (1, 0)